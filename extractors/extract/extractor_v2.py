@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-import re, os, sys, csv, json, argparse, html
+import re, os, sys, csv, json, argparse, html, functools, hashlib, heapq, tempfile, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 COURSE_CODE_RE = re.compile(r"\b([A-Z]{2,5})(?:_([A-Z]))?\s*[- ]?\s*(\d{3}[A-Z]?)\b")
 HTML_TAG_RE = re.compile(r"<[^>]+>")
@@ -19,6 +20,31 @@ CREDIT_EXCL_PAT = re.compile(
     r"cannot be taken for credit with)",
     re.I
 )
+# standing / GPA / percentage / credit-count requirements, as one alternation so a sentence is
+# scanned once; the group that matched says which constraint it is (see scan_constraints)
+YEAR_WORDS = {"first": 1, "second": 2, "third": 3, "fourth": 4, "fifth": 5, "1st": 1, "2nd": 2, "3rd": 3, "4th": 4, "5th": 5}
+CONSTRAINT_RE = re.compile(
+    r"(?P<year>\b(?:(?P<yw>first|second|third|fourth|fifth|1st|2nd|3rd|4th|5th)[\s-]+year|year\s+(?P<yn>[1-5]))\s+standing"
+    r"|\bstanding\s+in\s+year\s+(?P<yn2>[1-5]))(?:\s+or\s+(?:higher|above|beyond))?"
+    r"|(?P<gpa>\bGPA\s+of\s+(?:at\s+least\s+)?(?P<gv>\d(?:\.\d{1,2})?)|\b(?P<gv2>\d\.\d{1,2})\s+(?:cumulative\s+|overall\s+|sessional\s+)?GPA)"
+    r"(?:\s+or\s+(?:higher|above|better))?"
+    r"|(?P<pct>(?P<pv>\d{1,3})\s*%(?:\s+or\s+(?:higher|above|better))?)"
+    r"|(?P<cred>\b(?:(?:at\s+least|a\s+minimum\s+of|minimum\s+of|completion\s+of)\s+)?(?P<cv>\d{1,3})\s+credits"
+    r"(?:\s+of\s+(?P<cl>[1-5])00[\s-]+level(?:\s+or\s+(?:higher|above))?(?:\s+(?P<cs>[A-Z]{2,5})\b(?!\s*\d))?"
+    r"|\s+of\s+(?P<cs2>[A-Z]{2,5})\b(?!\s*\d)(?:\s+(?:courses\s+)?at\s+the\s+(?P<cl2>[1-5])00[\s-]+level)?)?"
+    r"(?:\s+or\s+(?:higher|above|more))?)",
+    re.I
+)
+CLAUSE_END = re.compile(r"[;.]")
+# a bare N% is only a grade floor with a grade word shortly before it in the clause
+# ("a minimum grade of 68%") or the course it applies to right after it ("70% in MATH 100",
+# "75% in Pre-calculus 12"); "100% online" and "50% in person" are neither. A course that is not a
+# catalogue code (high-school MATH 12) is kept as course_text so the alternative is not lost.
+PCT_CUE_BEFORE = re.compile(r"\b(?:scores?|grades?|marks?|average|minimum)\b[^;.%]{0,30}$", re.I)
+PCT_IN_AFTER = re.compile(r"\s*(?:in|on)\b", re.I)
+PCT_COURSE_TEXT = re.compile(r"\s*(?:in|on)\s+(?:(?:each|all|one)\s+of\s+|both\s+)?"
+                             r"([A-Z][A-Za-z&-]*(?:\s+[A-Z][A-Za-z&-]*){0,3}\s+\d{1,3}[A-Z]?)\b")
+NEXT_PCT = re.compile(r"\d{1,3}\s*%")
 
 def strip_html(s):
     s = HTML_TAG_RE.sub(" ", str(s))
@@ -94,12 +120,44 @@ def sentence_kind(text):
     if CORESSION:...
     return "CO_REQ" if CORESSION else "REQ"
 
+def scan_constraints(t):
+    # -> (constraint nodes, t with the matched phrases blanked out at the same offsets, so
+    #     "or higher" / "at least" inside them does not read as and/or logic)
+    nodes, masked = [], t
+    for m in CONSTRAINT_RE.finditer(t):
+        if m.group("year"):
+            yw = m.group("yw")
+            node = {"constraint": "YEAR_STANDING", "year_min": YEAR_WORDS[yw.lower()] if yw else int(m.group("yn") or m.group("yn2"))}
+        elif m.group("gpa"):
+            node = {"constraint": "GPA_MIN", "value": float(m.group("gv") or m.group("gv2"))}
+        elif m.group("pct"):
+            # the courses the percentage applies to follow it, up to the clause end or the next percentage
+            end = CLAUSE_END.search(t, m.end())
+            after = t[m.end():end.start() if end else len(t)]
+            nxt = NEXT_PCT.search(after)
+            if nxt: after = after[:nxt.start()]
+            courses = extract_codes(after) if PCT_IN_AFTER.match(after) else []
+            text_m = None if courses else PCT_COURSE_TEXT.match(after)
+            if not courses and not text_m and not PCT_CUE_BEFORE.search(t[:m.start()]): continue
+            node = {"constraint": "PERCENT_MIN", "value": int(m.group("pv"))}
+            if courses: node["courses"] = courses
+            elif text_m: node["course_text"] = text_m.group(1)
+        else:
+            node = {"constraint": "CREDITS_AT_LEAST", "credits_min": int(m.group("cv"))}
+            subj, level = m.group("cs") or m.group("cs2"), m.group("cl") or m.group("cl2")
+            if subj and subj.isupper(): node["subject"] = subj
+            if level: node["level_min"] = int(level) * 100
+        if node not in nodes: nodes.append(node)
+        masked = masked[:m.start()] + " " * (m.end() - m.start()) + masked[m.end():]
+    return nodes, masked
+
 def parse_sentence_tree(sent):
     t = sent.strip()
     codes = extract_codes(t)
-    if not codes: return None
+    constraints, t_logic = scan_constraints(t)
+    if not codes and not constraints: return None
     is_coreq = bool(COREQ_CUE.search(t))
-    one_pos = t.lower().find("one of")
+    one_pos = t_logic.lower().find("one of")
     groups = []
     leading_codes = []
     if one_pos >= 0:
@@ -111,8 +169,15 @@ def parse_sentence_tree(sent):
         if post_codes:
             groups.append({"op":"OR","min":1,"children":[{"type":"course","id":c} for c in post_codes]})
     else:
-        if " or " in t.lower() and " and " not in t.lower():
-            groups.append({"op":"OR","min":1,"children":[{"type":"course","id":c} for c in codes]})
+        if " or " in t_logic.lower() and " and " not in t_logic.lower():
+            # "CPSC 210 or third-year standing": the constraints are alternatives too
+            alts = [{"type":"course","id":c} for c in codes] + constraints
+            if len(alts) > 1:
+                groups.append({"op":"OR","min":1,"children":alts})
+                constraints = []
+            else:
+                # one alternative left (the others were not requirements): no OR around it
+                leading_codes = codes[:]
         else:
             leading_codes = codes[:]
     and_children = [{"type":"course","id":c} for c in leading_codes]
@@ -120,7 +185,10 @@ def parse_sentence_tree(sent):
     children.extend(and_children)
     for g in groups:
         children.append(g)
+    children.extend(constraints)
     if not children: return None
+    if len(children) == 1 and "constraint" in children[0]:
+        return children[0]
     if len(children) == 1 and isinstance(children[0],dict) and ("type" in children[0] or "op" in children[0]):
         node = children[0]
         if "op" in node and is_coreq:
@@ -180,62 +248,329 @@ def build_tree_from_text(text):
             combined = merge_and(combined, st)
     return combined
 
+# ---- canonical form ------------------------------------------------------------
+# Trees are canonicalized before they are written: nested plain ANDs are flattened into their parent,
+# OR children are sorted and deduplicated, and one-child AND / OR wrappers collapse to the child.
+# Every group node (OR, MIN, AND with a min: what import.ts turns into a group_id) gets "gid", a
+# hash of its canonical structure, so the same "one of MATH 100, MATH 180" in two courses gets the
+# same id and is stored once in requirement_groups.
+def is_group(node):
+    op = node.get("op")
+    return op in ("OR", "MIN") or (op == "AND" and bool(node.get("min")))
+
+def _canon(node):
+    # -> (canonical node, structural key)
+    if node.get("type") == "course":
+        return node, "C:" + node.get("id", "")
+    if "op" not in node:
+        return node, "K:" + json.dumps(node, sort_keys=True)
+    kind = (node.get("meta") or {}).get("kind")
+    kids, keys = [], []
+    for ch in node.get("children") or []:
+        c, k = _canon(ch)
+        if c is None:
+            continue
+        if (node["op"] == "AND" and c.get("op") == "AND" and not c.get("min")
+                and (c.get("meta") or {}).get("kind") in (None, kind)):
+            # AND inside AND: under the parent's kind, the child's children are the parent's
+            kids.extend(c["children"]); keys.extend(c["_keys"])
+        elif k not in keys:
+            kids.append(c); keys.append(k)
+    if node["op"] == "OR":
+        pairs = sorted(zip(keys, kids), key=lambda p: p[0])
+        keys, kids = [k for k, _ in pairs], [c for _, c in pairs]
+    if not kids:
+        return None, ""
+    if len(kids) == 1 and not kind and (node["op"] == "AND" and not node.get("min") or node["op"] == "OR"):
+        return kids[0], keys[0]
+    out = {k: v for k, v in node.items() if k not in ("children", "gid")}
+    if node["op"] == "OR" and isinstance(out.get("min"), int):
+        out["min"] = max(1, min(out["min"], len(kids)))
+    key = f"{out['op']}|{out.get('min') or ''}|{kind or ''}(" + ",".join(keys) + ")"
+    if is_group(out):
+        out["gid"] = hashlib.sha1(key.encode("utf-8")).hexdigest()[:16]
+    out["children"] = kids
+    out["_keys"] = keys
+    return out, key
+
+def _drop_keys(node):
+    if isinstance(node, dict) and "children" in node:
+        node.pop("_keys", None)
+        for ch in node["children"]:
+            _drop_keys(ch)
+    return node
+
+def canonicalize(tree):
+    if not isinstance(tree, dict):
+        return tree
+    return _drop_keys(_canon(tree)[0])
+
+def tree_groups(tree, out=None):
+    # gid -> group node, for every group in the tree (nested groups included)
+    out = {} if out is None else out
+    if isinstance(tree, dict) and "op" in tree:
+        if tree.get("gid"):
+            out.setdefault(tree["gid"], tree)
+        for ch in tree.get("children") or []:
+            tree_groups(ch, out)
+    return out
+
+# ---- batch API ---------------------------------------------------------------
+FIELDNAMES = ["course_id","course_field_raw","credit_value","prereq_text_raw","logic_hint","mentions_coreq","requires_permission","logic_groups_json","requirements_tree_json","credit_pairs_json","exclusions_json"]
+PARSE_CACHE_SIZE = int(os.environ.get("EXTRACTOR_CACHE_SIZE", "65536"))
+
+@functools.lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_picked(picked, cid):
+    # everything derived from the chosen text; cached so repeated texts (cross-listed courses,
+    # re-sent batches) skip the sentence parse. Returns JSON strings, so callers never share objects.
+    logic_hint = classify_logic(picked or "")
+    credit_groups = extract_credit_groups(picked or "")
+    tree = build_tree_from_text(sanitize_for_tree(picked or ""))
+    tree = canonicalize(strip_self_refs(tree, cid))
+    return (logic_hint,
+            bool(COREQ_CUE.search(picked)) if picked else False,
+            bool(PERM_CUE.search(picked)) if picked else False,
+            json.dumps(tree, ensure_ascii=False) if tree else None,
+            json.dumps(credit_groups, ensure_ascii=False) if credit_groups else None)
+
+def extract_row(row, headers):
+    cid = course_id_from_row(row)
+    if not cid:
+        return None
+    credits = None
+    for k in ("Credits","credits","Credit","credit","Units"):
+        if k in row and row[k]:
+            credits = str(row[k]).strip()
+            break
+    texts = detect_texts(row, headers)
+    texts_clean = [strip_html(t) for t in texts if isinstance(t,str) and t.strip()]
+    picked = ""
+    for t in texts_clean:
+        if PREREQ_CUE.search(t) or COREQ_CUE.search(t):
+            picked = t; break
+    if not picked and texts_clean:
+        picked = texts_clean[0]
+    logic_hint, mentions_coreq, requires_permission, tree_json, credit_json = parse_picked(picked, cid)
+    exclusion_groups = []
+    return {
+        "course_id": cid,
+        "course_field_raw": row.get("Course","") or "",
+        "credit_value": credits or "",
+        "prereq_text_raw": picked or "",
+        "logic_hint": logic_hint,
+        "mentions_coreq": "TRUE" if mentions_coreq else "FALSE",
+        "requires_permission": "TRUE" if requires_permission else "FALSE",
+        "logic_groups_json": None,
+        "requirements_tree_json": tree_json,
+        "credit_pairs_json": credit_json,
+        "exclusions_json": json.dumps(exclusion_groups, ensure_ascii=False) if exclusion_groups else None
+    }
+
+def extract_rows(rows, headers=None):
+    """Yield one output row (FIELDNAMES keys) per input row that has a course id.
+
+    rows are dicts as csv.DictReader yields them; headers defaults to each row's own keys.
+    The parse cache lives at module level, so a long-lived process stays warm across calls."""
+    for row in rows:
+        out = extract_row(row, headers if headers is not None else list(row))
+        if out is not None:
+            yield out
+
+def text_rows(items):
+    # [{"course_id", "text", "credits"?}] -> rows extract_rows() understands
+    for it in items:
+        yield {"Course": it.get("course_id") or "", "Credits": it.get("credits") or "", "Prerequisites": it.get("text") or ""}
+
+# ---- multi-input merge -------------------------------------------------------
+# Several combined CSVs (per campus / session) can carry the same course_id. Rows from every input
+# are extracted, spilled in sorted runs of SPILL_ROWS to temp files and k-way merged by
+# (course_id, precedence), so only one run is ever held in memory. The highest-precedence row of
+# each course_id is kept; the others are counted as duplicates, and as conflicts when they differ.
+# Within one file the later row wins, as it would through import.ts's INSERT OR REPLACE.
+SPILL_ROWS = int(os.environ.get("EXTRACTOR_SPILL_ROWS", "20000"))
+PRECEDENCE = ("newest", "last", "first")
+
+def input_ranks(paths, precedence="newest"):
+    # -> rank per path, higher wins: newest = file mtime (ties by argument order), last / first = argument order
+    order = list(range(len(paths)))
+    if precedence == "newest":
+        order.sort(key=lambda i: (os.path.getmtime(paths[i]), i))
+    elif precedence == "first":
+        order.reverse()
+    ranks = [0] * len(paths)
+    for rank, i in enumerate(order):
+        ranks[i] = rank
+    return ranks
+
+def _spill(buf, tmpdir, runs):
+    buf.sort(key=lambda r: (r[0], r[1], r[2]))
+    path = os.path.join(tmpdir, f"run{len(runs):05d}.jsonl")
+    with open(path, "w", encoding="utf-8") as g:
+        for r in buf:
+            g.write(json.dumps(r, ensure_ascii=False) + "\n")
+    runs.append(path)
+    buf.clear()
+
+def _read_run(path):
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            yield json.loads(line)
+
+def merge_inputs(paths, precedence="newest", spill_rows=None, stats=None):
+    """Yield extracted rows of several input CSVs, one per course_id, in course_id order.
+
+    stats (a dict, optional) is filled with inputs / rows / kept / duplicates / conflicts / runs and
+    conflict_ids (the first 20 course_ids whose dropped rows differed from the kept one)."""
+    spill_rows = spill_rows or SPILL_ROWS
+    ranks = input_ranks(paths, precedence)
+    st = stats if stats is not None else {}
+    st.update(inputs=len(paths), rows=0, kept=0, duplicates=0, conflicts=0, runs=0, conflict_ids=[])
+    with tempfile.TemporaryDirectory(prefix="extract_merge_") as td:
+        runs, buf, seq = [], [], 0
+        for path, rank in zip(paths, ranks):
+            with open(path, newline="", encoding="utf-8") as f:
+                reader = csv.DictReader(f)
+                for row in extract_rows(reader, reader.fieldnames or []):
+                    # -rank, then -seq: the winning row (later in the file on ties) sorts ahead of its duplicates
+                    buf.append((row["course_id"], -rank, -seq, row))
+                    seq += 1
+                    if len(buf) >= spill_rows:
+                        _spill(buf, td, runs)
+        if buf:
+            _spill(buf, td, runs)
+        st["rows"], st["runs"] = seq, len(runs)
+
+        merged = heapq.merge(*(_read_run(p) for p in runs), key=lambda r: (r[0], r[1], r[2]))
+        kept = None
+        for cid, _, _, row in merged:
+            if kept is not None and cid == kept["course_id"]:
+                st["duplicates"] += 1
+                if row != kept:
+                    st["conflicts"] += 1
+                    if len(st["conflict_ids"]) < 20 and cid not in st["conflict_ids"]:
+                        st["conflict_ids"].append(cid)
+                continue
+            if kept is not None:
+                yield kept
+            kept = row
+            st["kept"] += 1
+        if kept is not None:
+            yield kept
+
+# ---- daemon ------------------------------------------------------------------
+def request_rows(req):
+    # a decoded /extract body -> (rows, headers) for extract_rows(); ValueError names what is malformed
+    if not isinstance(req, dict):
+        raise ValueError("body must be a JSON object")
+    if "texts" in req:
+        items = req["texts"]
+        if not isinstance(items, list) or not all(isinstance(it, dict) for it in items):
+            raise ValueError("texts must be a list of objects")
+        for it in items:
+            if not all(it.get(k) is None or isinstance(it[k], str) for k in ("course_id", "text")):
+                raise ValueError("texts[].course_id and texts[].text must be strings")
+            if not (it.get("credits") is None or isinstance(it["credits"], (str, int, float))):
+                raise ValueError("texts[].credits must be a string or number")
+        return list(text_rows(items)), ["Course","Credits","Prerequisites"]
+    if "rows" in req:
+        rows, headers = req["rows"], req.get("headers")
+        if not isinstance(rows, list) or not all(isinstance(r, dict) for r in rows):
+            raise ValueError("rows must be a list of objects")
+        if not all(v is None or isinstance(v, str) for r in rows for v in r.values()):
+            raise ValueError("rows[] values must be strings")
+        if headers is not None and not (isinstance(headers, list) and all(isinstance(h, str) for h in headers)):
+            raise ValueError("headers must be a list of strings")
+        return rows, headers
+    raise ValueError("texts or rows required")
+
+class ExtractHandler(BaseHTTPRequestHandler):
+    # POST /extract  {"texts": [{"course_id", "text", "credits"?}]} or {"rows": [...], "headers"?: [...]}
+    #                -> {"rows": [...], "ms": float}
+    # GET  /health   -> {"ok": true, "cache": {...}}
+    def _send(self, code, obj):
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(code)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path.rstrip("/") != "/health":
+            return self._send(404, {"error": "not found"})
+        self._send(200, {"ok": True, "cache": parse_picked.cache_info()._asdict()})
+
+    def do_POST(self):
+        if self.path.rstrip("/") != "/extract":
+            return self._send(404, {"error": "not found"})
+        try:
+            req = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+        except ValueError:
+            return self._send(400, {"error": "body must be JSON"})
+        try:
+            src, headers = request_rows(req)
+        except ValueError as e:
+            return self._send(400, {"error": str(e)})
+        t0 = time.perf_counter()
+        rows = list(extract_rows(src, headers))
+        self._send(200, {"rows": rows, "ms": round((time.perf_counter() - t0) * 1000, 3)})
+
+    def log_message(self, fmt, *args):
+        pass
+
+def make_server(host="127.0.0.1", port=8765):
+    return ThreadingHTTPServer((host, port), ExtractHandler)
+
+def serve(host, port):
+    srv = make_server(host, port)
+    print(f"extractor listening on http://{srv.server_address[0]}:{srv.server_address[1]}")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
 def main():
     ap = argparse.ArgumentParser(description="Extract structured prerequisites from HAR CSV")
-    ap.add_argument("input_csv", help="Path to combined_courses_with_prereqs.csv")
+    ap.add_argument("input_csv", nargs="*", help="Path to combined_courses_with_prereqs.csv; several are merged by course_id")
     ap.add_argument("-o","--output_csv", default=None, help="Where to write extracted_prereqs.csv")
+    ap.add_argument("--precedence", choices=PRECEDENCE, default="newest",
+                    help="Which input wins a duplicated course_id: newest file (mtime), last or first argument")
+    ap.add_argument("--serve", action="store_true", help="Run as a local HTTP daemon instead (see ExtractHandler)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8765)
     args = ap.parse_args()
-    in_path = os.path.expanduser(args.input_csv)
-    if not os.path.exists(in_path):
-        print(f"Input file not found: {in_path}", file=sys.stderr)
-        sys.exit(1)
+    if args.serve:
+        serve(args.host, args.port)
+        return
+    if not args.input_csv:
+        ap.error("input_csv is required unless --serve is given")
+    in_paths = [os.path.expanduser(p) for p in args.input_csv]
+    for in_path in in_paths:
+        if not os.path.exists(in_path):
+            print(f"Input file not found: {in_path}", file=sys.stderr)
+            sys.exit(1)
+    in_path = in_paths[0]
     out_path = os.path.expanduser(args.output_csv) if args.output_csv else os.path.join(os.path.dirname(in_path) or ".", "extracted_prereqs.csv")
+    if len(in_paths) > 1:
+        stats = {}
+        with open(out_path, "w", newline="", encoding="utf-8") as g:
+            w = csv.DictWriter(g, fieldnames=FIELDNAMES)
+            w.writeheader()
+            for r in merge_inputs(in_paths, args.precedence, stats=stats):
+                w.writerow(r)
+        print(f"Merged {stats['inputs']} inputs ({stats['rows']} rows, {stats['runs']} sorted runs, precedence={args.precedence}): "
+              f"{stats['duplicates']} duplicate course_ids dropped, {stats['conflicts']} of them conflicting")
+        if stats["conflict_ids"]:
+            print("  conflicts: " + ", ".join(stats["conflict_ids"]) + (" ..." if stats["conflicts"] > len(stats["conflict_ids"]) else ""))
+        print(f"Wrote {stats['kept']} rows to {out_path}")
+        return
     with open(in_path, newline="", encoding="utf-8") as f:
         reader = csv.DictReader(f)
-        headers = reader.fieldnames or []
-        rows_out = []
-        for row in reader:
-            cid = course_id_from_row(row)
-            if not cid:
-                continue
-            credits = None
-            for k in ("Credits","credits","Credit","credit","Units"):
-                if k in row and row[k]:
-                    credits = str(row[k]).strip()
-                    break
-            texts = detect_texts(row, headers)
-            texts_clean = [strip_html(t) for t in texts if isinstance(t,str) and t.strip()]
-            picked = ""
-            for t in texts_clean:
-                if PREREQ_CUE.search(t) or COREQ_CUE.search(t):
-                    picked = t; break
-            if not picked and texts_clean:
-                picked = texts_clean[0]
-            mentions_coreq = bool(COREQ_CUE.search(picked)) if picked else False
-            requires_permission = bool(PERM_CUE.search(picked)) if picked else False
-            logic_hint = classify_logic(picked or "")
-            credit_groups = extract_credit_groups(picked or "")
-            exclusion_groups = []
-            sanitized = sanitize_for_tree(picked or "")
-            tree = build_tree_from_text(sanitized)
-            tree = strip_self_refs(tree, cid)
-            tree_json = json.dumps(tree, ensure_ascii=False) if tree else None
-            rows_out.append({
-                "course_id": cid,
-                "course_field_raw": row.get("Course","") or "",
-                "credit_value": credits or "",
-                "prereq_text_raw": picked or "",
-                "logic_hint": logic_hint,
-                "mentions_coreq": "TRUE" if mentions_coreq else "FALSE",
-                "requires_permission": "TRUE" if requires_permission else "FALSE",
-                "logic_groups_json": None,
-                "requirements_tree_json": tree_json,
-                "credit_pairs_json": json.dumps(credit_groups, ensure_ascii=False) if credit_groups else None,
-                "exclusions_json": json.dumps(exclusion_groups, ensure_ascii=False) if exclusion_groups else None
-            })
-    fieldnames = ["course_id","course_field_raw","credit_value","prereq_text_raw","logic_hint","mentions_coreq","requires_permission","logic_groups_json","requirements_tree_json","credit_pairs_json","exclusions_json"]
+        rows_out = list(extract_rows(reader, reader.fieldnames or []))
     with open(out_path, "w", newline="", encoding="utf-8") as g:
-        w = csv.DictWriter(g, fieldnames=fieldnames)
+        w = csv.DictWriter(g, fieldnames=FIELDNAMES)
         w.writeheader()
         for r in rows_out:
             w.writerow(r)
@@ -1,4 +1,4 @@
-import unittest, json
+import unittest, json, os, tempfile, threading, urllib.error, urllib.request
 import extractor_v2 as ex
 
 class TestExtractorV2(unittest.TestCase):
@@ -39,5 +39,119 @@ class TestExtractorV2(unittest.TestCase):
         self.assertEqual(ex.classify_logic("A and B."), "AND")
         self.assertIn(ex.classify_logic("A and one of B, C."), ("MIXED","AND","OR"))
 
+    def test_constraint_nodes(self):
+        tree = ex.build_tree_from_text("Prerequisite: CPSC 210 and third-year standing or higher.")
+        self.assertEqual(tree["op"], "AND")
+        self.assertIn({"constraint": "YEAR_STANDING", "year_min": 3}, tree["children"])
+        tree = ex.build_tree_from_text("Prerequisite: a minimum GPA of 2.5 and 64% or higher in MATH 100.")
+        self.assertIn({"constraint": "GPA_MIN", "value": 2.5}, tree["children"])
+        self.assertIn({"constraint": "PERCENT_MIN", "value": 64, "courses": ["MATH 100"]}, tree["children"])
+        self.assertEqual(ex.build_tree_from_text("At least 24 credits of MATH at the 300 level."),
+                         {"constraint": "CREDITS_AT_LEAST", "credits_min": 24, "subject": "MATH", "level_min": 300})
+        # "or higher" belongs to the constraint; the sentence's own "or" still makes an OR group
+        tree = ex.build_tree_from_text("Prerequisite: CPSC 210 or fourth-year standing.")
+        self.assertEqual(tree["op"], "OR")
+        self.assertIn({"constraint": "YEAR_STANDING", "year_min": 4}, tree["children"])
+
+    def test_percent_needs_grade_cue_or_course(self):
+        self.assertIsNone(ex.build_tree_from_text("Prerequisite: 100% online."))
+        tree = ex.build_tree_from_text("Prerequisite: CPSC 110. Delivered 50% in person.")
+        self.assertEqual(tree, {"type": "course", "id": "CPSC 110"})
+        self.assertEqual(ex.build_tree_from_text("Prerequisite: a minimum grade of 68%."),
+                         {"constraint": "PERCENT_MIN", "value": 68})
+        tree = ex.build_tree_from_text("Prerequisite: 70% in MATH 100.")
+        self.assertIn({"constraint": "PERCENT_MIN", "value": 70, "courses": ["MATH 100"]}, tree["children"])
+        # both alternatives survive, each with the course it applies to, and no one-child OR is left
+        self.assertEqual(ex.build_tree_from_text("Prerequisite: 75% in MATH 12 or a minimum of 68% in PREC 12."),
+                         {"op": "OR", "min": 1, "children": [
+                             {"constraint": "PERCENT_MIN", "value": 75, "course_text": "MATH 12"},
+                             {"constraint": "PERCENT_MIN", "value": 68, "course_text": "PREC 12"}]})
+        self.assertEqual(ex.build_tree_from_text("Prerequisite: CPSC 210 or 100% online."),
+                         {"type": "course", "id": "CPSC 210"})
+
+    def test_canonicalize_shares_groups(self):
+        a = ex.canonicalize({"op": "AND", "children": [
+            {"op": "AND", "children": [{"type": "course", "id": "CPSC 110"}, {"type": "course", "id": "CPSC 121"}]},
+            {"op": "OR", "min": 1, "children": [{"type": "course", "id": "MATH 180"}, {"type": "course", "id": "MATH 100"}]}]})
+        b = ex.canonicalize({"op": "OR", "min": 1, "children": [{"type": "course", "id": "MATH 100"}, {"type": "course", "id": "MATH 180"}]})
+        self.assertEqual([c.get("id") for c in a["children"][:2]], ["CPSC 110", "CPSC 121"])
+        self.assertEqual([c["id"] for c in a["children"][2]["children"]], ["MATH 100", "MATH 180"])
+        self.assertEqual(list(ex.tree_groups(a)), [b["gid"]])
+        coreq = ex.canonicalize(dict(b, meta={"kind": "CO_REQ"}))
+        self.assertNotEqual(coreq["gid"], b["gid"])
+
+    def test_extract_rows_batch(self):
+        rows = [{"Course": "ELEC 201", "Credits": "4", "Prerequisites": "Prerequisite: MATH 101 and ELEC 201."},
+                {"Course": "", "Prerequisites": "Permission of the instructor."}]
+        out = list(ex.extract_rows(rows))
+        self.assertEqual(len(out), 1)
+        self.assertEqual(list(out[0]), ex.FIELDNAMES)
+        self.assertEqual(out[0]["credit_value"], "4")
+        tree = json.loads(out[0]["requirements_tree_json"])
+        self.assertEqual(tree, {"type": "course", "id": "MATH 101"})
+        # same text again is served from the parse cache
+        hits = ex.parse_picked.cache_info().hits
+        self.assertEqual(list(ex.extract_rows(rows[:1])), out)
+        self.assertEqual(ex.parse_picked.cache_info().hits, hits + 1)
+
+    def test_daemon_extract(self):
+        srv = ex.make_server("127.0.0.1", 0)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{srv.server_address[1]}/extract"
+            body = json.dumps({"texts": [{"course_id": "CPSC 210", "text": "Prerequisite: one of CPSC 107, CPSC 110."}]})
+            req = urllib.request.Request(url, body.encode("utf-8"), {"Content-Type": "application/json"})
+            res = json.loads(urllib.request.urlopen(req, timeout=5).read())
+            self.assertEqual(len(res["rows"]), 1)
+            self.assertEqual(res["rows"][0]["course_id"], "CPSC 210")
+            tree = json.loads(res["rows"][0]["requirements_tree_json"])
+            self.assertEqual(tree.get("op"), "OR")
+        finally:
+            srv.shutdown()
+            srv.server_close()
+
+    def test_daemon_rejects_malformed_bodies(self):
+        srv = ex.make_server("127.0.0.1", 0)
+        threading.Thread(target=srv.serve_forever, daemon=True).start()
+        try:
+            url = f"http://127.0.0.1:{srv.server_address[1]}/extract"
+            bodies = ["[]", '"x"', "{}", '{"texts": ["x"]}', '{"texts": {"course_id": "CPSC 110"}}',
+                      '{"texts": [{"course_id": 110, "text": "x"}]}', '{"rows": [["CPSC 110"]]}',
+                      '{"rows": [{"Course": 110}]}', '{"rows": [], "headers": "Course"}', "not json"]
+            for body in bodies:
+                req = urllib.request.Request(url, body.encode("utf-8"), {"Content-Type": "application/json"})
+                with self.assertRaises(urllib.error.HTTPError, msg=body) as cm:
+                    urllib.request.urlopen(req, timeout=5)
+                self.assertEqual(cm.exception.code, 400, body)
+                self.assertIn("error", json.loads(cm.exception.read()))
+            # the daemon is still up, and an empty batch is fine
+            req = urllib.request.Request(url, b'{"texts": []}', {"Content-Type": "application/json"})
+            self.assertEqual(json.loads(urllib.request.urlopen(req, timeout=5).read())["rows"], [])
+        finally:
+            srv.shutdown()
+            srv.server_close()
+
+    def test_merge_inputs_newest_wins(self):
+        with tempfile.TemporaryDirectory() as td:
+            old, new = os.path.join(td, "v.csv"), os.path.join(td, "o.csv")
+            with open(old, "w", encoding="utf-8") as f:
+                f.write("Course,Prerequisites\nCPSC 210,Prerequisite: CPSC 110.\nMATH 200,Prerequisite: MATH 101.\nCPSC 221,Prerequisite: CPSC 110.\n"
+                        "CPSC 221,Prerequisite: CPSC 210.\n")
+            with open(new, "w", encoding="utf-8") as f:
+                f.write("Course,Prerequisites\nCPSC 210,Prerequisite: CPSC 107.\nMATH 200,Prerequisite: MATH 101.\n")
+            os.utime(old, (1_000_000, 1_000_000))
+            os.utime(new, (2_000_000, 2_000_000))
+            stats = {}
+            # spill_rows=2 forces several sorted runs through the k-way merge
+            out = list(ex.merge_inputs([new, old], "newest", spill_rows=2, stats=stats))
+            self.assertEqual([r["course_id"] for r in out], ["CPSC 210", "CPSC 221", "MATH 200"])
+            self.assertIn("CPSC 107", out[0]["prereq_text_raw"])
+            # same course twice in one file: the later row wins, like INSERT OR REPLACE in import.ts
+            self.assertIn("CPSC 210", out[1]["prereq_text_raw"])
+            self.assertEqual((stats["duplicates"], stats["conflicts"], stats["conflict_ids"]), (3, 2, ["CPSC 210", "CPSC 221"]))
+            self.assertGreater(stats["runs"], 1)
+            out = list(ex.merge_inputs([new, old], "last"))
+            self.assertIn("CPSC 110", out[0]["prereq_text_raw"])
+
 if __name__ == "__main__":
     unittest.main()
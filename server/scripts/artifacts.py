@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+# server/scripts/artifacts.py
+# -*- coding: utf-8 -*-
+# Content-addressed store for intermediate ETL files (extractor CSV, RMP CSVs, tmp-grades imports).
+#
+# An artifact set is keyed by a hash of whatever produced it (pipeline.input_key: inputs + code); each
+# file is stored gzip-compressed under its own content hash, so identical outputs share one blob.
+# manifest.json keeps, per key, the files it holds and when it was last used, plus a per-name history
+# of keys so the previous good dataset can be restored. Blobs are evicted least-recently-used first
+# once the store grows past ARTIFACT_CACHE_MB.
+#
+#   python3 artifacts.py list
+#   python3 artifacts.py rollback extract          restore the previous output of a pipeline stage
+#   python3 artifacts.py gc
+import argparse, gzip, hashlib, json, os, shutil, tempfile, threading, time
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+STORE_DIR = os.environ.get("ARTIFACT_DIR", os.path.join(HERE, "..", ".artifacts"))
+CACHE_MB = float(os.environ.get("ARTIFACT_CACHE_MB", "2048"))
+HISTORY = 10            # keys remembered per name for rollback
+
+_lock = threading.Lock()  # the pipeline stores from several stage threads
+
+# ---- hashing ---------------------------------------------------------------
+def file_sha1(path):
+    h = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+# ---- manifest --------------------------------------------------------------
+def _manifest_path():
+    return os.path.join(STORE_DIR, "manifest.json")
+
+def _blob_path(digest):
+    return os.path.join(STORE_DIR, "blobs", digest[:2], digest + ".gz")
+
+def load_manifest():
+    try:
+        with open(_manifest_path(), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {"entries": {}, "history": {}}
+
+def save_manifest(m):
+    os.makedirs(STORE_DIR, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=STORE_DIR, prefix=".manifest-")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(m, f, indent=1, sort_keys=True)
+    os.replace(tmp, _manifest_path())
+
+def _atomic_copy_out(blob, dest):
+    os.makedirs(os.path.dirname(os.path.abspath(dest)), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(dest)), prefix=".restore-")
+    try:
+        with os.fdopen(fd, "wb") as out, gzip.open(blob, "rb") as src:
+            shutil.copyfileobj(src, out, 1 << 20)
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ---- store / restore -------------------------------------------------------
+def put(name, key, paths, meta=None):
+    # store the files of one artifact set; returns the manifest entry
+    files = {}
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        digest = file_sha1(p)
+        blob = _blob_path(digest)
+        if not os.path.exists(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(blob), prefix=".put-")
+            with os.fdopen(fd, "wb") as raw, open(p, "rb") as src:
+                with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=6, mtime=0) as gz:
+                    shutil.copyfileobj(src, gz, 1 << 20)
+            os.replace(tmp, blob)
+        files[os.path.abspath(p)] = {"sha1": digest, "size": os.path.getsize(p), "stored": os.path.getsize(blob)}
+    now = time.time()
+    with _lock:
+        m = load_manifest()
+        entry = {"name": name, "files": files, "created": now, "last_used": now, "meta": meta or {}}
+        m["entries"][key] = entry
+        hist = [k for k in m["history"].get(name, []) if k != key]
+        m["history"][name] = (hist + [key])[-HISTORY:]
+        _evict(m)
+        save_manifest(m)
+    return entry
+
+def lookup(key):
+    e = load_manifest()["entries"].get(key)
+    if e is None or not all(os.path.exists(_blob_path(f["sha1"])) for f in e["files"].values()):
+        return None
+    return e
+
+def restore(key, dest_map=None):
+    # write the files of an artifact set back to where they came from (or dest_map[path]);
+    # False if the set is unknown or one of its blobs has been evicted
+    e = lookup(key)
+    if e is None:
+        return False
+    for path, f in e["files"].items():
+        dest = (dest_map or {}).get(path, path)
+        if os.path.exists(dest) and os.path.getsize(dest) == f["size"] and file_sha1(dest) == f["sha1"]:
+            continue
+        _atomic_copy_out(_blob_path(f["sha1"]), dest)
+    with _lock:
+        m = load_manifest()
+        if key in m["entries"]:
+            m["entries"][key]["last_used"] = time.time()
+            save_manifest(m)
+    return True
+
+class Evicted(LookupError):
+    pass
+
+def rollback(name, steps=1):
+    # restore the artifact set produced `steps` generations before the latest one for name; None if
+    # there are not that many, Evicted if that set is gone (rather than quietly going back further)
+    m = load_manifest()
+    hist = m["history"].get(name, [])
+    if len(hist) <= steps:
+        return None
+    key = hist[-1 - steps]
+    if not restore(key):
+        raise Evicted(f"artifact {key[:12]} for {name} was evicted; raise ARTIFACT_CACHE_MB to keep more")
+    return key
+
+# ---- eviction --------------------------------------------------------------
+def _evict(m):
+    # LRU by artifact set; a blob goes once no remaining set references it
+    cap = CACHE_MB * 1024 * 1024
+    def referenced():
+        return {f["sha1"]: f["stored"] for e in m["entries"].values() for f in e["files"].values()}
+    blobs = referenced()
+    total = sum(blobs.values())
+    newest = max((e["last_used"] for e in m["entries"].values()), default=0)
+    for key, e in sorted(m["entries"].items(), key=lambda kv: kv[1]["last_used"]):
+        if total <= cap:
+            break
+        if e["last_used"] == newest:
+            break   # never evict the set that was just stored/used
+        del m["entries"][key]
+        still = referenced()
+        for f in e["files"].values():
+            if f["sha1"] not in still and f["sha1"] in blobs:
+                total -= blobs.pop(f["sha1"])
+                try:
+                    os.remove(_blob_path(f["sha1"]))
+                except OSError:
+                    pass
+    # history keeps evicted keys (it is capped at HISTORY per name), so generations keep their
+    # positions and rollback can tell "evicted" from "never existed"
+
+def gc():
+    with _lock:
+        m = load_manifest()
+        _evict(m)
+        save_manifest(m)
+        keep = {f["sha1"] for e in m["entries"].values() for f in e["files"].values()}
+    removed = 0
+    for root, _, files in os.walk(os.path.join(STORE_DIR, "blobs")):
+        for fn in files:
+            if fn.endswith(".gz") and fn[:-3] not in keep:
+                os.remove(os.path.join(root, fn))
+                removed += 1
+    return removed
+
+def main():
+    ap = argparse.ArgumentParser(description="Inspect the ETL artifact store")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("list")
+    rb = sub.add_parser("rollback")
+    rb.add_argument("name")
+    rb.add_argument("--steps", type=int, default=1)
+    sub.add_parser("gc")
+    args = ap.parse_args()
+
+    if args.cmd == "list":
+        m = load_manifest()
+        for name, keys in sorted(m["history"].items()):
+            for k in reversed(keys):
+                e = m["entries"].get(k)
+                if e is None:
+                    print(f"{name:<15} {k[:12]} evicted")
+                    continue
+                size = sum(f["size"] for f in e["files"].values())
+                stored = sum(f["stored"] for f in e["files"].values())
+                when = time.strftime("%Y-%m-%d %H:%M", time.localtime(e["created"]))
+                print(f"{name:<15} {k[:12]} {when} files={len(e['files'])} size={size} stored={stored}")
+    elif args.cmd == "rollback":
+        try:
+            key = rollback(args.name, args.steps)
+        except Evicted as e:
+            raise SystemExit(f"[artifacts] {e}")
+        if key is None:
+            raise SystemExit(f"[artifacts] no earlier artifact for {args.name}")
+        for path in load_manifest()["entries"][key]["files"]:
+            print(f"[artifacts] restored {path}")
+    elif args.cmd == "gc":
+        print(f"[artifacts] removed {gc()} unreferenced blobs")
+
+if __name__ == "__main__":
+    main()
@@ -1,16 +1,13 @@
 # server/scripts/backfill_empty_tables.py
 # -*- coding: utf-8 -*-
-import os, re, sqlite3, math
-from difflib import SequenceMatcher
-from concurrent.futures import ProcessPoolExecutor, as_completed
+import os, re
 
-DB = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "prereqs.db"))
+import db
+import identity
 
-# ---- small helpers ---------------------------------------------------------
-def table_exists(cur, name):
-    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?;", (name,))
-    return cur.fetchone() is not None
+DB = db.db_file()
 
+# ---- small helpers ---------------------------------------------------------
 def table_empty(cur, name):
     cur.execute(f"SELECT COUNT(*) FROM {name}")
     return cur.fetchone()[0] == 0
@@ -34,7 +31,7 @@ def last_token(s: str) -> str:
 
 # ---- instructors -----------------------------------------------------------
 def ensure_instructors_schema(cur):
-    if not table_exists(cur, "instructors"):
+    if not db.table_exists(cur, "instructors"):
         cur.execute("""
                     CREATE TABLE instructors(
                                                 id   INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -48,7 +45,7 @@ def ensure_instructors_schema(cur):
     print("[instructors] schema OK")
 
 def backfill_instructors(cur):
-    if not table_exists(cur, "grades_prof_course"):
+    if not db.table_exists(cur, "grades_prof_course"):
         print("[instructors] grades_prof_course missing; skip")
         return
     src_cols = {c["name"] for c in pragma_cols(cur, "grades_prof_course")}
@@ -68,7 +65,7 @@ def backfill_instructors(cur):
 
 # ---- pair_sections (aggregate → unique) ------------------------------------
 def ensure_pair_sections_schema(cur):
-    if not table_exists(cur, "pair_sections"):
+    if not db.table_exists(cur, "pair_sections"):
         cur.execute("""
                     CREATE TABLE pair_sections(
                                                   id         INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -95,18 +92,26 @@ def ensure_pair_sections_schema(cur):
     else:
         print("[pair_sections] table exists")
 
+def ensure_pair_sections_source_index(cur, key_cols, src_cols):
+    # covering index in GROUP BY order: each (campus, subject) chunk is one index range scan with no
+    # temp B-tree, and instructor right after the keys keeps GROUP_CONCAT output in a stable order
+    cols = key_cols + [c for c in ("instructor", "title", "detail", "enrolled", "avg") if c in src_cols]
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_gpc_pair_sections ON grades_prof_course({', '.join(cols)})")
+
 def backfill_pair_sections(cur):
-    if not table_exists(cur, "grades_prof_course"):
+    # -> rows inserted or changed
+    if not db.table_exists(cur, "grades_prof_course"):
         print("[pair_sections] grades_prof_course missing; skip")
-        return
+        return 0
     dst_cols = {c["name"] for c in pragma_cols(cur, "pair_sections")}
     src_cols = {c["name"] for c in pragma_cols(cur, "grades_prof_course")}
     key_cols = [c for c in ("campus","subject","course","section","year","session","component") if c in src_cols and c in dst_cols]
     if not key_cols:
         print("[pair_sections] no common key columns; skip")
-        return
+        return 0
 
     print(f"[pair_sections] aggregating by keys: {', '.join([k for k in key_cols if k!='component'])}")
+    ensure_pair_sections_source_index(cur, key_cols, src_cols)
     select_parts = key_cols[:]
     # non-key aggregates
     select_parts.append("MIN(title) AS title" if "title" in src_cols else "'' AS title")
@@ -118,23 +123,77 @@ def backfill_pair_sections(cur):
     else:
         select_parts.append("'' AS profs_raw")
 
-    insert_cols = key_cols + ["title","detail","enrolled","avg","profs_raw"]
-    cur.execute(f"""
-        INSERT OR REPLACE INTO pair_sections ({", ".join(insert_cols)})
-        SELECT {", ".join(select_parts)}
-        FROM grades_prof_course
-        WHERE campus IS NOT NULL AND TRIM(campus) <> ''
-          AND subject IS NOT NULL AND TRIM(subject) <> ''
-          AND course  IS NOT NULL AND TRIM(course)  <> ''
-          AND section IS NOT NULL AND TRIM(section) <> ''
-        GROUP BY {", ".join(key_cols)}
-    """)
+    val_cols = ["title","detail","enrolled","avg","profs_raw"]
+    insert_cols = key_cols + val_cols
+    def aggregate(where):
+        return f"""
+            SELECT {", ".join(select_parts)}
+            FROM grades_prof_course
+            WHERE {where}
+              AND course  IS NOT NULL AND TRIM(course)  <> ''
+              AND section IS NOT NULL AND TRIM(section) <> ''
+            GROUP BY {", ".join(key_cols)}
+        """
+    # the chunk table takes its column names and affinities from the aggregate itself
+    cur.execute("DROP TABLE IF EXISTS temp.ps_chunk")
+    cur.execute(f"CREATE TEMP TABLE ps_chunk AS {aggregate('0')}")
+
+    # rows with a NULL year/session never hit the unique index (NULLs are distinct), so only
+    # fully keyed groups go through ON CONFLICT; the rest are matched with IS instead
+    upsert_ok = "year" in key_cols and "session" in key_cols
+    unkeyed = "c.year IS NULL OR c.session IS NULL" if upsert_ok else "1"
+    upsert = f"""
+        INSERT INTO pair_sections ({", ".join(insert_cols)})
+        SELECT {", ".join(insert_cols)} FROM temp.ps_chunk
+        WHERE year IS NOT NULL AND session IS NOT NULL
+        ON CONFLICT(campus,subject,course,section,year,session,component) DO UPDATE SET
+            {", ".join(f"{c}=excluded.{c}" for c in val_cols)}
+        WHERE {" OR ".join(f"pair_sections.{c} IS NOT excluded.{c}" for c in val_cols)}
+    """
+    same_key = " AND ".join([f"p.{k} IS c.{k}" for k in key_cols] + ([] if "component" in key_cols else ["p.component = ''"]))
+    unkeyed_update = f"""
+        UPDATE pair_sections AS p SET {", ".join(f"{c}=c.{c}" for c in val_cols)}
+        FROM temp.ps_chunk AS c
+        WHERE ({unkeyed}) AND {same_key}
+          AND ({" OR ".join(f"p.{c} IS NOT c.{c}" for c in val_cols)})
+    """
+    unkeyed_insert = f"""
+        INSERT INTO pair_sections ({", ".join(insert_cols)})
+        SELECT {", ".join(f"c.{k}" for k in insert_cols)} FROM temp.ps_chunk AS c
+        WHERE ({unkeyed})
+          AND NOT EXISTS (SELECT 1 FROM pair_sections AS p WHERE {same_key})
+    """
+
+    cur.execute("""
+                SELECT DISTINCT campus, subject FROM grades_prof_course
+                WHERE campus IS NOT NULL AND TRIM(campus) <> ''
+                  AND subject IS NOT NULL AND TRIM(subject) <> ''
+                """)
+    chunks = cur.fetchall()
+    total, changed = len(chunks), 0
+    step = max(1, total // 20)
+    for i, (campus, subject) in enumerate(chunks, 1):
+        cur.execute("DELETE FROM temp.ps_chunk")
+        cur.execute(f"INSERT INTO temp.ps_chunk {aggregate('campus = ? AND subject = ?')}", (campus, subject))
+        n = 0
+        if upsert_ok:
+            cur.execute(upsert)
+            n += max(cur.rowcount, 0)
+        cur.execute(unkeyed_update)
+        n += max(cur.rowcount, 0)
+        cur.execute(unkeyed_insert)
+        n += max(cur.rowcount, 0)
+        changed += n
+        if i % step == 0 or i == total:
+            print(f"[pair_sections] {i}/{total} chunks ({i * 100.0 / total:.1f}%) at {campus} {subject}, rows written={changed}")
+    cur.execute("DROP TABLE IF EXISTS temp.ps_chunk")
     cur.execute("SELECT COUNT(*) FROM pair_sections")
-    print(f"[pair_sections] rows={cur.fetchone()[0]}")
+    print(f"[pair_sections] rows={cur.fetchone()[0]} written={changed}")
+    return changed
 
-# ---- match instructors ↔ RMP (parallel, blocked, looser) -------------------
+# ---- match instructors ↔ RMP (via identity.py) -----------------------------
 def ensure_match_schema(cur):
-    if not table_exists(cur, "instructor_rmp_match"):
+    if not db.table_exists(cur, "instructor_rmp_match"):
         cur.execute("""
                     CREATE TABLE instructor_rmp_match(
                                                          instructor_id  INTEGER NOT NULL,
@@ -149,135 +208,22 @@ def ensure_match_schema(cur):
         print("[match] created")
     else:
         print("[match] schema OK")
-
-def _ratio(a: str, b: str) -> float:
-    # token-aware max of two ratios (cheap but effective)
-    ra = SequenceMatcher(None, norm_name(a), norm_name(b)).ratio()
-    rb = SequenceMatcher(None, " ".join(sorted(tokenize(a))), " ".join(sorted(tokenize(b)))).ratio()
-    return ra if ra > rb else rb
-
-def _best_match_one(args):
-    iid, iname, threshold, rmp_rows, token_index, last_index, cap = args
-    toks = set(tokenize(iname))
-    last = last_token(iname)
-    candidates = set()
-    # block by tokens
-    for t in toks:
-        if t in token_index:
-            candidates.update(token_index[t])
-    # also block by last name
-    if last and last in last_index:
-        candidates.update(last_index[last])
-
-    if not candidates:
-        # final fallback: everything (but cap)
-        candidates = set(range(len(rmp_rows)))
-    # trim candidate universe
-    if cap and len(candidates) > cap:
-        # rough prefilter by simple substring overlap to shrink
-        pre = []
-        nin = " ".join(sorted(toks))
-        for idx in candidates:
-            _, rname = rmp_rows[idx]
-            rnin = " ".join(sorted(tokenize(rname)))
-            # quick char overlap score
-            inter = len(set(nin) & set(rnin))
-            pre.append((inter, idx))
-        pre.sort(reverse=True)
-        candidates = set(idx for _, idx in pre[:cap])
-
-    best_score, best_legacy = 0.0, None
-    for idx in candidates:
-        legacy, rname = rmp_rows[idx]
-        s = _ratio(iname, rname)
-        if s > best_score:
-            best_score, best_legacy = s, legacy
-    if best_legacy and best_score >= threshold:
-        return (iid, best_legacy, float(best_score))
-    return None
-
-def backfill_matches_parallel(con, threshold=0.85):
+    # bookkeeping from the pre-identity matcher; identity.py keeps its own
+    cur.execute("DROP TABLE IF EXISTS match_scored_instructors")
+    cur.execute("DROP TABLE IF EXISTS match_seen_rmp")
+
+def backfill_matches(con, threshold=0.85):
+    # resolution lives in identity.py (shared with etl_enrich.py); this table is a projection of it
+    identity.resolve_identities(con, threshold=threshold)
+    identity.apply_identities(con)
     cur = con.cursor()
-    # exact matches first
-    cur.execute("""
-                INSERT OR IGNORE INTO instructor_rmp_match(instructor_id, rmp_legacy_id, confidence)
-                SELECT i.id, r.legacy_id, 1.0
-                FROM instructors i
-                         JOIN (
-                    SELECT legacy_id,
-                           LOWER(REPLACE(REPLACE(REPLACE(TRIM(first_name||' '||last_name),'.',''),',',''),'  ',' ')) AS norm
-                    FROM rmp_professors
-                ) r ON r.norm = i.norm
-                """)
-    con.commit()
-    cur.execute("SELECT COUNT(*) FROM instructor_rmp_match")
-    print(f"[match] after exact rows={cur.fetchone()[0]}")
-
-    # pull unmapped
-    cur.execute("""
-                SELECT id, name FROM instructors
-                WHERE id NOT IN (SELECT instructor_id FROM instructor_rmp_match)
-                """)
-    unmapped = cur.fetchall()
-    if not unmapped:
-        print("[match] nothing to fuzzy-match")
-        return
-
-    cur.execute("SELECT legacy_id, first_name||' '||last_name FROM rmp_professors")
-    rmp_rows = cur.fetchall()
-    if not rmp_rows:
-        print("[match] rmp_professors empty; skip fuzzy")
-        return
-
-    # build blocking indexes
-    token_index = {}   # token -> list of indices in rmp_rows
-    last_index  = {}   # last token -> list
-    for idx, (legacy, rname) in enumerate(rmp_rows):
-        toks = set(tokenize(rname))
-        for t in toks:
-            token_index.setdefault(t, []).append(idx)
-        lt = last_token(rname)
-        if lt:
-            last_index.setdefault(lt, []).append(idx)
-
-    workers = max(1, int(os.environ.get("MATCH_WORKERS", os.cpu_count() or 4)))
-    cap = int(os.environ.get("MATCH_CANDIDATE_CAP", "200"))  # limit candidate set per instructor
-
-    args_iter = ((iid, iname, threshold, rmp_rows, token_index, last_index, cap) for iid, iname in unmapped)
-
-    inserts = []
-    done, total = 0, len(unmapped)
-    print(f"[match] fuzzy starting: {total} instructors, workers={workers}, threshold={threshold}, cap={cap}")
-
-    with ProcessPoolExecutor(max_workers=workers) as ex:
-        futures = [ex.submit(_best_match_one, a) for a in args_iter]
-        for f in as_completed(futures):
-            res = f.result()
-            if res:
-                inserts.append(res)
-            done += 1
-            if done % max(100, total // 50 or 1) == 0 or done == total:
-                pct = (done * 100.0) / total
-                print(f"[match] {done}/{total} ({pct:.1f}%) matched={len(inserts)}")
-
-    if inserts:
-        cur.executemany("""
-                        INSERT OR IGNORE INTO instructor_rmp_match(instructor_id, rmp_legacy_id, confidence)
-            VALUES (?,?,?)
-                        """, inserts)
-        con.commit()
     cur.execute("SELECT COUNT(*) FROM instructor_rmp_match")
-    print(f"[match] final rows={cur.fetchone()[0]} (+{len(inserts)} fuzzy)")
+    print(f"[match] final rows={cur.fetchone()[0]}")
 
 # ---- main ------------------------------------------------------------------
 def main():
     print(f"[db] {DB}")
-    con = sqlite3.connect(DB)
-    # speed up bulk writes
-    con.execute("PRAGMA journal_mode=WAL;")
-    con.execute("PRAGMA synchronous=OFF;")
-    con.execute("PRAGMA temp_store=MEMORY;")
-    con.execute("PRAGMA mmap_size=3000000000;")  # best-effort
+    con = db.connect(DB, "bulk")
 
     try:
         cur = con.cursor()
@@ -286,15 +232,24 @@ def main():
         ensure_match_schema(cur)
         con.commit()
 
-        backfill_instructors(cur)
-        con.commit()
-
-        backfill_pair_sections(cur)
-        con.commit()
+        # instructors/pair_sections are pure functions of grades_prof_course
+        db.ensure_state(cur, "backfill", legacy_table="backfill_state")
+        fp = db.table_fingerprint(cur, "grades_prof_course")
+        if fp is not None and fp == db.get_state(cur, "backfill", "gpc_fingerprint"):
+            print(f"[instructors] grades_prof_course unchanged ({fp}); skip")
+            print(f"[pair_sections] grades_prof_course unchanged ({fp}); skip")
+        else:
+            backfill_instructors(cur)
+            con.commit()
+
+            backfill_pair_sections(cur)
+            if fp is not None:
+                db.set_state(cur, "backfill", "gpc_fingerprint", fp)
+            con.commit()
 
         # looser threshold; override via env RMP_FUZZY_THRESHOLD
         thr = float(os.environ.get("RMP_FUZZY_THRESHOLD", "0.85"))
-        backfill_matches_parallel(con, threshold=thr)
+        backfill_matches(con, threshold=thr)
 
     finally:
         con.close()
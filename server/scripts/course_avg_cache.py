@@ -0,0 +1,162 @@
+# server/scripts/course_avg_cache.py
+# -*- coding: utf-8 -*-
+# Offline replacement for the planner's ubcgrades "recent section averages" lookup.
+#
+# Builds course_avg_cache(base, campus) from grades_prof_course (PAIR per-instructor rows) and
+# grades_sections (run-grades-importer.sh output): one average per term, picked the way
+# fetchAvgForBase() in planner.ts picks it from ubcgrades (the OVERALL row when the data has one, else
+# the plain mean of the section averages), then the mean over the course's last AVG_RECENT_YEARS
+# years on record. PAIR terms win over grades_sections for the same term.
+#
+#   python3 course_avg_cache.py            (DB_FILE, AVG_RECENT_YEARS=3)
+import os, time
+
+import db
+
+DB = db.db_file()
+RECENT_YEARS = int(os.environ.get("AVG_RECENT_YEARS", "3"))
+
+CAMPUS_SQL = """CASE WHEN UPPER(TRIM({c})) IN ('UBCV','V','VANCOUVER') THEN 'V'
+                     WHEN UPPER(TRIM({c})) IN ('UBCO','O','OKANAGAN') THEN 'O' END"""
+
+# ---- schema ----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS course_avg_cache(
+            base         TEXT NOT NULL,      -- 'CPSC 110', same form as planner.ts toBase()
+            campus       TEXT NOT NULL,      -- 'V' | 'O'
+            avg          REAL NOT NULL,
+            terms        INTEGER NOT NULL,   -- terms averaged
+            enrolled     INTEGER,
+            first_year   INTEGER,
+            last_year    INTEGER,
+            source       TEXT,               -- pair | grades | mixed
+            refreshed_at TEXT NOT NULL,      -- UTC time of the run that computed the row
+            UNIQUE(base, campus)
+        )""")
+
+def table_columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return {r[1] for r in cur.fetchall()}
+
+# ---- per-term averages -----------------------------------------------------
+def load_terms(cur):
+    cur.execute("DROP TABLE IF EXISTS temp.cac_terms")
+    cur.execute("""
+        CREATE TEMP TABLE cac_terms(
+            campus TEXT, subject TEXT, course TEXT, year INTEGER, session TEXT,
+            avg REAL, enrolled INTEGER, src TEXT,
+            PRIMARY KEY(campus, subject, course, year, session)
+        )""")
+
+    gpc = table_columns(cur, "grades_prof_course")
+    if gpc:
+        # rows are repeated per co-instructor, so collapse to sections first
+        cur.execute(f"""
+            INSERT OR IGNORE INTO cac_terms
+            WITH sec AS (
+                SELECT {CAMPUS_SQL.format(c="campus")} AS campus,
+                       UPPER(TRIM(subject)) AS subject, UPPER(TRIM(course)) AS course,
+                       year, UPPER(TRIM(COALESCE(session, ''))) AS session,
+                       UPPER(TRIM(section)) AS section, MAX(avg) AS avg, MAX(enrolled) AS enrolled
+                FROM grades_prof_course
+                WHERE avg IS NOT NULL AND year IS NOT NULL
+                GROUP BY 1, 2, 3, 4, 5, 6
+            )
+            SELECT campus, subject, course, year, session,
+                   COALESCE(MAX(CASE WHEN section = 'OVERALL' THEN avg END), AVG(avg)),
+                   COALESCE(MAX(CASE WHEN section = 'OVERALL' THEN enrolled END), SUM(enrolled)),
+                   'pair'
+            FROM sec
+            WHERE campus IS NOT NULL
+            GROUP BY campus, subject, course, year, session""")
+        print(f"[avg_cache] pair terms: {cur.rowcount}")
+
+    gs = table_columns(cur, "grades_sections")
+    if gs:
+        # importer layout carries subject/course; schema_grades.sql layout points at grades_courses
+        if "subject" in gs:
+            src = "grades_sections s"
+            subj, num = "s.subject", "s.course"
+        else:
+            src = "grades_sections s JOIN grades_courses c ON c.id = s.course_id"
+            subj, num = "c.subject", "c.number"
+        enrolled = "s.enrolled" if "enrolled" in gs else "NULL"
+        cur.execute(f"""
+            INSERT OR IGNORE INTO cac_terms
+            WITH sec AS (
+                SELECT {CAMPUS_SQL.format(c="s.campus")} AS campus,
+                       UPPER(TRIM({subj})) AS subject, UPPER(TRIM({num})) AS course,
+                       CAST(s.year AS INTEGER) AS year, UPPER(TRIM(COALESCE(s.session, ''))) AS session,
+                       UPPER(TRIM(s.section)) AS section, CAST(s.average AS REAL) AS avg, {enrolled} AS enrolled
+                FROM {src}
+                WHERE s.average IS NOT NULL AND s.average <> '' AND s.year IS NOT NULL
+            )
+            SELECT campus, subject, course, year, session,
+                   COALESCE(MAX(CASE WHEN section = 'OVERALL' THEN avg END), AVG(avg)),
+                   COALESCE(MAX(CASE WHEN section = 'OVERALL' THEN enrolled END), SUM(enrolled)),
+                   'grades'
+            FROM sec
+            WHERE campus IS NOT NULL
+            GROUP BY campus, subject, course, year, session""")
+        print(f"[avg_cache] grades_sections terms not already in pair: {cur.rowcount}")
+
+# ---- cache table -----------------------------------------------------------
+def refresh_cache(cur, recent_years=RECENT_YEARS):
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    cur.execute("DROP TABLE IF EXISTS temp.cac_new")
+    cur.execute("""
+        CREATE TEMP TABLE cac_new AS
+        WITH latest AS (
+            SELECT campus, subject, course, MAX(year) AS last_year
+            FROM cac_terms GROUP BY campus, subject, course
+        )
+        SELECT t.subject || ' ' || t.course AS base, t.campus AS campus,
+               CASE WHEN COUNT(*) = COUNT(CASE WHEN t.enrolled > 0 THEN 1 END)
+                    THEN SUM(t.avg * t.enrolled) / SUM(t.enrolled)
+                    ELSE AVG(t.avg) END AS avg,
+               COUNT(*) AS terms, SUM(t.enrolled) AS enrolled,
+               MIN(t.year) AS first_year, l.last_year AS last_year,
+               CASE WHEN MIN(t.src) = MAX(t.src) THEN MIN(t.src) ELSE 'mixed' END AS source
+        FROM cac_terms t
+        JOIN latest l ON l.campus = t.campus AND l.subject = t.subject AND l.course = t.course
+        WHERE t.year > l.last_year - ?
+          AND t.avg IS NOT NULL
+          AND t.subject GLOB '[A-Z][A-Z]*' AND LENGTH(t.subject) BETWEEN 2 AND 5
+          AND t.course GLOB '[0-9][0-9][0-9]*'
+        GROUP BY t.campus, t.subject, t.course""", (recent_years,))
+    cur.execute("CREATE INDEX temp.cac_new_key ON cac_new(base, campus)")
+
+    cur.execute("""
+        DELETE FROM course_avg_cache
+        WHERE NOT EXISTS (SELECT 1 FROM temp.cac_new n WHERE n.base = course_avg_cache.base AND n.campus = course_avg_cache.campus)""")
+    removed = cur.rowcount
+    cur.execute("""
+        INSERT INTO course_avg_cache(base, campus, avg, terms, enrolled, first_year, last_year, source, refreshed_at)
+        SELECT base, campus, avg, terms, enrolled, first_year, last_year, source, ? FROM temp.cac_new WHERE true
+        ON CONFLICT(base, campus) DO UPDATE SET
+            avg = excluded.avg, terms = excluded.terms, enrolled = excluded.enrolled,
+            first_year = excluded.first_year, last_year = excluded.last_year,
+            source = excluded.source, refreshed_at = excluded.refreshed_at""", (now,))
+    written = cur.rowcount
+    cur.execute("DROP TABLE temp.cac_new")
+    cur.execute("DROP TABLE temp.cac_terms")
+    return written, removed
+
+def main():
+    print(f"[db] {DB}")
+    con = db.connect(DB, "bulk")
+    try:
+        cur = con.cursor()
+        ensure_schema(cur)
+        t0 = time.perf_counter()
+        load_terms(cur)
+        written, removed = refresh_cache(cur)
+        con.commit()
+        print(f"[avg_cache] {written} (base, campus) rows written, {removed} removed, "
+              f"recent_years={RECENT_YEARS} in {time.perf_counter() - t0:.2f}s")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
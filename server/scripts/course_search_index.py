@@ -0,0 +1,153 @@
+# server/scripts/course_search_index.py
+# -*- coding: utf-8 -*-
+# Maintains course_search, an FTS5 trigram index over course codes, titles and prereq text, so
+# /api/search_base can do substring search without scanning every course.
+#
+# codes holds each id with its spelling variants ("MATH_V 101 MATH_V101 MATH 101 MATH101") so a
+# query matches with or without campus suffix and space. course_search_state keeps a content hash
+# per course; a refresh only rewrites rows whose hash moved and drops courses that are gone.
+#
+#   python3 course_search_index.py             refresh and report size/time
+#   python3 course_search_index.py --bench     also time sample queries against the current scans
+import argparse, hashlib, random, re, statistics, time
+
+import db
+
+DB = db.db_file()
+ID_RE = re.compile(r"^([A-Z]{2,5})(?:_([A-Z]))?\s+(\d{3}[A-Z]?)$")
+
+# ---- schema ----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute("""
+        CREATE VIRTUAL TABLE IF NOT EXISTS course_search USING fts5(
+            course_id UNINDEXED, base UNINDEXED, codes, title, prereq_text,
+            tokenize = 'trigram'
+        )""")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS course_search_state(
+            course_id TEXT PRIMARY KEY,
+            fts_rowid INTEGER NOT NULL,
+            hash      TEXT NOT NULL
+        )""")
+
+def code_variants(cid):
+    cid = cid.strip().upper()
+    m = ID_RE.match(cid)
+    if not m:
+        return cid, cid
+    subj, campus, num = m.groups()
+    forms = [cid, cid.replace(" ", "")]
+    if campus:
+        forms += [f"{subj} {num}", f"{subj}{num}"]
+    return f"{subj} {num}", " ".join(dict.fromkeys(forms))
+
+# ---- refresh ---------------------------------------------------------------
+def refresh(con):
+    cur = con.cursor()
+    ensure_schema(cur)
+    cur.execute("SELECT course_id, fts_rowid, hash FROM course_search_state")
+    state = {cid: (rowid, h) for cid, rowid, h in cur.fetchall()}
+
+    cur.execute("SELECT id, title, prereq_text FROM courses")
+    seen, inserted, updated = set(), 0, 0
+    for cid, title, text in cur.fetchall():
+        seen.add(cid)
+        base, codes = code_variants(cid)
+        row = (cid, base, codes, title or "", text or "")
+        h = hashlib.sha1("\x1f".join(row).encode("utf-8")).hexdigest()
+        old = state.get(cid)
+        if old is not None and old[1] == h:
+            continue
+        if old is not None:
+            con.execute("DELETE FROM course_search WHERE rowid = ?", (old[0],))
+            updated += 1
+        else:
+            inserted += 1
+        rowid = con.execute("INSERT INTO course_search(course_id, base, codes, title, prereq_text) VALUES(?,?,?,?,?)", row).lastrowid
+        con.execute("INSERT INTO course_search_state(course_id, fts_rowid, hash) VALUES(?,?,?) "
+                    "ON CONFLICT(course_id) DO UPDATE SET fts_rowid = excluded.fts_rowid, hash = excluded.hash",
+                    (cid, rowid, h))
+
+    gone = [(cid, rowid) for cid, (rowid, _) in state.items() if cid not in seen]
+    for cid, rowid in gone:
+        con.execute("DELETE FROM course_search WHERE rowid = ?", (rowid,))
+        con.execute("DELETE FROM course_search_state WHERE course_id = ?", (cid,))
+    if inserted or updated or gone:
+        con.execute("INSERT INTO course_search(course_search) VALUES('optimize')")
+    con.commit()
+    return inserted, updated, len(gone), len(seen)
+
+def index_bytes(cur):
+    cur.execute("SELECT COALESCE(SUM(LENGTH(block)), 0) FROM course_search_data")
+    return cur.fetchone()[0]
+
+# ---- benchmark -------------------------------------------------------------
+# what /api/search_base runs (searchBasesFts() in server.ts): code hits first, then by base
+SEARCH_SQL = """SELECT DISTINCT base FROM course_search WHERE course_search MATCH ?
+                ORDER BY instr(codes, ?) = 0, base LIMIT 50"""
+
+def search(con, q):
+    return [r[0] for r in con.execute(SEARCH_SQL, (fts_query(q), q))]
+
+def fts_query(q):
+    # a quoted FTS5 string; trigram matches it as a substring of codes or title
+    return '{codes title} : "' + q.replace('"', '""') + '"'
+
+def bench(con, n=200, seed=1):
+    cur = con.cursor()
+    cur.execute("SELECT id, title FROM courses")
+    rows = cur.fetchall()
+    if not rows:
+        print("[search] no courses to benchmark")
+        return
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(n):
+        cid, title = rng.choice(rows)
+        src = cid if (rng.random() < 0.7 or not title) else title
+        k = rng.randint(3, min(8, max(3, len(src))))
+        i = rng.randint(0, max(0, len(src) - k))
+        queries.append(src[i:i + k].upper())
+
+    # what server.ts does today: every base in memory, substring filter, sort
+    bases = sorted({code_variants(cid)[0] for cid, _ in rows})
+
+    def time_it(fn):
+        lat = []
+        for q in queries:
+            t0 = time.perf_counter()
+            fn(q)
+            lat.append((time.perf_counter() - t0) * 1000)
+        lat.sort()
+        return statistics.median(lat), lat[int(len(lat) * 0.95) - 1]
+
+    results = {
+        "in-memory filter": time_it(lambda q: [b for b in bases if q in b][:50]),
+        "LIKE scan": time_it(lambda q: con.execute(
+            "SELECT id FROM courses WHERE UPPER(id) LIKE ? OR UPPER(title) LIKE ? LIMIT 50",
+            (f"%{q}%", f"%{q}%")).fetchall()),
+        "fts5 trigram": time_it(lambda q: search(con, q)),
+    }
+    print(f"[search] {len(queries)} queries over {len(rows)} courses ({len(bases)} bases)")
+    for name, (p50, p95) in results.items():
+        print(f"[search]   {name:<17} p50 {p50:.3f} ms  p95 {p95:.3f} ms")
+
+def main():
+    ap = argparse.ArgumentParser(description="Refresh the course_search FTS5 index")
+    ap.add_argument("--bench", action="store_true")
+    args = ap.parse_args()
+
+    print(f"[db] {DB}")
+    con = db.connect(DB, "bulk")
+    try:
+        t0 = time.perf_counter()
+        ins, upd, gone, total = refresh(con)
+        print(f"[search] {total} courses: {ins} inserted, {upd} updated, {gone} removed in "
+              f"{time.perf_counter() - t0:.2f}s; index {index_bytes(con.cursor()) / 1024:.0f} KiB")
+        if args.bench:
+            bench(con)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+# server/scripts/db.py
+# -*- coding: utf-8 -*-
+# How the Python ETL scripts open prereqs.db: path resolution, pragma profiles, long-lived
+# per-thread connections and chunked executemany with per-batch timing, plus the table helpers the
+# incremental scripts share (existence, fingerprints, generations, keyed run state).
+#
+#   DB_FILE        database path (default: server/prereqs.db next to this directory)
+#   DB_PROFILE     override the profile every connect() uses (bulk | serve | default)
+#   DB_PRAGMAS     extra pragmas on top of the profile, e.g. "cache_size=-65536,synchronous=NORMAL"
+#   DB_STMT_CACHE  compiled statements kept per connection (sqlite3 cached_statements)
+import os, sqlite3, threading, time
+from itertools import islice
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+DEFAULT_DB = os.path.abspath(os.path.join(HERE, "..", "prereqs.db"))
+STMT_CACHE = int(os.environ.get("DB_STMT_CACHE", "256"))
+
+# ---- pragma profiles -------------------------------------------------------
+# bulk  : ETL loads; a crash mid-run means rerunning the stage, so durability is traded for speed
+# serve : what the API process wants from the same file (concurrent readers, durable commits)
+PROFILES = {
+    "bulk": {
+        "journal_mode": "WAL",
+        "synchronous": "OFF",
+        "temp_store": "MEMORY",
+        "cache_size": -262144,        # KiB -> 256 MiB
+        "mmap_size": 3000000000,      # best-effort
+        "busy_timeout": 30000,
+    },
+    "serve": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "temp_store": "MEMORY",
+        "cache_size": -65536,
+        "mmap_size": 268435456,
+        "busy_timeout": 5000,
+        "foreign_keys": "ON",
+    },
+    "default": {},
+}
+
+def db_file(path=None):
+    # explicit path > $DB_FILE > server/prereqs.db
+    return os.path.abspath(path or os.environ.get("DB_FILE") or DEFAULT_DB)
+
+def attached_path(con, schema="main"):
+    # file behind an open connection ("" for :memory: / temp databases)
+    for _, name, path in con.execute("PRAGMA database_list"):
+        if name == schema:
+            return path or ""
+    return ""
+
+def _env_pragmas():
+    out = {}
+    for part in (os.environ.get("DB_PRAGMAS") or "").split(","):
+        if "=" in part:
+            k, v = part.split("=", 1)
+            out[k.strip()] = v.strip()
+    return out
+
+def apply_pragmas(con, profile="bulk", **overrides):
+    pragmas = dict(PROFILES[profile])
+    pragmas.update(_env_pragmas())
+    pragmas.update(overrides)
+    for k, v in pragmas.items():
+        try:
+            con.execute(f"PRAGMA {k}={v}")
+        except sqlite3.Error as e:
+            print(f"[db] PRAGMA {k}={v} ignored: {e}")
+    return pragmas
+
+def connect(path=None, profile="bulk", timeout=30.0, check_same_thread=True, **pragmas):
+    path = db_file(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    profile = os.environ.get("DB_PROFILE") or profile
+    con = sqlite3.connect(path, timeout=timeout, check_same_thread=check_same_thread, cached_statements=STMT_CACHE)
+    apply_pragmas(con, profile, **pragmas)
+    return con
+
+# ---- shared connections ----------------------------------------------------
+# sqlite3 keeps compiled statements per connection, keyed by SQL text, so the cache only pays off
+# when a connection outlives one call: shared() hands out one connection per (thread, path, profile)
+# and module-level SQL constants keep the text identical between calls.
+_local = threading.local()
+
+def shared(path=None, profile="bulk"):
+    cons = getattr(_local, "cons", None)
+    if cons is None:
+        cons = _local.cons = {}
+    key = (db_file(path), profile)
+    con = cons.get(key)
+    if con is None:
+        con = cons[key] = connect(key[0], profile)
+    return con
+
+def close_shared():
+    for con in (getattr(_local, "cons", None) or {}).values():
+        con.close()
+    _local.cons = {}
+
+# ---- bulk writes -----------------------------------------------------------
+def executemany_chunked(con, sql, rows, chunk=5000, label=None, commit=True, log_every=1):
+    # rows may be any iterable (generators stream); one transaction per chunk.
+    # With a label, every log_every-th batch prints its size, time and rate.
+    total, n_batches, secs = 0, 0, 0.0
+    it = iter(rows)
+    while True:
+        batch = list(islice(it, chunk))
+        if not batch:
+            break
+        t0 = time.perf_counter()
+        con.executemany(sql, batch)
+        if commit:
+            con.commit()
+        dt = time.perf_counter() - t0
+        total += len(batch)
+        n_batches += 1
+        secs += dt
+        if label and n_batches % log_every == 0:
+            rate = len(batch) / dt if dt > 0 else 0.0
+            print(f"[{label}] batch {n_batches}: {len(batch)} rows in {dt * 1000:.1f} ms ({rate:.0f} rows/s), total={total}")
+    if label and n_batches > 1:
+        print(f"[{label}] {total} rows in {n_batches} batches, {secs:.2f}s writing")
+    return total
+
+# ---- table generations -----------------------------------------------------
+# A reload that deletes and reinserts the same number of rows leaves COUNT(*) and MAX(rowid)
+# unchanged (no AUTOINCREMENT), so producers bump a per-table counter instead and consumers
+# compare that. import.ts bumps "courses" the same way (table_generation is also in src/schema.sql).
+GENERATION_SCHEMA = """CREATE TABLE IF NOT EXISTS table_generation(
+                           name       TEXT PRIMARY KEY,
+                           generation INTEGER NOT NULL,
+                           updated_at REAL
+                       )"""
+
+def bump_generation(con, table, commit=True):
+    con.execute(GENERATION_SCHEMA)
+    con.execute("""INSERT INTO table_generation(name, generation, updated_at) VALUES (?, 1, ?)
+                   ON CONFLICT(name) DO UPDATE SET generation=generation+1, updated_at=excluded.updated_at""",
+                (table, time.time()))
+    if commit:
+        con.commit()
+    return generation(con, table)
+
+def generation(con, table):
+    # 0 when the producer never ran with generation tracking
+    try:
+        r = con.execute("SELECT generation FROM table_generation WHERE name=?", (table,)).fetchone()
+    except sqlite3.OperationalError:
+        return 0
+    return int(r[0]) if r else 0
+
+# ---- shared ETL helpers ----------------------------------------------------
+def table_exists(cur, name, views=True):
+    kinds = ("table", "view") if views else ("table",)
+    r = cur.execute(f"SELECT 1 FROM sqlite_master WHERE name=? AND type IN ({','.join('?' * len(kinds))})",
+                    (name, *kinds)).fetchone()
+    return r is not None
+
+def table_fingerprint(cur, table, gen_of=None):
+    # None if the table is missing. COUNT/MAX(rowid) catches appends from any writer; the generation
+    # of `gen_of` (default: the table itself) catches a same-size DELETE+reload, which leaves both
+    # unchanged without AUTOINCREMENT
+    if not table_exists(cur, table):
+        return None
+    try:
+        n, mx = cur.execute(f"SELECT COUNT(*), MAX(rowid) FROM {table}").fetchone()
+    except sqlite3.OperationalError:
+        n, mx = cur.execute(f"SELECT COUNT(*), NULL FROM {table}").fetchone()   # views have no rowid
+    con = cur if isinstance(cur, sqlite3.Connection) else cur.connection
+    return f"g{generation(con, gen_of or table)}:{n}:{mx}"
+
+# what each incremental script remembers between runs, one (scope, key) row per fact
+STATE_SCHEMA = """CREATE TABLE IF NOT EXISTS etl_state(
+                      scope TEXT NOT NULL,
+                      key   TEXT NOT NULL,
+                      value TEXT,
+                      PRIMARY KEY(scope, key)
+                  )"""
+
+def ensure_state(cur, scope, legacy_table=None):
+    # legacy_table: the per-script key/value table this scope used to live in; its rows are carried
+    # over once so the first run after the move is not a full rebuild
+    cur.execute(STATE_SCHEMA)
+    if legacy_table and table_exists(cur, legacy_table, views=False):
+        cur.execute(f"INSERT OR IGNORE INTO etl_state(scope, key, value) SELECT ?, key, value FROM {legacy_table}", (scope,))
+        cur.execute(f"DROP TABLE {legacy_table}")
+
+def get_state(cur, scope, key, default=None):
+    r = cur.execute("SELECT value FROM etl_state WHERE scope=? AND key=?", (scope, key)).fetchone()
+    return r[0] if r else default
+
+def set_state(cur, scope, key, value):
+    # None removes the key
+    if value is None:
+        cur.execute("DELETE FROM etl_state WHERE scope=? AND key=?", (scope, key))
+        return
+    cur.execute("""INSERT INTO etl_state(scope, key, value) VALUES(?,?,?)
+                   ON CONFLICT(scope, key) DO UPDATE SET value=excluded.value""", (scope, key, str(value)))
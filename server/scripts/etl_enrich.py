@@ -1,11 +1,21 @@
 #!/usr/bin/env python3
-import os, sys, csv, sqlite3, re
+import os, sys, csv, io, sqlite3, re, tarfile, time, zipfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from typing import Optional, List, Set, Dict, Tuple
 
-DB_PATH   = os.environ.get("DB_FILE", "/Users/mohammadaliabedian/IdeaProjects/prereqvv/server/prereqs.db")
+import db
+import identity
+
+DB_PATH   = db.db_file()
 PAIR_ROOT = os.environ.get("PAIR_ROOT", "/Users/mohammadaliabedian/Downloads/ubc-pair-grade-data-master")
 RMP_CSV   = os.environ.get("RMP_CSV", "ubc_professors_ratings.csv")
+# PAIR_ROOT may also be the dataset archive (.zip / .tar.gz / .tgz / .tar); members are read in place.
+# PAIR_WORKERS > 1 parses CSVs in that many processes, PAIR_BATCH_FILES per task.
+PAIR_WORKERS     = int(os.environ.get("PAIR_WORKERS", "1"))
+PAIR_BATCH_FILES = int(os.environ.get("PAIR_BATCH_FILES", "64"))
+PAIR_ARCHIVES    = (".zip", ".tar.gz", ".tgz", ".tar")
 
 REQ_SUBJECT_KEYS: Set[str] = {"subject","dept","department"}
 REQ_COURSE_KEYS:  Set[str] = {"course","number","catalog","catalog_number"}
@@ -64,37 +74,46 @@ def columns_set(cur: sqlite3.Cursor, table: str) -> Set[str]:
     except sqlite3.OperationalError:
         return set()
 
+# the one rmp_professors schema: rmp_import.py only writes ubc_professors_ratings.csv and
+# `etl_enrich.py rmp` is the only loader
+RMP_PROFESSORS_DDL = """
+                    CREATE TABLE rmp_professors(
+                                                   legacy_id TEXT PRIMARY KEY,
+                                                   first_name TEXT,
+                                                   last_name TEXT,
+                                                   department TEXT,
+                                                   avg_rating REAL,
+                                                   num_ratings INTEGER,
+                                                   avg_difficulty REAL,
+                                                   would_take_again_percent REAL,
+                                                   url TEXT
+                    )"""
+RMP_PROFESSORS_COLS = ("legacy_id","first_name","last_name","department","avg_rating","num_ratings","avg_difficulty","would_take_again_percent","url")
+# older spellings: rmp_import.py used to create the table with an id PK, would_take_again_pct and rmp_url
+RMP_PROFESSORS_ALIASES = {"legacy_id": ("legacy_id","id"), "would_take_again_percent": ("would_take_again_percent","would_take_again_pct"), "url": ("url","rmp_url")}
+
 def ensure_rmp_professors_schema(con: sqlite3.Connection) -> None:
     cur = con.cursor()
     cur.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='rmp_professors'")
     exists = cur.fetchone() is not None
     if exists:
-        cols = columns_set(cur, "rmp_professors")
-        if "legacy_id" not in cols:
-            print("[migrate] replacing rmp_professors schema (missing legacy_id)")
+        info = get_table_columns(cur, "rmp_professors")
+        cols = {r[1] for r in info}
+        pk = [r[1] for r in info if r[5]]
+        if not set(RMP_PROFESSORS_COLS).issubset(cols) or pk != ["legacy_id"]:
+            print("[migrate] replacing rmp_professors schema (legacy_id key, would_take_again_percent, url)")
             cur.execute("ALTER TABLE rmp_professors RENAME TO rmp_professors_old")
             con.commit()
-            cur.execute("""
-                        CREATE TABLE rmp_professors(
-                                                       legacy_id TEXT PRIMARY KEY,
-                                                       first_name TEXT,
-                                                       last_name TEXT,
-                                                       department TEXT,
-                                                       avg_rating REAL,
-                                                       num_ratings INTEGER,
-                                                       avg_difficulty REAL,
-                                                       would_take_again_percent REAL,
-                                                       url TEXT
-                        )""")
+            cur.execute(RMP_PROFESSORS_DDL)
             cur.execute("CREATE INDEX IF NOT EXISTS idx_rmp_last_first ON rmp_professors(last_name, first_name)")
             con.commit()
-            old_cols = columns_set(cur, "rmp_professors_old")
-            can_migrate = {"id","first_name","last_name","department","avg_rating","num_ratings","avg_difficulty","would_take_again_percent","url"}.issubset(old_cols)
-            if can_migrate:
-                cur.execute("""
-                            INSERT INTO rmp_professors(legacy_id,first_name,last_name,department,avg_rating,num_ratings,avg_difficulty,would_take_again_percent,url)
-                            SELECT id,first_name,last_name,department,avg_rating,num_ratings,avg_difficulty,would_take_again_percent,url
+            src = [next((a for a in RMP_PROFESSORS_ALIASES.get(c, (c,)) if a in cols), "NULL") for c in RMP_PROFESSORS_COLS]
+            if src[0] != "NULL":
+                cur.execute(f"""
+                            INSERT OR REPLACE INTO rmp_professors({",".join(RMP_PROFESSORS_COLS)})
+                            SELECT {",".join(src)}
                             FROM rmp_professors_old
+                            WHERE {src[0]} IS NOT NULL AND TRIM({src[0]}) <> ''
                             """)
                 con.commit()
             cur.execute("DROP TABLE rmp_professors_old")
@@ -103,18 +122,7 @@ def ensure_rmp_professors_schema(con: sqlite3.Connection) -> None:
             cur.execute("CREATE INDEX IF NOT EXISTS idx_rmp_last_first ON rmp_professors(last_name, first_name)")
             con.commit()
     else:
-        cur.execute("""
-                    CREATE TABLE rmp_professors(
-                                                   legacy_id TEXT PRIMARY KEY,
-                                                   first_name TEXT,
-                                                   last_name TEXT,
-                                                   department TEXT,
-                                                   avg_rating REAL,
-                                                   num_ratings INTEGER,
-                                                   avg_difficulty REAL,
-                                                   would_take_again_percent REAL,
-                                                   url TEXT
-                    )""")
+        cur.execute(RMP_PROFESSORS_DDL)
         cur.execute("CREATE INDEX IF NOT EXISTS idx_rmp_last_first ON rmp_professors(last_name, first_name)")
         con.commit()
 
@@ -284,6 +292,29 @@ def walk_pair_csvs(root: str) -> List[Path]:
         out.append(p)
     return out
 
+def is_pair_csv(member: str) -> bool:
+    name = member.rsplit("/", 1)[-1].lower()
+    return name.endswith(".csv") and name != "directory_map.csv"
+
+def iter_pair_sources(root: str):
+    # (source name, raw bytes) per PAIR csv. An archive is read without extracting it: zip members
+    # by name, tar members in stream order (one pass over the compressed file). The name is
+    # "<archive>!<member path>", so campus inference and source_file see the member's path.
+    if os.path.isfile(root) and root.lower().endswith(PAIR_ARCHIVES):
+        if root.lower().endswith(".zip"):
+            with zipfile.ZipFile(root) as z:
+                for info in z.infolist():
+                    if not info.is_dir() and is_pair_csv(info.filename):
+                        yield f"{root}!{info.filename}", z.read(info)
+        else:
+            with tarfile.open(root, "r|*") as t:
+                for m in t:
+                    if m.isfile() and is_pair_csv(m.name):
+                        yield f"{root}!{m.name}", t.extractfile(m).read()
+        return
+    for p in walk_pair_csvs(root):
+        yield str(p), p.read_bytes()
+
 def parse_int(s):
     try: return int(float(str(s).strip()))
     except: return None
@@ -303,57 +334,76 @@ def infer_campus(headers_lc: Set[str], row_lc: Dict[str,str], fallback_from_path
     if "UBCV" in fp or "VANCOUVER" in fp: return "UBCV"
     return None
 
-def ingest_pair(con: sqlite3.Connection, root: str) -> int:
-    cur = con.cursor()
-    csv_paths = walk_pair_csvs(root)
-    if not csv_paths:
+GPC_INSERT = """
+             INSERT INTO grades_prof_course(campus,year,session,subject,course,section,title,instructor,enrolled,avg,source_file,instructor_id)
+             VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
+             """
+
+def pair_file_rows(name: str, data: bytes):
+    f = io.StringIO(data.decode("utf-8", errors="ignore"), newline="")
+    try:
+        reader = csv.DictReader(f)
+    except Exception:
+        return
+    headers_lc: Set[str] = set((h or "").strip().lower() for h in (reader.fieldnames or []))
+    if not (headers_lc & REQ_SUBJECT_KEYS):  return
+    if not (headers_lc & REQ_COURSE_KEYS):   return
+    if not (headers_lc & REQ_SECTION_KEYS):  return
+    if not (headers_lc & REQ_PROF_KEYS):     return
+    for row in reader:
+        dl = lower_keys(row)
+        subj_k   = pick_key(dl, REQ_SUBJECT_KEYS);   subj = (dl.get(subj_k) or "").strip().upper() if subj_k else ""
+        course_k = pick_key(dl, REQ_COURSE_KEYS);    course = (dl.get(course_k) or "").strip().upper() if course_k else ""
+        sect_k   = pick_key(dl, REQ_SECTION_KEYS);   sect = (dl.get(sect_k) or "").strip().upper() if sect_k else ""
+        prof_k   = pick_key(dl, REQ_PROF_KEYS);      prof_cell = (dl.get(prof_k) or "").strip() if prof_k else ""
+        avg_k    = pick_key(dl, AVG_KEYS);           avg = parse_float(dl.get(avg_k)) if avg_k else None
+        enr_k    = pick_key(dl, ENROL_KEYS);         enr = parse_int(dl.get(enr_k)) if enr_k else None
+        title_k  = pick_key(dl, TITLE_KEYS);         title = (dl.get(title_k) or "").strip() if title_k else ""
+        year_k   = pick_key(dl, YEAR_KEYS);          year = parse_int(dl.get(year_k)) if year_k else None
+        sess_k   = pick_key(dl, SESSION_KEYS);       sess = (dl.get(sess_k) or "").strip().upper() if sess_k else ""
+        if not subj or not course or not sect: continue
+        campus = infer_campus(headers_lc, dl, name)
+        instructors = split_professors(prof_cell) or [""]
+        for instr in instructors:
+            yield (campus,year,sess,subj,course,sect,title,instr,enr,avg,name,None)  # instructor_id=NULL
+
+def _pair_batch_rows(batch):
+    # worker side of iter_pair_rows: parse a batch of (name, bytes) into row tuples
+    return [r for name, data in batch for r in pair_file_rows(name, data)]
+
+def iter_pair_rows(sources, workers: int = 1):
+    # rows in source order either way; with workers, at most workers*2 batches are in flight
+    if workers <= 1:
+        for name, data in sources:
+            yield from pair_file_rows(name, data)
+        return
+    with ProcessPoolExecutor(workers) as pool:
+        pending, batch = deque(), []
+        for src in sources:
+            batch.append(src)
+            if len(batch) >= PAIR_BATCH_FILES:
+                pending.append(pool.submit(_pair_batch_rows, batch))
+                batch = []
+                if len(pending) >= workers * 2:
+                    yield from pending.popleft().result()
+        if batch:
+            pending.append(pool.submit(_pair_batch_rows, batch))
+        while pending:
+            yield from pending.popleft().result()
+
+def ingest_pair(con: sqlite3.Connection, root: str, workers: int = PAIR_WORKERS) -> int:
+    files = [0]
+    def counted():
+        for src in iter_pair_sources(root):
+            files[0] += 1
+            yield src
+    t0 = time.perf_counter()
+    n = db.executemany_chunked(con, GPC_INSERT, iter_pair_rows(counted(), workers), chunk=2000, label="pair", log_every=25)
+    if not files[0]:
         print("[pair] no csv files found via PAIR_ROOT")
         return 0
-    total = 0
-    batch: List[Tuple] = []
-    BATCH = 2000
-    for path in csv_paths:
-        with path.open(newline="", encoding="utf-8", errors="ignore") as f:
-            try:
-                reader = csv.DictReader(f)
-            except Exception:
-                continue
-            headers_lc: Set[str] = set((h or "").strip().lower() for h in (reader.fieldnames or []))
-            if not (headers_lc & REQ_SUBJECT_KEYS):  continue
-            if not (headers_lc & REQ_COURSE_KEYS):   continue
-            if not (headers_lc & REQ_SECTION_KEYS):  continue
-            if not (headers_lc & REQ_PROF_KEYS):     continue
-            for row in reader:
-                dl = lower_keys(row)
-                subj_k   = pick_key(dl, REQ_SUBJECT_KEYS);   subj = (dl.get(subj_k) or "").strip().upper() if subj_k else ""
-                course_k = pick_key(dl, REQ_COURSE_KEYS);    course = (dl.get(course_k) or "").strip().upper() if course_k else ""
-                sect_k   = pick_key(dl, REQ_SECTION_KEYS);   sect = (dl.get(sect_k) or "").strip().upper() if sect_k else ""
-                prof_k   = pick_key(dl, REQ_PROF_KEYS);      prof_cell = (dl.get(prof_k) or "").strip() if prof_k else ""
-                avg_k    = pick_key(dl, AVG_KEYS);           avg = parse_float(dl.get(avg_k)) if avg_k else None
-                enr_k    = pick_key(dl, ENROL_KEYS);         enr = parse_int(dl.get(enr_k)) if enr_k else None
-                title_k  = pick_key(dl, TITLE_KEYS);         title = (dl.get(title_k) or "").strip() if title_k else ""
-                year_k   = pick_key(dl, YEAR_KEYS);          year = parse_int(dl.get(year_k)) if year_k else None
-                sess_k   = pick_key(dl, SESSION_KEYS);       sess = (dl.get(sess_k) or "").strip().upper() if sess_k else ""
-                if not subj or not course or not sect: continue
-                campus = infer_campus(headers_lc, dl, str(path))
-                instructors = split_professors(prof_cell) or [""]
-                for instr in instructors:
-                    batch.append((campus,year,sess,subj,course,sect,title,instr,enr,avg,str(path),None))  # instructor_id=NULL
-                    if len(batch) >= BATCH:
-                        cur.executemany("""
-                                        INSERT INTO grades_prof_course(campus,year,session,subject,course,section,title,instructor,enrolled,avg,source_file,instructor_id)
-                                        VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-                                        """, batch)
-                        con.commit()
-                        total += len(batch); batch = []
-    if batch:
-        cur.executemany("""
-                        INSERT INTO grades_prof_course(campus,year,session,subject,course,section,title,instructor,enrolled,avg,source_file,instructor_id)
-                        VALUES(?,?,?,?,?,?,?,?,?,?,?,?)
-                        """, batch)
-        con.commit()
-        total += len(batch)
-    return total
+    print(f"[pair] {files[0]} csv files, {n} rows in {time.perf_counter() - t0:.2f}s (workers={max(1, workers)})")
+    return n
 
 def rebuild_summary(con: sqlite3.Connection) -> None:
     cur = con.cursor()
@@ -373,46 +423,12 @@ def rebuild_summary(con: sqlite3.Connection) -> None:
     con.commit()
 
 def auto_match_instructors_to_rmp(con: sqlite3.Connection) -> int:
-    cur = con.cursor()
-    cur.execute("SELECT legacy_id, first_name, last_name FROM rmp_professors")
-    rmp = cur.fetchall()
-    idx: Dict[str, Dict[str, List[str]]] = {}
-    for legacy, first, last in rmp:
-        last_k = (last or "").strip().lower()
-        fi = ((first or "").strip().lower()[:1] or "")
-        if last_k:
-            idx.setdefault(last_k, {}).setdefault(fi, []).append(legacy)
-    cur.execute("SELECT DISTINCT instructor FROM grades_prof_course WHERE instructor IS NOT NULL AND TRIM(instructor) <> ''")
-    instructors = [row[0] for row in cur.fetchall()]
-    upserts: List[Tuple[str,str]] = []
-    for name in instructors:
-        n = name.strip()
-        parts = n.split()
-        if len(parts) >= 2:
-            last = parts[-1].lower()
-            first = parts[0].lower()
-            fi = first[:1]
-            cand = idx.get(last, {}).get(fi, [])
-            if len(cand) == 1:
-                upserts.append((n, cand[0]))
-    if upserts:
-        cur.executemany("""
-                        INSERT INTO rmp_instructor_map(instructor, legacy_id)
-                        VALUES(?,?)
-                            ON CONFLICT(instructor) DO UPDATE SET legacy_id=excluded.legacy_id
-                        """, upserts)
-        con.commit()
-    # apply to grades_prof_course
-    cur.execute("""
-                UPDATE grades_prof_course
-                SET instructor_id = (
-                    SELECT legacy_id FROM rmp_instructor_map m
-                    WHERE m.instructor = grades_prof_course.instructor
-                )
-                WHERE instructor_id IS NULL
-                """)
-    con.commit()
-    return len(upserts)
+    # exact / last-name+initial / fuzzy resolution shared with backfill_empty_tables.py;
+    # rmp_instructor_map and grades_prof_course.instructor_id are refreshed from instructor_identity
+    # for every matched name; unmatched names keep existing links unless IDENTITY_REBUILD=1
+    thr = float(os.environ.get("RMP_FUZZY_THRESHOLD", "0.85"))
+    identity.resolve_identities(con, threshold=thr)
+    return identity.apply_identities(con)
 
 def count_rows(cur: sqlite3.Cursor, table: str) -> int:
     try:
@@ -421,31 +437,40 @@ def count_rows(cur: sqlite3.Cursor, table: str) -> int:
     except sqlite3.OperationalError:
         return 0
 
+STEPS = ("rmp", "pair", "match")
+
 def main():
+    # etl_enrich.py [rmp] [pair] [match]; no arguments runs all three in that order.
+    # The pipeline runner (pipeline.py) calls them as separate stages so PAIR ingest need not
+    # wait for the RMP crawl.
+    steps = [a for a in sys.argv[1:] if a in STEPS] or list(STEPS)
     print(f"[paths] DB={os.path.abspath(DB_PATH)}")
     print(f"[paths] PAIR_ROOT={PAIR_ROOT}")
     print(f"[paths] RMP_CSV={RMP_CSV}")
 
-    con = sqlite3.connect(DB_PATH)
+    con = db.connect(DB_PATH, "bulk")
     ensure_schema(con)
 
-    upsert_rmp_professors(con, RMP_CSV)
+    if "rmp" in steps:
+        upsert_rmp_professors(con, RMP_CSV)
 
-    # (Re)build PAIR rows
-    cur = con.cursor()
-    cur.execute("DELETE FROM grades_prof_course")
-    con.commit()
-    rows = ingest_pair(con, PAIR_ROOT)
-    print(f"[pair] rebuilt grades_prof_course rows={rows}")
-    if rows == 0:
-        print("[pair] warning: no section rows ingested (check PAIR_ROOT)")
-
-    matched = auto_match_instructors_to_rmp(con)
-    print(f"[match] instructor name matches upserted: {matched}")
-
-    rebuild_summary(con)
+    if "pair" in steps:
+        # (Re)build PAIR rows
+        cur = con.cursor()
+        cur.execute("DELETE FROM grades_prof_course")
+        con.commit()
+        rows = ingest_pair(con, PAIR_ROOT)
+        db.bump_generation(con, "grades_prof_course")
+        print(f"[pair] rebuilt grades_prof_course rows={rows}")
+        if rows == 0:
+            print("[pair] warning: no section rows ingested (check PAIR_ROOT)")
+        rebuild_summary(con)
+        print("[summary] rows={}".format(rows))
+
+    if "match" in steps:
+        matched = auto_match_instructors_to_rmp(con)
+        print(f"[match] instructors resolved to an RMP profile: {matched}")
 
-    print("[summary] rows={}".format(rows))
     print("[ok] rmp_professors: {}".format(count_rows(con.cursor(), 'rmp_professors')))
     print("[ok] rmp_course_stats: {}".format(count_rows(con.cursor(), 'rmp_course_stats')))
     print("[ok] grades_prof_course: {}".format(count_rows(con.cursor(), 'grades_prof_course')))
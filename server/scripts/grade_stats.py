@@ -0,0 +1,223 @@
+# server/scripts/grade_stats.py
+# -*- coding: utf-8 -*-
+# Grade statistics for every (subject, course, instructor) group of grades_prof_course, computed in one
+# vectorized pass with numpy into grades_prof_course_stats.
+#
+#   load     the columns are fetched FETCH_ROWS at a time; strings become integer codes as they
+#            arrive, so memory is a few typed arrays (~40 bytes a row) plus the distinct strings,
+#            never the row tuples; rows are written back in chunks the same way
+#   group    rows are sorted once by (group, missing-avg, avg); per-group sums come from reduceat
+#            over the group boundaries and percentiles are gathered from the sorted averages
+#   terms    a second sort by (group, year, session) gives the per-term series the same way
+#
+# Groups are keyed like grades_prof_course_summary (instructor trimmed, blank -> '(unknown)'), but
+# a missing avg is left out instead of counted as 0. wmean / wvar weigh each row by its enrolment;
+# percentiles (numpy linear) are over the rows' averages.
+#
+#   python3 grade_stats.py            (DB_FILE, GRADE_STATS_FETCH_ROWS=50000)
+import json, os, time
+
+try:
+    import numpy as np
+except ImportError:  # optional: the stage reports and skips without it
+    np = None
+
+import db
+
+DB = db.db_file()
+FETCH_ROWS = int(os.environ.get("GRADE_STATS_FETCH_ROWS", "50000"))
+PERCENTILES = (10, 25, 50, 75, 90)
+
+# ---- load ------------------------------------------------------------------
+class Codes:
+    # string -> dense int code, first come first served
+    def __init__(self):
+        self.ix, self.values = {}, []
+
+    def code(self, s):
+        i = self.ix.get(s)
+        if i is None:
+            i = self.ix[s] = len(self.values)
+            self.values.append(s)
+        return i
+
+class GroupNames:
+    # group id -> (subject, course, instructor), decoded from the packed keys on demand
+    MASK = (1 << 21) - 1
+
+    def __init__(self, keys, subj, course, instr):
+        self.keys, self.subj, self.course, self.instr = keys, subj, course, instr
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __getitem__(self, gi):
+        k = int(self.keys[gi])
+        return self.subj[k >> 42], self.course[(k >> 21) & self.MASK], self.instr[k & self.MASK]
+
+def load(con):
+    # -> GroupNames, session strings, column arrays, row count
+    subj, course, instr, sessions = Codes(), Codes(), Codes(), Codes()
+    parts = {k: [] for k in ("key", "year", "sess", "enrolled", "avg")}
+    cur = con.execute("""
+        SELECT subject, course, COALESCE(NULLIF(TRIM(instructor), ''), '(unknown)'),
+               year, COALESCE(session, ''), enrolled, avg
+        FROM grades_prof_course""")
+    n = 0
+    while True:
+        rows = cur.fetchmany(FETCH_ROWS)
+        if not rows:
+            break
+        m = len(rows)
+        # three 21-bit string codes packed into one int64 group key
+        parts["key"].append(np.fromiter(((subj.code(r[0]) << 42) | (course.code(r[1]) << 21) | instr.code(r[2])
+                                         for r in rows), np.int64, m))
+        parts["year"].append(np.fromiter((-1 if r[3] is None else r[3] for r in rows), np.int32, m))
+        parts["sess"].append(np.fromiter((sessions.code(r[4]) for r in rows), np.int32, m))
+        parts["enrolled"].append(np.fromiter((np.nan if r[5] is None else r[5] for r in rows), np.float64, m))
+        parts["avg"].append(np.fromiter((np.nan if r[6] is None else r[6] for r in rows), np.float64, m))
+        n += m
+    if not n:
+        return None, sessions.values, {}, 0
+    cols = {k: np.concatenate(v) for k, v in parts.items()}
+    keys, grp = np.unique(cols.pop("key"), return_inverse=True)
+    cols["grp"] = grp.astype(np.int32)
+    return GroupNames(keys, subj.values, course.values, instr.values), sessions.values, cols, n
+
+# ---- stats -----------------------------------------------------------------
+def segment_starts(sorted_keys):
+    # start index of each run of equal keys in a sorted array
+    return np.flatnonzero(np.r_[True, sorted_keys[1:] != sorted_keys[:-1]])
+
+def group_stats(cols, n_groups):
+    # -> (row of each group in the arrays below, or -1), {field: per-group array}; needs >= 1 row
+    grp, avg, enr = cols["grp"], cols["avg"], cols["enrolled"]
+    has_avg = ~np.isnan(avg)
+    # missing averages sort last within their group, so the first n_avg of each run are the values
+    order = np.lexsort((avg, ~has_avg, grp))
+    g, a, ok = grp[order], avg[order], has_avg[order]
+    e = np.nan_to_num(enr[order], nan=0.0)
+    starts = segment_starts(g)
+
+    n_rows = np.diff(np.r_[starts, len(g)])
+    n_avg = np.add.reduceat(ok.astype(np.int64), starts)
+    a0 = np.where(ok, a, 0.0)
+    w = np.where(ok, e, 0.0)
+    sw = np.add.reduceat(w, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mean = np.where(n_avg > 0, np.add.reduceat(a0, starts) / n_avg, np.nan)
+        wmean = np.where(sw > 0, np.add.reduceat(w * a0, starts) / sw, np.nan)
+        # weighted population variance around each group's own wmean
+        dev = a0 - np.repeat(np.nan_to_num(wmean), n_rows)
+        wvar = np.where(sw > 0, np.add.reduceat(w * dev * dev, starts) / sw, np.nan)
+
+    top = (n_avg - 1).clip(min=0)
+    stats = {"n_sections": n_rows, "n_enrolled": np.add.reduceat(e, starts), "n_with_avg": n_avg,
+             "mean": mean, "wmean": wmean, "wvar": wvar,
+             "min_avg": np.where(n_avg > 0, a[starts], np.nan),
+             "max_avg": np.where(n_avg > 0, a[starts + top], np.nan)}
+    for q in PERCENTILES:
+        pos = top * (q / 100.0)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.minimum(lo + 1, top)
+        v = a[starts + lo] + (a[starts + hi] - a[starts + lo]) * (pos - lo)
+        stats[f"p{q}"] = np.where(n_avg > 0, v, np.nan)
+
+    at = np.full(n_groups, -1, np.int64)
+    at[g[starts]] = np.arange(len(starts))
+    return at, stats
+
+def term_stats(cols, sessions):
+    # per-term arrays in (group, year, session) order; needs >= 1 row
+    grp, year, sess, avg = cols["grp"], cols["year"], cols["sess"], cols["avg"]
+    rank_of = np.zeros(len(sessions), np.int64)
+    rank_of[sorted(range(len(sessions)), key=sessions.__getitem__)] = np.arange(len(sessions))
+    order = np.lexsort((rank_of[sess], year, grp))
+    g, y, s, a = grp[order], year[order], sess[order], avg[order]
+    e = np.nan_to_num(cols["enrolled"][order], nan=0.0)
+    key = (g.astype(np.int64) << 32) | ((y.astype(np.int64) + 1) << 8) | rank_of[s]
+    starts = segment_starts(key)
+
+    ok = ~np.isnan(a)
+    w = np.where(ok, e, 0.0)
+    sw = np.add.reduceat(w, starts)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        wm = np.where(sw > 0, np.add.reduceat(w * np.where(ok, a, 0.0), starts) / sw, np.nan)
+    return {"grp": g[starts], "year": y[starts], "sess": s[starts], "wmean": wm,
+            "enrolled": np.add.reduceat(e, starts), "n": np.diff(np.r_[starts, len(g)])}
+
+# ---- table -----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS grades_prof_course_stats(
+            subject    TEXT NOT NULL,
+            course     TEXT NOT NULL,
+            instructor TEXT NOT NULL,
+            n_sections INTEGER NOT NULL,
+            n_enrolled INTEGER NOT NULL,
+            n_with_avg INTEGER NOT NULL,
+            mean       REAL,              -- of the rows that have an avg
+            wmean      REAL,              -- enrolment-weighted
+            wvar       REAL,
+            p10 REAL, p25 REAL, p50 REAL, p75 REAL, p90 REAL,
+            min_avg REAL, max_avg REAL,
+            terms_json TEXT NOT NULL,     -- [[year, session, wmean, enrolled, n_sections], ...]
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY(subject, course, instructor)
+        )""")
+
+STAT_FIELDS = ("n_sections", "n_enrolled", "n_with_avg", "mean", "wmean", "wvar",
+               "p10", "p25", "p50", "p75", "p90", "min_avg", "max_avg")
+
+def rows_out(groups, sessions, at, stats, terms, now, chunk=5000):
+    # one row per group, built chunk by chunk so only `chunk` groups exist as Python objects at a time
+    order = np.flatnonzero(at >= 0)
+    order = order[np.argsort(at[order])]          # group ids in the order of the stats arrays
+    t_lo = np.searchsorted(terms["grp"], order, "left")
+    t_hi = np.searchsorted(terms["grp"], order, "right")
+    for c0 in range(0, len(order), chunk):
+        cols = [stats[f][c0:c0 + chunk].tolist() for f in STAT_FIELDS]
+        lo, hi = int(t_lo[c0]), int(t_hi[min(c0 + chunk, len(order)) - 1])
+        ty, ts, tw, te, tn = (terms[k][lo:hi].tolist() for k in ("year", "sess", "wmean", "enrolled", "n"))
+        for k, gi in enumerate(order[c0:c0 + chunk].tolist()):
+            a, b = int(t_lo[c0 + k]) - lo, int(t_hi[c0 + k]) - lo
+            series = [[None if ty[t] < 0 else ty[t], sessions[ts[t]], None if tw[t] != tw[t] else round(tw[t], 4),
+                       int(te[t]), tn[t]] for t in range(a, b)]
+            vals = [None if isinstance(v, float) and v != v else v for v in (col[k] for col in cols)]
+            vals[1] = int(vals[1])
+            yield (*groups[gi], *vals, json.dumps(series), now)
+
+def main():
+    print(f"[db] {DB}")
+    if np is None:
+        print("[grade_stats] numpy is not installed; skipping")
+        return
+    con = db.connect(DB, "bulk")
+    try:
+        cur = con.cursor()
+        ensure_schema(cur)
+        t0 = time.perf_counter()
+        groups, sessions, cols, n = load(con)
+        if not n:
+            cur.execute("DELETE FROM grades_prof_course_stats")
+            con.commit()
+            print("[grade_stats] grades_prof_course is empty")
+            return
+        t1 = time.perf_counter()
+        at, stats = group_stats(cols, len(groups))
+        terms = term_stats(cols, sessions)
+        t2 = time.perf_counter()
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        cur.execute("DELETE FROM grades_prof_course_stats")
+        placeholders = ",".join("?" * (len(STAT_FIELDS) + 5))
+        written = db.executemany_chunked(con, f"INSERT INTO grades_prof_course_stats VALUES({placeholders})",
+                                         rows_out(groups, sessions, at, stats, terms, now), chunk=5000, commit=False)
+        con.commit()
+        mb = sum(a.nbytes for a in cols.values()) / 1e6
+        print(f"[grade_stats] {n} rows ({mb:.1f} MB of arrays) -> {written} groups: "
+              f"load {t1 - t0:.2f}s, stats {t2 - t1:.2f}s, write {time.perf_counter() - t2:.2f}s")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
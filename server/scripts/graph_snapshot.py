@@ -0,0 +1,210 @@
+# server/scripts/graph_snapshot.py
+# -*- coding: utf-8 -*-
+# Writes the course graph (courses + edges) as one binary file the API can load at startup instead of
+# scanning courses and querying edges per node. Read by src/graph_snapshot.ts.
+#
+# Layout (little-endian, every section 8-byte aligned, offsets from the start of the file):
+#   header   magic "PRQG", format, header size, generation (ms since epoch), counts, section offsets,
+#            crc32 of everything after the header
+#   strings  u32 offsets[n_strings + 1] + utf-8 blob; node i is string i, then edge kinds, then group ids
+#   flags    u8[n_nodes]            bit 0: the node is a row of courses
+#   in CSR   u32 offs[n_nodes + 1], u32 src[n_edges], u8 kind[n_edges], u32 group[n_edges]
+#            edges grouped by target (what the graph walk asks for); group NO_GROUP when NULL
+#   out CSR  the same grouped by source, holding the target
+#
+# The file is written to a temp name, fsynced and renamed over the old one, so a reader sees either
+# the previous snapshot or the new one and a reindex only has to reopen the path.
+#
+#   python3 graph_snapshot.py [--out PATH] [--check]      (DB_FILE, GRAPH_SNAPSHOT)
+import argparse, mmap, os, struct, sys, tempfile, time, zlib
+from array import array
+
+import db
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+DB = db.db_file()
+SNAPSHOT = os.environ.get("GRAPH_SNAPSHOT", os.path.join(HERE, "..", "graph.snapshot"))
+
+MAGIC = b"PRQG"
+FORMAT = 1
+NO_GROUP = 0xFFFFFFFF
+SECTIONS = ("str_offs", "str_data", "flags",
+            "in_offs", "in_src", "in_kind", "in_group",
+            "out_offs", "out_dst", "out_kind", "out_group")
+HEADER = struct.Struct("<4sIIQIIII" + "Q" * len(SECTIONS) + "I4x")
+
+def _u32(values):
+    a = array("I", values)
+    assert a.itemsize == 4
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+# ---- build -----------------------------------------------------------------
+def load_graph(con):
+    cur = con.cursor()
+    cur.execute("SELECT id FROM courses")
+    courses = {r[0] for r in cur.fetchall()}
+    cur.execute("SELECT source_id, target_id, kind, group_id FROM edges ORDER BY id")
+    edges = cur.fetchall()
+    return courses, edges
+
+def csr(n, edges, key, other):
+    # stable counting sort by key: edges keep their table order within a node, as the SQL walk returns them
+    offs = [0] * (n + 1)
+    for e in edges:
+        offs[key(e) + 1] += 1
+    for i in range(n):
+        offs[i + 1] += offs[i]
+    pos = offs[:-1]
+    order = [0] * len(edges)
+    for j, e in enumerate(edges):
+        k = key(e)
+        order[pos[k]] = j
+        pos[k] += 1
+    return offs, [other(edges[j]) for j in order], order
+
+def build(courses, edges):
+    nodes = sorted(courses | {e[0] for e in edges} | {e[1] for e in edges})
+    node_ix = {n: i for i, n in enumerate(nodes)}
+    kinds = sorted({e[2] for e in edges})
+    kind_ix = {k: i for i, k in enumerate(kinds)}
+    groups = sorted({e[3] for e in edges if e[3] is not None})
+    strings = nodes + kinds + groups
+    group_ix = {g: len(nodes) + len(kinds) + i for i, g in enumerate(groups)}
+    if len(kinds) > 255:
+        raise ValueError(f"{len(kinds)} edge kinds do not fit in u8")
+
+    # (src, tgt, kind, group) as integers
+    ie = [(node_ix[s], node_ix[t], kind_ix[k], group_ix.get(g, NO_GROUP)) for s, t, k, g in edges]
+    in_offs, in_src, in_order = csr(len(nodes), ie, lambda e: e[1], lambda e: e[0])
+    out_offs, out_dst, out_order = csr(len(nodes), ie, lambda e: e[0], lambda e: e[1])
+
+    blob = bytearray()
+    str_offs = [0]
+    for s in strings:
+        blob += s.encode("utf-8")
+        str_offs.append(len(blob))
+
+    sections = {
+        "str_offs": _u32(str_offs),
+        "str_data": bytes(blob),
+        "flags": bytes(1 if n in courses else 0 for n in nodes),
+        "in_offs": _u32(in_offs),
+        "in_src": _u32(in_src),
+        "in_kind": bytes(ie[j][2] for j in in_order),
+        "in_group": _u32(ie[j][3] for j in in_order),
+        "out_offs": _u32(out_offs),
+        "out_dst": _u32(out_dst),
+        "out_kind": bytes(ie[j][2] for j in out_order),
+        "out_group": _u32(ie[j][3] for j in out_order),
+    }
+    counts = (len(nodes), len(ie), len(strings), len(kinds))
+    return counts, sections
+
+def encode(counts, sections, generation):
+    offsets, body = {}, bytearray()
+    pos = HEADER.size
+    for name in SECTIONS:
+        pad = (-pos) % 8
+        body += b"\0" * pad
+        pos += pad
+        offsets[name] = pos
+        body += sections[name]
+        pos += len(sections[name])
+    header = HEADER.pack(MAGIC, FORMAT, HEADER.size, generation, *counts,
+                         *(offsets[n] for n in SECTIONS), zlib.crc32(body))
+    return header + bytes(body)
+
+def write_atomic(path, data):
+    path = os.path.abspath(path)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".graph-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp, 0o644)   # mkstemp creates 0600; the API may run as another user
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+# ---- read (checks and tooling; the API has its own reader) -----------------
+def open_snapshot(path):
+    with open(path, "rb") as f:
+        mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    h = HEADER.unpack_from(mm, 0)
+    magic, fmt, hsize, generation, n_nodes, n_edges, n_strings, n_kinds = h[:8]
+    if magic != MAGIC or fmt != FORMAT or hsize != HEADER.size:
+        raise ValueError(f"{path}: not a format-{FORMAT} graph snapshot")
+    off = dict(zip(SECTIONS, h[8:8 + len(SECTIONS)]))
+    crc = h[-1]
+    if zlib.crc32(memoryview(mm)[HEADER.size:]) != crc:
+        raise ValueError(f"{path}: checksum mismatch")
+    mv = memoryview(mm)
+    def u32(name, n):
+        return mv[off[name]:off[name] + 4 * n].cast("I")
+    def u8(name, n):
+        return mv[off[name]:off[name] + n]
+    str_offs = u32("str_offs", n_strings + 1)
+    data = mv[off["str_data"]:off["str_data"] + str_offs[n_strings]]
+    strings = [bytes(data[str_offs[i]:str_offs[i + 1]]).decode("utf-8") for i in range(n_strings)]
+    return {
+        "generation": generation, "n_nodes": n_nodes, "n_edges": n_edges, "strings": strings,
+        "index": {strings[i]: i for i in range(n_nodes)},
+        "kinds": strings[n_nodes:n_nodes + n_kinds], "flags": u8("flags", n_nodes),
+        "in_offs": u32("in_offs", n_nodes + 1), "in_src": u32("in_src", n_edges),
+        "in_kind": u8("in_kind", n_edges), "in_group": u32("in_group", n_edges),
+        "out_offs": u32("out_offs", n_nodes + 1), "out_dst": u32("out_dst", n_edges),
+        "out_kind": u8("out_kind", n_edges), "out_group": u32("out_group", n_edges),
+        "_mm": mm,
+    }
+
+def edges_into(snap, node):
+    # (source_id, target_id, kind, group_id) rows for target node, as SELECT ... WHERE target_id = ?
+    s = snap["strings"]
+    i = snap["index"][node]
+    for j in range(snap["in_offs"][i], snap["in_offs"][i + 1]):
+        g = snap["in_group"][j]
+        yield s[snap["in_src"][j]], node, snap["kinds"][snap["in_kind"][j]], None if g == NO_GROUP else s[g]
+
+def check(con, snap):
+    # every node's incoming edges against the edges table, in table order -> (nodes checked, mismatched)
+    cur = con.cursor()
+    cur.execute("SELECT COUNT(*) FROM edges")
+    bad = int(cur.fetchone()[0] != snap["n_edges"])
+    for node in snap["index"]:
+        cur.execute("SELECT source_id, target_id, kind, group_id FROM edges WHERE target_id = ? ORDER BY id", (node,))
+        if list(edges_into(snap, node)) != cur.fetchall():
+            bad += 1
+    return len(snap["index"]), bad
+
+def main():
+    ap = argparse.ArgumentParser(description="Write the course graph snapshot")
+    ap.add_argument("--out", default=SNAPSHOT)
+    ap.add_argument("--check", action="store_true", help="read the file back and compare with the edges table")
+    args = ap.parse_args()
+
+    print(f"[db] {DB}")
+    con = db.connect(DB, "serve")
+    try:
+        t0 = time.perf_counter()
+        courses, edges = load_graph(con)
+        counts, sections = build(courses, edges)
+        data = encode(counts, sections, int(time.time() * 1000))
+        write_atomic(args.out, data)
+        print(f"[graph] {counts[0]} nodes, {counts[1]} edges, {len(data)} bytes -> {os.path.abspath(args.out)} "
+              f"in {time.perf_counter() - t0:.2f}s")
+        if args.check:
+            n, bad = check(con, open_snapshot(args.out))
+            print(f"[graph] check: {n} nodes, {bad} mismatched")
+            if bad:
+                raise SystemExit(1)
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,678 @@
+# server/scripts/identity.py
+# -*- coding: utf-8 -*-
+# Instructor <-> RMP identity resolution shared by etl_enrich.py and backfill_empty_tables.py.
+#
+# One pass over the distinct instructor names in grades_prof_course:
+#   exact     normalized name equals an RMP name                         confidence 1.0
+#   initial   unique RMP row with the same last name and first initial   0.85 + 0.1 * similarity
+#   fuzzy     best q-gram/LCS candidate at or above the threshold        similarity, minus a penalty
+#                                                                       when a different professor is
+#                                                                       within AMBIGUITY_MARGIN
+# The result lands in instructor_identity (one row per name, with method and candidate count as
+# provenance); rmp_instructor_map, instructor_rmp_match and grades_prof_course.instructor_id are
+# refreshed from it by apply_identities() on every run (unmatched names keep their links unless
+# IDENTITY_REBUILD=1).
+import os, re, math, pickle, time, uuid
+from collections import Counter
+from itertools import chain
+from concurrent.futures import ProcessPoolExecutor
+
+import db
+
+try:
+    import numpy as np
+except ImportError:  # optional: without it names are resolved one at a time (resolve_one)
+    np = None
+
+AMBIGUITY_MARGIN = 0.02
+AMBIGUITY_PENALTY = 0.05
+
+# ---- names -----------------------------------------------------------------
+def norm_name(s: str) -> str:
+    s = (s or "").strip().lower()
+    s = re.sub(r"[.,'`\"()\-]", " ", s)
+    s = re.sub(r"\s+", " ", s)
+    return s.strip()
+
+def tokenize(s: str):
+    return tuple(t for t in norm_name(s).split() if t)
+
+def last_initial_key(s: str):
+    toks = tokenize(s)
+    if len(toks) < 2:
+        return None
+    return (toks[-1], toks[0][:1])
+
+# ---- q-gram candidate index + bounded LCS kernel ----------------------------
+# Every name is compared in two forms: the normalized string and its sorted tokens.
+# Similarity is the indel ratio 2*LCS/(la+lb); it is never below difflib's SequenceMatcher.ratio()
+# for the same pair.
+Q = 3
+_PAD = "#" * (Q - 1)
+
+def name_forms(s: str):
+    return (norm_name(s), " ".join(sorted(tokenize(s))))
+
+def qgram_set(s: str):
+    # padded q-grams as a set; a repeated gram gets an occurrence suffix so set overlap == multiset overlap
+    p = _PAD + s + _PAD
+    out, seen = set(), {}
+    for i in range(len(p) - Q + 1):
+        g = p[i:i + Q]
+        n = seen.get(g, 0)
+        seen[g] = n + 1
+        out.add(g if n == 0 else f"{g}\x00{n}")
+    return frozenset(out)
+
+def build_qgram_index(rmp_rows):
+    # per form k (0 = normalized, 1 = sorted tokens):
+    #   forms[idx][k], postings[k][gram] = [idx, ...], by_len[k][len] = [idx, ...]
+    index = {"forms": [], "postings": ({}, {}), "by_len": ({}, {})}
+    extend_qgram_index(index, rmp_rows)
+    return index
+
+def extend_qgram_index(index, rmp_rows):
+    # rows are appended, so existing idx values (and anything persisted against them) stay valid
+    forms, postings, by_len = index["forms"], index["postings"], index["by_len"]
+    for row in rmp_rows:
+        rname = row[1]
+        idx = len(forms)
+        fs = name_forms(rname)
+        forms.append(fs)
+        for k, f in enumerate(fs):
+            for g in qgram_set(f):
+                postings[k].setdefault(g, []).append(idx)
+            by_len[k].setdefault(len(f), []).append(idx)
+    return index
+
+def _max_indel(la: int, lb: int, t: float) -> int:
+    # 2*LCS/(la+lb) >= t  <=>  la+lb-2*LCS <= (1-t)*(la+lb)
+    return int((1.0 - t) * (la + lb) + 1e-9)
+
+def _min_shared(la: int, lb: int, t: float) -> int:
+    # an indel distance of d is an edit distance <= d, which destroys at most d*Q padded q-grams
+    return max(la, lb) + Q - 1 - _max_indel(la, lb, t) * Q
+
+def _len_bounds(la: int, t: float):
+    # 2*min(la,lb)/(la+lb) >= t
+    if t <= 0:
+        return 0, 1 << 30
+    return math.ceil(la * t / (2.0 - t) - 1e-9), math.floor(la * (2.0 - t) / t + 1e-9)
+
+def qgram_candidates(query_forms, index, threshold):
+    # returns {idx: shared grams} for every RMP row that can still reach threshold on either form.
+    # Shared-gram counts come from the posting lists only (C-level Counter), then the per-length
+    # count filter and length bounds drop rows that cannot reach threshold.
+    forms = index["forms"]
+    hits = {}
+    for k, qs in enumerate(query_forms):
+        la = len(qs)
+        if not la:
+            continue
+        lo, hi = _len_bounds(la, threshold)
+        lens = [lb for lb in index["by_len"][k] if lo <= lb <= hi]
+        if not lens:
+            continue
+        qg = qgram_set(qs)
+        need = {lb: _min_shared(la, lb, threshold) for lb in lens}
+        tmin = min(need.values())
+        postings = index["postings"][k]
+        if tmin <= 0:
+            # filter is vacuous for very short names / low thresholds: fall back to the length buckets
+            shared = Counter()
+            for lb in lens:
+                shared.update(dict.fromkeys(index["by_len"][k][lb], 0))
+            shared.update(chain.from_iterable(postings.get(g, ()) for g in qg))
+        else:
+            shared = Counter(chain.from_iterable(postings.get(g, ()) for g in qg))
+        for idx, n in shared.items():
+            if n < tmin:
+                continue
+            lb = len(forms[idx][k])
+            if lb not in need or n < need[lb]:
+                continue
+            if n > hits.get(idx, -1):
+                hits[idx] = n
+    return hits
+
+_popcount = getattr(int, "bit_count", None) or (lambda v: bin(v).count("1"))
+
+def char_masks(s: str):
+    masks = {}
+    for i, ch in enumerate(s):
+        masks[ch] = masks.get(ch, 0) | (1 << i)
+    return masks
+
+def bounded_lcs(masks, la: int, b: str, need: int) -> int:
+    # bit-parallel LCS (Hyyro); returns -1 as soon as the remaining chars of b cannot lift LCS to need
+    if la == 0 or not b:
+        return 0 if need <= 0 else -1
+    full = (1 << la) - 1
+    v = full
+    lb = len(b)
+    for j, ch in enumerate(b):
+        u = v & masks.get(ch, 0)
+        v = ((v + u) | (v - u)) & full
+        if la - _popcount(v) + (lb - j - 1) < need:
+            return -1
+    return la - _popcount(v)
+
+def bounded_ratio(masks, a: str, b: str, floor: float) -> float:
+    # indel ratio of a,b, or 0.0 if it cannot reach floor
+    la, lb = len(a), len(b)
+    if la + lb == 0 or 2 * min(la, lb) < floor * (la + lb):
+        return 0.0
+    need = int(floor * (la + lb) / 2.0 + 0.999999)
+    lcs = bounded_lcs(masks, la, b, need)
+    if lcs < 0:
+        return 0.0
+    return 2.0 * lcs / (la + lb)
+
+
+# ---- vectorized kernel (numpy) ---------------------------------------------
+# Block path: the count filter and the bit-parallel LCS above, run for many names at once.
+#   candidates  per name, shared-gram counts for every RMP row come from one np.bincount over the
+#               posting lists (CSR arrays); length bounds, the count filter and tombstones are masks
+#   scoring     every (name, candidate) pair of the block advances one LCS column per step; names are
+#               rows of per-character match masks, candidate names a fixed-width matrix of character
+#               ids (0 = padding, whose mask is 0, so padding leaves the state unchanged)
+# Scores are the exact indel ratios, so verdicts match the scalar path. Names longer than NP_MAX_LEN
+# don't fit a uint64 state and go through resolve_one().
+NP_MAX_LEN = 63
+
+if np is not None and hasattr(np, "bitwise_count"):
+    _np_popcount = np.bitwise_count
+else:
+    def _np_popcount(v):
+        return np.unpackbits(v.view(np.uint8)).reshape(v.shape + (64,)).sum(axis=-1)
+
+def np_index(index):
+    # array view of a q-gram index, cached on it and rebuilt once rows have been appended
+    forms = index["forms"]
+    cache = index.get("np")
+    if cache is not None and cache["n"] == len(forms):
+        return cache
+    alpha = cache["alpha"] if cache is not None else {}
+    out = {"n": len(forms), "alpha": alpha, "forms": []}
+    for k in (0, 1):
+        strs = [f[k] for f in forms]
+        width = max([len(x) for x in strs] or [1]) or 1
+        codes = np.zeros((len(strs), width), dtype=np.uint16)
+        for i, x in enumerate(strs):
+            if x:
+                codes[i, :len(x)] = [alpha.setdefault(ch, len(alpha) + 1) for ch in x]
+        postings = index["postings"][k]
+        grams = list(postings)
+        offs = np.zeros(len(grams) + 1, dtype=np.int64)
+        np.cumsum([len(postings[g]) for g in grams], out=offs[1:])
+        flat = np.fromiter(chain.from_iterable(postings[g] for g in grams), dtype=np.int32, count=int(offs[-1]))
+        out["forms"].append({
+            "codes": codes,
+            "lens": np.fromiter((len(x) for x in strs), dtype=np.int64, count=len(strs)),
+            "vocab": {g: i for i, g in enumerate(grams)},
+            "offs": offs,
+            "flat": flat,
+        })
+    index["np"] = out
+    return out
+
+def np_candidates(qf, cache, threshold, live, cap):
+    # (idx array, shared-gram array) of the rows that can still reach threshold on either form
+    n = cache["n"]
+    best = np.full(n, -1, dtype=np.int64)
+    for k, qs in enumerate(qf):
+        la = len(qs)
+        if not la:
+            continue
+        c = cache["forms"][k]
+        vocab, offs, flat = c["vocab"], c["offs"], c["flat"]
+        gids = [vocab[g] for g in qgram_set(qs) if g in vocab]
+        if gids:
+            shared = np.bincount(np.concatenate([flat[offs[g]:offs[g + 1]] for g in gids]), minlength=n)
+        else:
+            shared = np.zeros(n, dtype=np.int64)
+        lb = c["lens"]
+        lo, hi = _len_bounds(la, threshold)
+        need = np.maximum(la, lb) + Q - 1 - np.floor((1.0 - threshold) * (la + lb) + 1e-9).astype(np.int64) * Q
+        ok = live & (lb >= lo) & (lb <= hi) & (shared >= need)
+        np.maximum(best, np.where(ok, shared, -1), out=best)
+    cand = np.flatnonzero(best >= 0)
+    if cap and len(cand) > cap:
+        cand = cand[np.argsort(-best[cand], kind="stable")[:cap]]   # same cut as resolve_one
+    return cand, best[cand]
+
+def np_pair_ratios(queries, qsel, cidx, form, alpha):
+    # indel ratio of queries[qsel[i]] vs candidate cidx[i], for every pair i
+    table = np.zeros((len(queries), len(alpha) + 1), dtype=np.uint64)
+    for qi, q in enumerate(queries):
+        for ch, bits in char_masks(q).items():
+            a = alpha.get(ch)
+            if a is not None:
+                table[qi, a] = bits
+    la = np.array([len(q) for q in queries], dtype=np.int64)[qsel]
+    lb = form["lens"][cidx]
+    codes = form["codes"][cidx]
+    full = (np.uint64(1) << la.astype(np.uint64)) - np.uint64(1)
+    v = full.copy()
+    for j in range(int(lb.max()) if len(lb) else 0):
+        u = v & table[qsel, codes[:, j]]
+        v = ((v + u) | (v - u)) & full
+    lcs = la - _np_popcount(v).astype(np.int64)
+    tot = la + lb
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return np.where(tot > 0, 2.0 * lcs / tot, 0.0)
+
+# ---- resolver state --------------------------------------------------------
+# rmp_rows[idx] = (legacy_id, name, num_ratings); legacy_id None marks a tombstone
+def new_state(rmp_rows=()):
+    st = {"rmp_rows": [], "pos": {}, "exact": {}, "initial": {}, "index": build_qgram_index(()), "q": Q}
+    add_rmp_rows(st, rmp_rows)
+    return st
+
+def add_rmp_rows(st, rows):
+    rows = list(rows)
+    base = len(st["rmp_rows"])
+    for off, (lg, nm, nr) in enumerate(rows):
+        idx = base + off
+        old = st["pos"].pop(lg, None)
+        if old is not None:
+            drop_rmp_row(st, old)
+        st["rmp_rows"].append((lg, nm, nr))
+        st["pos"][lg] = idx
+        st["exact"].setdefault(norm_name(nm), []).append(idx)
+        k = last_initial_key(nm)
+        if k:
+            st["initial"].setdefault(k, []).append(idx)
+    extend_qgram_index(st["index"], rows)
+
+def drop_rmp_row(st, idx):
+    lg, nm, nr = st["rmp_rows"][idx]
+    st["rmp_rows"][idx] = (None, nm, nr)
+    st["pos"].pop(lg, None)
+
+def live_count(st):
+    return len(st["pos"])
+
+def _live(st, idxs):
+    rows = st["rmp_rows"]
+    return [i for i in idxs if rows[i][0] is not None]
+
+def _pair_similarity(qf, rf):
+    masks = (char_masks(qf[0]), char_masks(qf[1]))
+    return max(bounded_ratio(masks[0], qf[0], rf[0], 0.0), bounded_ratio(masks[1], qf[1], rf[1], 0.0))
+
+def _resolve_direct(name, qf, st, allow_initial):
+    rows = st["rmp_rows"]
+    exact = _live(st, st["exact"].get(qf[0], ()))
+    if exact:
+        # several RMP rows with the same name: trust the one with the most ratings
+        best = max(exact, key=lambda i: (rows[i][2] or 0))
+        return (rows[best][0], 1.0, "exact", len(exact))
+
+    if allow_initial:
+        k = last_initial_key(name)
+        cand = _live(st, st["initial"].get(k, ())) if k else []
+        if len(cand) == 1:
+            sim = _pair_similarity(qf, st["index"]["forms"][cand[0]])
+            return (rows[cand[0]][0], min(0.99, 0.85 + 0.1 * sim), "initial", 1)
+    return None
+
+def _verdict(legacy, best, second, threshold, n):
+    # "none" always carries confidence 0.0: the scalar path never computes sub-floor scores exactly
+    if legacy is None:
+        return (None, 0.0, "none", n)
+    conf = best
+    if second and best - second < AMBIGUITY_MARGIN:
+        conf -= AMBIGUITY_PENALTY
+    if conf >= threshold:
+        return (legacy, float(conf), "fuzzy", n)
+    return (None, 0.0, "none", n)
+
+def tie_key(row):
+    # equal fuzzy scores: the most-rated profile wins, then the lowest legacy_id
+    return (-(row[2] or 0), str(row[0]))
+
+def resolve_one(name, st, threshold, cap, allow_initial=True):
+    # -> (legacy_id | None, confidence, method, n_candidates)
+    rows = st["rmp_rows"]
+    qf = name_forms(name)
+    direct = _resolve_direct(name, qf, st, allow_initial)
+    if direct:
+        return direct
+
+    hits = qgram_candidates(qf, st["index"], threshold)
+    if not hits:
+        return (None, 0.0, "none", 0)
+    # cap cut over live rows (tombstones: removed or renamed since the index was built),
+    # most shared grams first, then row order
+    order = sorted(_live(st, hits), key=lambda i: (-hits[i], i))
+    if cap and len(order) > cap:
+        order = order[:cap]
+
+    masks = (char_masks(qf[0]), char_masks(qf[1]))
+    forms = st["index"]["forms"]
+    best_score, best_legacy, second, best_key = 0.0, None, 0.0, None
+    for idx in order:
+        legacy = rows[idx][0]
+        # keep scoring close runners-up so ambiguity can be detected
+        floor = max(threshold - AMBIGUITY_MARGIN, best_score - AMBIGUITY_MARGIN, second)
+        rf = forms[idx]
+        s = bounded_ratio(masks[0], qf[0], rf[0], floor)
+        s2 = bounded_ratio(masks[1], qf[1], rf[1], s if s > floor else floor)
+        if s2 > s:
+            s = s2
+        if s > best_score or (s == best_score and s > 0 and tie_key(rows[idx]) < best_key):
+            if best_legacy is not None and best_legacy != legacy:
+                second = max(second, best_score)
+            best_score, best_legacy, best_key = s, legacy, tie_key(rows[idx])
+        elif legacy != best_legacy and s > second:
+            second = s
+    return _verdict(best_legacy, best_score, second, threshold, len(order))
+
+def resolve_block(names, st, threshold, cap, allow_initial=True):
+    # -> [(name, legacy_id | None, confidence, method, n_candidates)], same verdicts as resolve_one
+    #    (same tie_key() tie-break, "none" at confidence 0.0)
+    if np is None:
+        return [(name,) + resolve_one(name, st, threshold, cap, allow_initial) for name in names]
+    rows = st["rmp_rows"]
+    out, pend = [None] * len(names), []
+    for i, name in enumerate(names):
+        qf = name_forms(name)
+        direct = _resolve_direct(name, qf, st, allow_initial)
+        if direct:
+            out[i] = (name,) + direct
+        elif len(qf[0]) > NP_MAX_LEN or len(qf[1]) > NP_MAX_LEN:
+            out[i] = (name,) + resolve_one(name, st, threshold, cap, allow_initial)
+        else:
+            pend.append((i, name, qf))
+    if not pend:
+        return out
+
+    cache = np_index(st["index"])
+    live = np.fromiter((r[0] is not None for r in rows), dtype=bool, count=len(rows))
+    qsel, cidx = [], []
+    for p, (_, _, qf) in enumerate(pend):
+        cand, _ = np_candidates(qf, cache, threshold, live, cap)
+        qsel.append(np.full(len(cand), p, dtype=np.int64))
+        cidx.append(cand)
+    qsel, cidx = np.concatenate(qsel), np.concatenate(cidx)
+    score = np.zeros(len(qsel))
+    if len(qsel):
+        for k in (0, 1):
+            np.maximum(score, np_pair_ratios([qf[k] for _, _, qf in pend], qsel, cidx, cache["forms"][k], cache["alpha"]), out=score)
+
+    # per name: best pair first (ties -> tie_key order), runner-up right behind it
+    order = np.lexsort((tie_ranks(st)[cidx], -score, qsel))
+    starts = np.searchsorted(qsel[order], np.arange(len(pend) + 1)).tolist()
+    order, score = order.tolist(), score.tolist()
+    for p, (i, name, _) in enumerate(pend):
+        a, b = starts[p], starts[p + 1]
+        best = score[order[a]] if b > a else 0.0
+        legacy = rows[int(cidx[order[a]])][0] if best > 0 else None
+        second = score[order[a + 1]] if b - a > 1 else 0.0
+        out[i] = (name,) + _verdict(legacy, best, second, threshold, b - a)
+    return out
+
+def tie_ranks(st):
+    # position of every row in tie_key() order, cached until rows are added or dropped
+    rows = st["rmp_rows"]
+    key = (len(rows), live_count(st))
+    cached = st.get("tie")
+    if cached is None or cached[0] != key:
+        ranks = np.empty(len(rows), dtype=np.int64)
+        ranks[sorted(range(len(rows)), key=lambda i: tie_key(rows[i]))] = np.arange(len(rows))
+        cached = st["tie"] = (key, ranks)
+    return cached[1]
+
+# worker-side copy of the resolver state; filled once per process by the pool initializer
+_WORKER = {}
+
+def _init_worker(st, threshold, cap, allow_initial):
+    _WORKER.update(st=st, threshold=threshold, cap=cap, allow_initial=allow_initial)
+
+def _resolve_worker(block):
+    w = _WORKER
+    return resolve_block(block, w["st"], w["threshold"], w["cap"], w["allow_initial"])
+
+def resolve_parallel(names, st, threshold, cap, label, allow_initial=True):
+    workers = max(1, int(os.environ.get("MATCH_WORKERS", os.cpu_count() or 4)))
+    block = int(os.environ.get("MATCH_BLOCK", "0")) or min(256, max(1, len(names) // (workers * 8)))
+    out = []
+    done, total, matched = 0, len(names), 0
+    print(f"[identity] {label}: {total} names vs {live_count(st)} rmp, workers={workers}, threshold={threshold}, cap={cap}, block={block}, numpy={np is not None}")
+    if not total:
+        return out
+    if np is not None:
+        np_index(st["index"])   # build once here rather than once per worker
+    # the state ships to each worker once (initializer), names go over in blocks
+    blocks = [names[i:i + block] for i in range(0, total, block)]
+    step = max(100, total // 50 or 1)
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(st, threshold, cap, allow_initial)) as ex:
+        for res in ex.map(_resolve_worker, blocks):
+            out.extend(res)
+            matched += sum(1 for r in res if r[1] is not None)
+            prev, done = done, done + len(res)
+            if done // step != prev // step or done == total:
+                pct = (done * 100.0) / total
+                print(f"[identity] {done}/{total} ({pct:.1f}%) matched={matched}")
+    return out
+
+# ---- schema + persisted state ----------------------------------------------
+def ensure_identity_schema(cur):
+    # one row per distinct instructor name; unmatched names are kept (rmp_legacy_id NULL) so the
+    # next run knows they were already scored
+    cur.execute("""
+                CREATE TABLE IF NOT EXISTS instructor_identity(
+                                                                 name          TEXT PRIMARY KEY,
+                                                                 norm          TEXT NOT NULL,
+                                                                 rmp_legacy_id TEXT,
+                                                                 confidence    REAL NOT NULL DEFAULT 0.0,
+                                                                 method        TEXT NOT NULL,
+                                                                 candidates    INTEGER NOT NULL DEFAULT 0,
+                                                                 resolved_at   TEXT NOT NULL
+                )""")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_identity_rmp ON instructor_identity(rmp_legacy_id)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_identity_norm ON instructor_identity(norm)")
+    # the RMP (legacy_id, name) pairs the persisted index was built from
+    cur.execute("CREATE TABLE IF NOT EXISTS identity_seen_rmp(legacy_id TEXT PRIMARY KEY, name TEXT NOT NULL)")
+    db.ensure_state(cur, "identity", legacy_table="identity_state")
+
+def index_path(con):
+    return os.environ.get("IDENTITY_INDEX_FILE") or (db.attached_path(con) or "identity") + ".identity-index.pickle"
+
+def load_index_state(con, cur):
+    # the pickle is only trusted if its generation matches the one committed with identity_seen_rmp
+    gen = db.get_state(cur, "identity", "index_gen")
+    path = index_path(con)
+    if not gen or not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            st = pickle.load(f)
+    except Exception:
+        return None
+    if st.get("gen") != gen or st.get("q") != Q:
+        return None
+    return st
+
+def save_index_state(con, cur, st):
+    st["gen"] = uuid.uuid4().hex
+    st["index"].pop("np", None)   # derived; rebuilt on demand, and keeps the pickle loadable without numpy
+    st.pop("tie", None)
+    path = index_path(con)
+    tmp = path + ".tmp"
+    with open(tmp, "wb") as f:
+        pickle.dump(st, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp, path)
+    db.set_state(cur, "identity", "index_gen", st["gen"])
+
+# ---- resolve ---------------------------------------------------------------
+RMP_LIVE_SQL = """SELECT legacy_id, COALESCE(first_name,'')||' '||COALESCE(last_name,'') AS name
+                  FROM rmp_professors WHERE legacy_id IS NOT NULL"""
+NAMES_SQL = """SELECT DISTINCT TRIM(instructor) AS name FROM grades_prof_course
+               WHERE instructor IS NOT NULL AND TRIM(instructor) <> ''"""
+
+def resolve_identities(con, threshold=0.85, cap=None):
+    """Bring instructor_identity up to date; only new names and names a new/removed RMP row could affect are scored."""
+    cur = con.cursor()
+    ensure_identity_schema(cur)
+    if cap is None:
+        cap = int(os.environ.get("MATCH_CANDIDATE_CAP", "200"))  # limit candidate set per name
+    if not db.table_exists(cur, "grades_prof_course") or not db.table_exists(cur, "rmp_professors"):
+        print("[identity] grades_prof_course or rmp_professors missing; skip")
+        return {"names": 0, "rmp_new": 0, "rmp_gone": 0}
+
+    # a different threshold (or q) invalidates every earlier verdict
+    params = f"{threshold}:{Q}:{AMBIGUITY_MARGIN}:{AMBIGUITY_PENALTY}"
+    if db.get_state(cur, "identity", "params") != params:
+        cur.execute("DELETE FROM instructor_identity")
+        cur.execute("DELETE FROM identity_seen_rmp")
+        db.set_state(cur, "identity", "index_gen", None)
+        db.set_state(cur, "identity", "params", params)
+        con.commit()
+
+    # deltas since the last run; rating counts only break exact-name ties, so a change in
+    # num_ratings alone is not a delta
+    cur.execute(f"""
+                SELECT d.legacy_id, d.name, COALESCE(MAX(r.num_ratings), 0)
+                FROM ({RMP_LIVE_SQL} EXCEPT SELECT legacy_id, name FROM identity_seen_rmp) d
+                         JOIN rmp_professors r ON r.legacy_id = d.legacy_id
+                GROUP BY d.legacy_id, d.name
+                """)
+    new_rmp = cur.fetchall()
+    cur.execute(f"SELECT legacy_id, name, 0 FROM identity_seen_rmp EXCEPT SELECT legacy_id, name, 0 FROM ({RMP_LIVE_SQL})")
+    gone_rmp = cur.fetchall()
+    cur.execute(f"SELECT name FROM ({NAMES_SQL}) WHERE name NOT IN (SELECT name FROM instructor_identity)")
+    new_names = [r[0] for r in cur.fetchall()]
+    stats = {"names": len(new_names), "rmp_new": len(new_rmp), "rmp_gone": len(gone_rmp)}
+    print(f"[identity] delta: names +{len(new_names)}, rmp +{len(new_rmp)} -{len(gone_rmp)}")
+    if not new_names and not new_rmp and not gone_rmp:
+        print("[identity] up to date")
+        return stats
+
+    # bring the persisted index up to date: tombstone removed/changed rows, append new ones
+    st = load_index_state(con, cur)
+    if st is None:
+        print("[identity] index state missing or stale; rebuilding from identity_seen_rmp")
+        cur.execute("""
+                    SELECT s.legacy_id, s.name, COALESCE(MAX(r.num_ratings), 0)
+                    FROM identity_seen_rmp s
+                             LEFT JOIN rmp_professors r ON r.legacy_id = s.legacy_id
+                    GROUP BY s.legacy_id, s.name
+                    """)
+        st = new_state(cur.fetchall())
+    for lg, _, _ in gone_rmp:
+        i = st["pos"].get(lg)
+        if i is not None:
+            drop_rmp_row(st, i)
+    add_rmp_rows(st, new_rmp)
+    if len(st["rmp_rows"]) > 2 * max(1, live_count(st)):
+        st = new_state([r for r in st["rmp_rows"] if r[0] is not None])
+
+    results = []
+    # new names: full pipeline against everything
+    results += resolve_parallel(new_names, st, threshold, cap, "new names")
+
+    # names a changed RMP row can affect get the full pipeline again: anything mapped to a removed
+    # row, and anything whose last-name/initial block gained a row (its uniqueness may have changed)
+    touched_keys = {k for k in (last_initial_key(nm) for _, nm, _ in new_rmp) if k}
+    gone_ids = {lg for lg, _, _ in gone_rmp} | {lg for lg, _, _ in new_rmp}
+    cur.execute("SELECT name, rmp_legacy_id, confidence, method FROM instructor_identity")
+    rerun, stale = [], []
+    for name, lg, conf, method in cur.fetchall():
+        if method == "exact" and lg not in gone_ids and last_initial_key(name) not in touched_keys:
+            continue
+        if (lg is not None and lg in gone_ids) or last_initial_key(name) in touched_keys:
+            rerun.append(name)
+        elif new_rmp:
+            stale.append((name, conf if lg is not None else 0.0))
+    results += resolve_parallel(rerun, st, threshold, cap, "affected names")
+
+    # everything else without an exact hit: only the new rows can beat the current verdict
+    if stale and new_rmp:
+        delta = new_state(new_rmp)
+        current = dict(stale)
+        for res in resolve_parallel([n for n, _ in stale], delta, threshold, cap, "vs new rmp", allow_initial=False):
+            if res[1] is not None and res[2] > current[res[0]]:
+                results.append(res)
+
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    cur.executemany("""
+                    INSERT INTO instructor_identity(name, norm, rmp_legacy_id, confidence, method, candidates, resolved_at)
+                    VALUES (?,?,?,?,?,?,?)
+                        ON CONFLICT(name) DO UPDATE SET
+                        norm=excluded.norm,
+                                                   rmp_legacy_id=excluded.rmp_legacy_id,
+                                                   confidence=excluded.confidence,
+                                                   method=excluded.method,
+                                                   candidates=excluded.candidates,
+                                                   resolved_at=excluded.resolved_at
+                    """, [(name, norm_name(name), lg, conf, method, n, now) for name, lg, conf, method, n in results])
+    cur.executemany("DELETE FROM identity_seen_rmp WHERE legacy_id=?", [(lg,) for lg, _, _ in gone_rmp])
+    cur.executemany("INSERT OR REPLACE INTO identity_seen_rmp(legacy_id, name) VALUES (?,?)", [(lg, nm) for lg, nm, _ in new_rmp])
+    save_index_state(con, cur, st)
+    con.commit()
+    cur.execute("SELECT method, COUNT(*) FROM instructor_identity GROUP BY method ORDER BY method")
+    print("[identity] " + ", ".join(f"{m}={n}" for m, n in cur.fetchall()))
+    return stats
+
+def apply_identities(con, rebuild=None):
+    """Project instructor_identity onto the tables the rest of the app reads.
+
+    Every run refreshes the derived rows of matched names: map rows are upserted, an instructor's
+    instructor_rmp_match row and grades_prof_course.instructor_id are rewritten when the identity
+    now points at a different professor. Names without a match are left alone, so hand-entered
+    links and names that fell below threshold keep theirs. rebuild=True (or IDENTITY_REBUILD=1)
+    also clears those, leaving the derived tables an exact copy of instructor_identity."""
+    if rebuild is None:
+        rebuild = os.environ.get("IDENTITY_REBUILD", "") in ("1", "true", "yes")
+    cur = con.cursor()
+    if db.table_exists(cur, "rmp_instructor_map"):
+        if rebuild:
+            cur.execute("DELETE FROM rmp_instructor_map")
+        cur.execute("""
+                    INSERT INTO rmp_instructor_map(instructor, legacy_id)
+                    SELECT name, rmp_legacy_id FROM instructor_identity WHERE rmp_legacy_id IS NOT NULL
+                    ON CONFLICT(instructor) DO UPDATE SET legacy_id=excluded.legacy_id
+                    """)
+    if db.table_exists(cur, "instructors") and db.table_exists(cur, "instructor_rmp_match"):
+        if rebuild:
+            cur.execute("DELETE FROM instructor_rmp_match")
+        else:
+            cur.execute("""
+                        DELETE FROM instructor_rmp_match
+                        WHERE EXISTS (
+                            SELECT 1 FROM instructors i
+                                     JOIN instructor_identity m ON m.name = i.name
+                            WHERE i.id = instructor_rmp_match.instructor_id
+                              AND m.rmp_legacy_id IS NOT NULL
+                              AND m.rmp_legacy_id IS NOT instructor_rmp_match.rmp_legacy_id
+                        )
+                        """)
+        cur.execute("""
+                    INSERT INTO instructor_rmp_match(instructor_id, rmp_legacy_id, confidence)
+                    SELECT i.id, m.rmp_legacy_id, m.confidence
+                    FROM instructors i
+                             JOIN instructor_identity m ON m.name = i.name
+                    WHERE m.rmp_legacy_id IS NOT NULL
+                    ON CONFLICT(instructor_id, rmp_legacy_id) DO UPDATE SET confidence=excluded.confidence
+                    """)
+    if db.table_exists(cur, "grades_prof_course"):
+        matched = "" if rebuild else "AND TRIM(instructor) IN (SELECT name FROM instructor_identity WHERE rmp_legacy_id IS NOT NULL)"
+        cur.execute(f"""
+                    UPDATE grades_prof_course
+                    SET instructor_id = (
+                        SELECT rmp_legacy_id FROM instructor_identity m
+                        WHERE m.name = TRIM(grades_prof_course.instructor)
+                    )
+                    WHERE instructor_id IS NOT (
+                        SELECT rmp_legacy_id FROM instructor_identity m
+                        WHERE m.name = TRIM(grades_prof_course.instructor)
+                    )
+                    {matched}
+                    """)
+        print(f"[identity] grades_prof_course.instructor_id {'rewritten' if rebuild else 'refreshed'} rows={cur.rowcount}")
+    con.commit()
+    cur.execute("SELECT COUNT(*) FROM instructor_identity WHERE rmp_legacy_id IS NOT NULL")
+    return cur.fetchone()[0]
@@ -0,0 +1,391 @@
+#!/usr/bin/env python3
+# server/scripts/pipeline.py
+# -*- coding: utf-8 -*-
+# Nightly refresh as one DAG instead of a hand-run chain of scripts.
+#
+#   python3 pipeline.py                 run everything that is out of date, independent stages in parallel
+#   python3 pipeline.py --dry-run       show the plan (and why each stage would run or skip)
+#   python3 pipeline.py --only backfill --force backfill
+#
+# Every stage declares its inputs and outputs (files, directories, tables); edges come from those
+# (a stage depends on whoever produces one of its inputs). A stage is skipped when the fingerprint of
+# its inputs and code matches the last successful run and its outputs still exist. Each run records
+# wall time, output rows and output bytes per stage in pipeline_runs.
+# Stages that write tables all write the same prereqs.db, so at most one of them runs at a time
+# (a long write transaction, e.g. backfill, would otherwise time the others out on the write lock);
+# file-only stages still run alongside them.
+# File outputs are kept in the artifact store (artifacts.py) under the stage's input key; stages that
+# only produce files (cache=True) are restored from it instead of rerun when the key was seen before.
+import argparse, hashlib, json, os, subprocess, sys, threading, time, uuid
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+import artifacts
+import db
+
+HERE = os.path.abspath(os.path.dirname(__file__))
+SERVER_DIR = os.path.abspath(os.path.join(HERE, ".."))
+EXTRACT_DIR = os.path.abspath(os.path.join(SERVER_DIR, "..", "extractors", "extract"))
+HOME = os.environ.get("HOME", "")
+
+DB_PATH = db.db_file()
+CSV_IN = os.environ.get("CSV_IN", os.path.join(HOME, "Downloads", "combined_courses_with_prereqs.csv"))
+CSV_OUT = os.environ.get("CSV_OUT", os.path.join(HOME, "Downloads", "extracted_prereqs.csv"))
+PAIR_ROOT = os.environ.get("PAIR_ROOT", os.path.join(HOME, "Downloads", "ubc-pair-grade-data-master"))
+# a PAIR archive (.zip / .tar.gz) is fingerprinted as a file; pair_ingest streams it in place and
+# run-grades-importer.sh unpacks it to a temp dir for the Java importer
+PAIR_INPUT = ("file" if os.path.isfile(PAIR_ROOT) else "dir", PAIR_ROOT)
+GRADES_OUT = os.environ.get("GRADES_OUT", os.path.join(SERVER_DIR, "tmp-grades"))
+PROF_CSV = os.path.join(HERE, "ubc_professors_ratings.csv")
+COURSE_CSV = os.path.join(HERE, "professor_courses.csv")
+GRAPH_SNAPSHOT = os.environ.get("GRAPH_SNAPSHOT", os.path.join(SERVER_DIR, "graph.snapshot"))
+RMP_TTL_HOURS = float(os.environ.get("PIPELINE_RMP_TTL_HOURS", "24"))   # the crawl has no local inputs; rerun it once stale
+LOG_DIR = os.environ.get("PIPELINE_LOG_DIR", os.path.join(SERVER_DIR, "pipeline-logs"))
+PY = sys.executable
+
+# ---- stage table -----------------------------------------------------------
+# code= lists every local module a stage's script imports, so a change to any of them reruns it
+def py_code(*names):
+    # server/scripts modules, plus db.py, which every one of them connects through
+    return [os.path.join(HERE, n) for n in names + ("db.py",)]
+
+def stage(name, cmd, cwd, inputs=(), outputs=(), code=(), env=None, ttl_hours=None, cache=False):
+    # inputs/outputs: ("file", path) | ("dir", path) | ("table", name)
+    # cache: outputs are a pure function of inputs+code, so an artifact hit can replace the run
+    return {"name": name, "cmd": cmd, "cwd": cwd, "inputs": list(inputs), "outputs": list(outputs),
+            "code": list(code), "env": env or {}, "ttl_hours": ttl_hours, "cache": cache}
+
+STAGES = [
+    stage("extract", [PY, "extractor_v2.py", CSV_IN, "-o", CSV_OUT], EXTRACT_DIR,
+          inputs=[("file", CSV_IN)],
+          outputs=[("file", CSV_OUT)],
+          code=[os.path.join(EXTRACT_DIR, "extractor_v2.py")],
+          cache=True),
+    stage("import_prereqs", ["npm", "run", "import"], SERVER_DIR,
+          inputs=[("file", CSV_OUT)],
+          outputs=[("table", "courses"), ("table", "constraints"), ("table", "edges"), ("table", "requirement_groups")],
+          code=[os.path.join(SERVER_DIR, "src", "import.ts"), os.path.join(SERVER_DIR, "src", "req_groups.ts"),
+                os.path.join(SERVER_DIR, "src", "schema.sql")],
+          env={"CSV_FILE": CSV_OUT}),
+    stage("rmp_crawl", [PY, "rmp_import.py"], HERE,
+          outputs=[("file", PROF_CSV), ("file", COURSE_CSV), ("table", "rmp_course_stats")],
+          code=py_code("rmp_import.py", "rmp_course_codes.py", "rmp_replay.py") + [os.path.join(EXTRACT_DIR, "extractor_v2.py")],
+          ttl_hours=RMP_TTL_HOURS),
+    stage("rmp_codes", [PY, "rmp_course_codes.py"], HERE,
+          inputs=[("table", "rmp_course_stats")],
+          outputs=[("table", "rmp_course_code_rejects")],
+          code=py_code("rmp_course_codes.py") + [os.path.join(EXTRACT_DIR, "extractor_v2.py")]),
+    stage("rmp_load", [PY, "etl_enrich.py", "rmp"], HERE,
+          inputs=[("file", PROF_CSV)],
+          outputs=[("table", "rmp_professors")],
+          code=py_code("etl_enrich.py", "identity.py"),
+          env={"RMP_CSV": PROF_CSV}),
+    stage("pair_ingest", [PY, "etl_enrich.py", "pair"], HERE,
+          inputs=[PAIR_INPUT],
+          outputs=[("table", "grades_prof_course"), ("table", "grades_prof_course_summary")],
+          code=py_code("etl_enrich.py", "identity.py"),
+          env={"PAIR_ROOT": PAIR_ROOT}),
+    stage("grade_stats", [PY, "grade_stats.py"], HERE,
+          inputs=[("table", "grades_prof_course")],
+          outputs=[("table", "grades_prof_course_stats")],
+          code=py_code("grade_stats.py")),
+    stage("grades_import", ["bash", "run-grades-importer.sh", "--dir", PAIR_ROOT, "--out", GRADES_OUT], HERE,
+          inputs=[PAIR_INPUT],
+          outputs=[("file", os.path.join(GRADES_OUT, "grades_sections_import.csv")),
+                   ("file", os.path.join(GRADES_OUT, "grades_course_avg_import.csv")),
+                   ("table", "grades_sections"), ("table", "grades_course_avg")],
+          code=[os.path.join(HERE, "run-grades-importer.sh"), os.path.join(SERVER_DIR, "src", "grades", "ImportGrades.java")]),
+    stage("avg_cache", [PY, "course_avg_cache.py"], HERE,
+          inputs=[("table", "grades_prof_course"), ("table", "grades_sections")],
+          outputs=[("table", "course_avg_cache")],
+          code=py_code("course_avg_cache.py")),
+    stage("plan_cost", [PY, "plan_costs.py"], HERE,
+          inputs=[("table", "courses"), ("table", "requirement_groups"), ("table", "course_avg_cache")],
+          outputs=[("table", "plan_cost")],
+          code=py_code("plan_costs.py")),
+    stage("graph_snapshot", [PY, "graph_snapshot.py", "--out", GRAPH_SNAPSHOT], HERE,
+          inputs=[("table", "courses"), ("table", "edges")],
+          outputs=[("file", GRAPH_SNAPSHOT)],
+          code=py_code("graph_snapshot.py")),
+    stage("course_search", [PY, "course_search_index.py"], HERE,
+          inputs=[("table", "courses")],
+          outputs=[("table", "course_search_state")],
+          code=py_code("course_search_index.py")),
+    stage("backfill", [PY, "backfill_empty_tables.py"], HERE,
+          inputs=[("table", "grades_prof_course"), ("table", "rmp_professors")],
+          outputs=[("table", "instructors"), ("table", "pair_sections"), ("table", "instructor_identity"),
+                   ("table", "instructor_rmp_match")],
+          code=py_code("backfill_empty_tables.py", "identity.py")),
+    stage("viz_mat", [PY, "viz_sections_mat.py"], HERE,
+          inputs=[("table", "grades_prof_course"), ("table", "instructor_identity"), ("table", "rmp_professors")],
+          outputs=[("table", "viz_sections_with_rmp_mat")],
+          code=py_code("viz_sections_mat.py")),
+    stage("stats_rollups", [PY, "stats_rollups.py"], HERE,
+          inputs=[("table", "viz_sections_with_rmp_mat")],
+          outputs=[("table", "prof_stats_rollup"), ("table", "course_stats_rollup")],
+          code=py_code("stats_rollups.py")),
+]
+
+def writes_db(st):
+    return any(kind == "table" for kind, _ in st["outputs"])
+
+def stage_deps(stages):
+    producers = {}
+    for st in stages:
+        for o in st["outputs"]:
+            producers.setdefault(o, []).append(st["name"])
+    return {st["name"]: sorted({p for i in st["inputs"] for p in producers.get(i, ()) if p != st["name"]})
+            for st in stages}
+
+# ---- fingerprints ----------------------------------------------------------
+def _dir_fingerprint(path):
+    # (relpath, size, mtime) of every file; cheap enough for the PAIR tree and catches adds/removes
+    h = hashlib.sha1()
+    n = 0
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for fn in sorted(files):
+            p = os.path.join(root, fn)
+            try:
+                stt = os.stat(p)
+            except OSError:
+                continue
+            h.update(f"{os.path.relpath(p, path)}\0{stt.st_size}\0{stt.st_mtime_ns}\n".encode("utf-8", "surrogateescape"))
+            n += 1
+    return f"{n}:{h.hexdigest()}"
+
+def resource_fingerprint(con, res, generations):
+    kind, ref = res
+    if kind == "file":
+        # content, not mtime: a restored or re-copied identical file is not a change
+        return artifacts.file_sha1(ref) if os.path.exists(ref) else None
+    if kind == "dir":
+        return _dir_fingerprint(ref) if os.path.isdir(ref) else None
+    # in-place UPDATEs don't move COUNT/MAX(rowid) or bump a generation; the producing stage's last run id does
+    return [db.table_fingerprint(con, ref), generations.get(res)]
+
+def input_key(con, st, generations):
+    parts = {
+        "inputs": [[list(r), resource_fingerprint(con, r, generations)] for r in st["inputs"]],
+        "code": [[c, artifacts.file_sha1(c) if os.path.exists(c) else None] for c in st["code"]],
+        "cmd": st["cmd"],
+        "env": st["env"],
+    }
+    return hashlib.sha1(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+def outputs_present(con, st):
+    for kind, ref in st["outputs"]:
+        if kind == "file" and not os.path.exists(ref):
+            return False
+        if kind == "table" and not db.table_exists(con, ref):
+            return False
+    return True
+
+def measure_outputs(con, st):
+    rows, nbytes = 0, 0
+    for kind, ref in st["outputs"]:
+        if kind == "file" and os.path.exists(ref):
+            nbytes += os.path.getsize(ref)
+        elif kind == "table" and db.table_exists(con, ref):
+            rows += con.execute(f"SELECT COUNT(*) FROM {ref}").fetchone()[0]
+    return rows, nbytes
+
+# ---- run bookkeeping -------------------------------------------------------
+def ensure_pipeline_schema(con):
+    con.execute("""
+                CREATE TABLE IF NOT EXISTS pipeline_state(
+                                                             stage       TEXT PRIMARY KEY,
+                                                             input_key   TEXT NOT NULL,
+                                                             run_id      TEXT NOT NULL,
+                                                             finished_at REAL NOT NULL
+                )""")
+    con.execute("""
+                CREATE TABLE IF NOT EXISTS pipeline_runs(
+                                                            run_id     TEXT NOT NULL,
+                                                            stage      TEXT NOT NULL,
+                                                            status     TEXT NOT NULL,
+                                                            started_at REAL,
+                                                            secs       REAL,
+                                                            rows       INTEGER,
+                                                            bytes      INTEGER,
+                                                            detail     TEXT,
+                                                            PRIMARY KEY(run_id, stage)
+                )""")
+    con.commit()
+
+def last_state(con):
+    return {r[0]: {"input_key": r[1], "run_id": r[2], "finished_at": r[3]}
+            for r in con.execute("SELECT stage, input_key, run_id, finished_at FROM pipeline_state")}
+
+def record_run(con, run_id, name, res):
+    con.execute("""INSERT OR REPLACE INTO pipeline_runs(run_id, stage, status, started_at, secs, rows, bytes, detail)
+                   VALUES (?,?,?,?,?,?,?,?)""",
+                (run_id, name, res["status"], res.get("started_at"), res.get("secs"), res.get("rows"), res.get("bytes"), res.get("detail")))
+    if res["status"] in ("ok", "cached"):
+        con.execute("""INSERT INTO pipeline_state(stage, input_key, run_id, finished_at) VALUES (?,?,?,?)
+                       ON CONFLICT(stage) DO UPDATE SET input_key=excluded.input_key, run_id=excluded.run_id, finished_at=excluded.finished_at""",
+                    (name, res["input_key"], run_id, time.time()))
+    con.commit()
+
+# ---- execution -------------------------------------------------------------
+def plan_stage(con, st, state, generations, force):
+    # -> (run?, reason, input_key)
+    key = input_key(con, st, generations)
+    prev = state.get(st["name"])
+    if force:
+        return True, "forced", key
+    if prev is None:
+        return True, "never ran", key
+    if prev["input_key"] != key:
+        return True, "inputs or code changed", key
+    if not outputs_present(con, st):
+        return True, "outputs missing", key
+    if st["ttl_hours"] is not None and time.time() - prev["finished_at"] > st["ttl_hours"] * 3600:
+        return True, f"older than {st['ttl_hours']:g}h", key
+    return False, "up to date", key
+
+def run_stage(st, run_id):
+    os.makedirs(os.path.join(LOG_DIR, run_id), exist_ok=True)
+    log_path = os.path.join(LOG_DIR, run_id, f"{st['name']}.log")
+    env = dict(os.environ, DB_FILE=DB_PATH, **st["env"])
+    t0 = time.monotonic()
+    try:
+        with open(log_path, "wb") as log:
+            rc = subprocess.run(st["cmd"], cwd=st["cwd"], env=env, stdout=log, stderr=subprocess.STDOUT).returncode
+    except OSError as e:
+        return {"status": "failed", "secs": time.monotonic() - t0, "detail": f"{e} (log: {log_path})"}
+    secs = time.monotonic() - t0
+    if rc != 0:
+        return {"status": "failed", "secs": secs, "detail": f"exit {rc} (log: {log_path})"}
+    return {"status": "ok", "secs": secs, "detail": f"log: {log_path}"}
+
+def critical_path(deps, results):
+    # longest chain of stage wall times through the DAG (skipped stages count as 0)
+    memo = {}
+    def finish(n):
+        if n not in memo:
+            memo[n] = max([finish(d) for d in deps[n] if d in results] or [0.0]) + (results[n].get("secs") or 0.0)
+        return memo[n]
+    return max([finish(n) for n in results] or [0.0])
+
+def run_pipeline(stages, jobs=4, force=(), dry_run=False):
+    deps = stage_deps(stages)
+    by_name = {st["name"]: st for st in stages}
+    run_id = time.strftime("%Y%m%d-%H%M%S") + "-" + uuid.uuid4().hex[:6]
+    con = db.connect(DB_PATH, "serve", check_same_thread=False)
+    lock = threading.Lock()   # one bookkeeping connection shared by the scheduler threads
+    ensure_pipeline_schema(con)
+    state = last_state(con)
+    # run ids of producing stages, so a downstream stage notices an upstream rerun even when the
+    # table's row count and max rowid happen to come out the same
+    generations = {}
+    for st in stages:
+        for o in st["outputs"]:
+            if o[0] == "table" and st["name"] in state:
+                generations[o] = state[st["name"]]["run_id"]
+
+    print(f"[pipeline] run {run_id} DB={DB_PATH} jobs={jobs}")
+    if dry_run:
+        for st in stages:
+            go, why, _ = plan_stage(con, st, state, generations, st["name"] in force or "all" in force)
+            print(f"[pipeline] {st['name']:<15} {'RUN ' if go else 'skip'} {why:<24} after: {', '.join(deps[st['name']]) or '-'}")
+        con.close()
+        return {}
+
+    results = {}
+
+    def work(name):
+        st = by_name[name]
+        with lock:
+            go, why, key = plan_stage(con, st, state, generations, name in force or "all" in force)
+        started = time.time()
+        out_files = [ref for kind, ref in st["outputs"] if kind == "file"]
+        forced = name in force or "all" in force
+        if not go:
+            res = {"status": "skipped", "secs": 0.0, "detail": why}
+        elif st["cache"] and not forced and artifacts.restore(key):
+            res = {"status": "cached", "secs": time.time() - started, "detail": f"artifact {key[:12]}"}
+        else:
+            print(f"[pipeline] {name}: start ({why})")
+            res = run_stage(st, run_id)
+            if res["status"] == "ok" and out_files:
+                # non-cacheable stages (crawls, DB loads) still keep each output for rollback
+                akey = key if st["cache"] else hashlib.sha1(f"{key}:{run_id}".encode()).hexdigest()
+                artifacts.put(name, akey, out_files, {"run_id": run_id, "input_key": key})
+        res["started_at"], res["input_key"] = started, key
+        with lock:
+            res["rows"], res["bytes"] = measure_outputs(con, st)
+            record_run(con, run_id, name, res)
+            if res["status"] in ("ok", "cached"):
+                for o in st["outputs"]:
+                    generations[o] = run_id
+        return res
+
+    t0 = time.monotonic()
+    pending = {st["name"] for st in stages}
+    running = {}
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as ex:
+        while pending or running:
+            ready = False
+            db_busy = any(writes_db(by_name[n]) for n in running.values())
+            for name in sorted(pending):
+                if all(results.get(d, {}).get("status") in ("ok", "cached", "skipped") for d in deps[name]):
+                    if writes_db(by_name[name]):
+                        if db_busy:
+                            continue
+                        db_busy = True
+                    pending.discard(name)
+                    running[ex.submit(work, name)] = name
+                    ready = True
+                elif any(results.get(d, {}).get("status") in ("failed", "blocked") for d in deps[name]):
+                    pending.discard(name)
+                    results[name] = {"status": "blocked", "secs": 0.0, "detail": "upstream failed"}
+                    with lock:
+                        record_run(con, run_id, name, results[name])
+                    print(f"[pipeline] {name}: blocked (upstream failed)")
+                    ready = True
+            if not running:
+                if not ready and pending:
+                    raise RuntimeError(f"stage graph has a cycle among: {', '.join(sorted(pending))}")
+                continue
+            done, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for fut in done:
+                name = running.pop(fut)
+                try:
+                    results[name] = fut.result()
+                except Exception as e:   # bookkeeping failure; don't take the other stages down
+                    results[name] = {"status": "failed", "secs": 0.0, "detail": repr(e)}
+                r = results[name]
+                print(f"[pipeline] {name}: {r['status']} in {r['secs']:.1f}s ({r.get('detail') or ''})")
+    wall = time.monotonic() - t0
+    con.close()
+
+    print(f"{'stage':<15} {'status':<8} {'secs':>8} {'rows':>10} {'bytes':>12}")
+    for st in stages:
+        r = results[st["name"]]
+        print(f"{st['name']:<15} {r['status']:<8} {r['secs']:>8.1f} {r.get('rows') or 0:>10} {r.get('bytes') or 0:>12}")
+    total = sum(r["secs"] for r in results.values())
+    print(f"[pipeline] wall {wall:.1f}s, stage time {total:.1f}s, critical path {critical_path(deps, results):.1f}s")
+    return results
+
+def main():
+    ap = argparse.ArgumentParser(description="Run the ETL refresh as a stage DAG")
+    ap.add_argument("--jobs", type=int, default=int(os.environ.get("PIPELINE_JOBS", "4")))
+    ap.add_argument("--only", default="", help="comma-separated stages to consider (upstream stages are not added)")
+    ap.add_argument("--force", default="", help="comma-separated stages to run even if up to date, or 'all'")
+    ap.add_argument("--dry-run", action="store_true")
+    args = ap.parse_args()
+
+    stages = STAGES
+    if args.only:
+        keep = {s.strip() for s in args.only.split(",") if s.strip()}
+        unknown = keep - {st["name"] for st in STAGES}
+        if unknown:
+            ap.error(f"unknown stage(s): {', '.join(sorted(unknown))}")
+        stages = [st for st in STAGES if st["name"] in keep]
+    force = {s.strip() for s in args.force.split(",") if s.strip()}
+    results = run_pipeline(stages, jobs=args.jobs, force=force, dry_run=args.dry_run)
+    if any(r["status"] in ("failed", "blocked") for r in results.values()):
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
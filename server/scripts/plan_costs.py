@@ -0,0 +1,287 @@
+# server/scripts/plan_costs.py
+# -*- coding: utf-8 -*-
+# Precomputes what planner.ts pickSet() returns for every course with nothing completed, per campus
+# and mode (easiest | hardest | fewest), into plan_cost. Same rules as the planner: a course costs
+# weightFromAvg(course_avg_cache.avg) (1 in fewest mode) plus the cost of its own tree, AND sums its
+# children, OR/MIN keep the `want` best children, and a course already on the DFS stack is taken as a
+# leaf. Standing / GPA / credit constraints cost nothing but add no courses either, so OR/MIN only
+# take a constraint-only option once the course options have run out.
+#
+# Evaluation is bottom-up over the strongly connected components of the course -> referenced-course
+# graph (Tarjan emits them sinks first). A course outside any cycle has a stack-independent result,
+# so it is solved once and reused by every course that needs it; only courses inside a cycle are
+# re-walked with the planner's stack rule.
+#
+# Each row carries the courses generation it was computed from; planner.ts ignores rows from an
+# older import, and /api/reparse deletes the rows of the edited course and everything that needs it.
+#
+#   python3 plan_costs.py            (DB_FILE)
+import json, re, sys, time
+
+import db
+
+DB = db.db_file()
+MODES = ("easiest", "hardest", "fewest")
+CAMPUSES = ("V", "O")
+
+BASE_RE = re.compile(r"^([A-Z]{2,5})(?:_([A-Z]))?\s+(\d{3}[A-Z]?)$")
+
+def to_base(cid):
+    m = BASE_RE.match(cid.upper())
+    return f"{m.group(1)} {m.group(3)}" if m else cid.upper()
+
+def weight_from_avg(avg):
+    return 25.0 if avg is None else max(0.0, 100.0 - avg)
+
+def is_coreq_meta(meta):
+    k = str((meta or {}).get("kind") or "").upper()
+    return k in ("CO_REQ", "COREQ")
+
+# ---- inputs ----------------------------------------------------------------
+def load_groups(cur):
+    # gid -> body of each shared group (courses.tree_json holds {"ref": gid} in its place)
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='requirement_groups'")
+    if cur.fetchone() is None:
+        return {}
+    cur.execute("PRAGMA table_info(requirement_groups)")
+    if "tree_json" not in {r[1] for r in cur.fetchall()}:
+        return {}
+    cur.execute("SELECT id, tree_json FROM requirement_groups")
+    out = {}
+    for gid, tj in cur.fetchall():
+        try:
+            out[gid] = json.loads(tj)
+        except ValueError:
+            pass
+    return out
+
+def expand_refs(node, groups):
+    # same as expandRefs() in src/req_groups.ts; a dangling ref reads as no requirement
+    if not isinstance(node, dict):
+        return node
+    if isinstance(node.get("ref"), str):
+        body = groups.get(node["ref"])
+        return dict(expand_refs(body, groups), gid=node["ref"]) if body else None
+    if not isinstance(node.get("children"), list):
+        return node
+    kids = [expand_refs(ch, groups) for ch in node["children"]]
+    return dict(node, children=[ch for ch in kids if ch is not None])
+
+def load_trees(cur):
+    trees, groups = {}, load_groups(cur)
+    cur.execute("SELECT id, tree_json FROM courses")
+    for cid, tj in cur.fetchall():
+        try:
+            trees[cid] = expand_refs(json.loads(tj), groups) if tj else None
+        except ValueError:
+            trees[cid] = None
+    return trees
+
+def load_avgs(cur):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='course_avg_cache'")
+    if cur.fetchone() is None:
+        print("[plan_cost] course_avg_cache missing; every course weighs the default 25")
+        return {}
+    cur.execute("SELECT base, campus, avg FROM course_avg_cache")
+    return {(base, campus): avg for base, campus, avg in cur.fetchall()}
+
+def course_refs(tree, out):
+    if not isinstance(tree, dict):
+        return out
+    if tree.get("type") == "course":
+        if tree.get("id"):
+            out.append(tree["id"])
+    elif "constraint" not in tree and "op" in tree:
+        for ch in tree.get("children") or ():
+            course_refs(ch, out)
+    return out
+
+# ---- graph -----------------------------------------------------------------
+def tarjan_sccs(graph):
+    # iterative Tarjan; components come out in reverse topological order (dependencies first)
+    index, low, on_stack, stack, comps = {}, {}, set(), [], []
+    counter = 0
+    for root in graph:
+        if root in index:
+            continue
+        work = [(root, iter(graph.get(root, ())))]
+        index[root] = low[root] = counter; counter += 1
+        stack.append(root); on_stack.add(root)
+        while work:
+            v, it = work[-1]
+            advanced = False
+            for w in it:
+                if w not in index:
+                    index[w] = low[w] = counter; counter += 1
+                    stack.append(w); on_stack.add(w)
+                    work.append((w, iter(graph.get(w, ()))))
+                    advanced = True
+                    break
+                if w in on_stack:
+                    low[v] = min(low[v], index[w])
+            if advanced:
+                continue
+            work.pop()
+            if work:
+                low[work[-1][0]] = min(low[work[-1][0]], low[v])
+            if low[v] == index[v]:
+                comp = []
+                while True:
+                    w = stack.pop(); on_stack.discard(w)
+                    comp.append(w)
+                    if w == v:
+                        break
+                comps.append(comp)
+    return comps
+
+def cycle_components(graph, comps):
+    # course -> its component, only for courses that sit on a cycle
+    comp_of = {}
+    for comp in comps:
+        if len(comp) > 1 or comp[0] in graph.get(comp[0], ()):
+            members = frozenset(comp)
+            for c in comp:
+                comp_of[c] = members
+    return comp_of
+
+# ---- solver ----------------------------------------------------------------
+# result = (course set, edges, cost, constraint_only)
+EMPTY = (frozenset(), (), 0.0, False)
+CONSTRAINT = (frozenset(), (), 0.0, True)
+
+def merge(results):
+    s, edges, cost = set(), {}, 0.0
+    for rs, re_, rc, _ in results:
+        s |= rs
+        edges.update(dict.fromkeys(re_))
+        cost += rc
+    return frozenset(s), tuple(edges), cost, bool(results) and all(r[3] for r in results)
+
+def make_solver(trees, comp_of, weight, mode):
+    # A course's result depends on the DFS stack only through the stacked courses it can reach, and
+    # those are all in its own component; outside cycles that part is always empty. So the memo key
+    # is (course, stacked members of its component) and acyclic courses are solved exactly once.
+    memo = {}
+    if mode == "fewest":
+        score = lambda r: len(r[0])
+    elif mode == "hardest":
+        score = lambda r: -r[2]
+    else:
+        score = lambda r: r[2]
+
+    def sub_of(cid, stack):
+        comp = comp_of.get(cid)
+        key = (cid, comp & stack) if comp else cid
+        r = memo.get(key)
+        if r is None:
+            stack.add(cid)
+            r = memo[key] = solve(trees.get(cid), cid, False, stack)
+            stack.discard(cid)
+        return r
+
+    def solve(node, parent, parent_coreq, stack):
+        if not isinstance(node, dict):
+            return EMPTY
+        if node.get("type") == "course":
+            cid = node.get("id")
+            if not cid:
+                return EMPTY
+            edges = ((cid, parent, parent_coreq),) if cid != parent else ()
+            if cid in stack:
+                return frozenset((cid,)), edges, weight(cid), False
+            ss, se, sc, _ = sub_of(cid, stack)
+            return ss | {cid}, tuple(dict.fromkeys(edges + se)), weight(cid) + sc, False
+        if "constraint" in node:
+            return CONSTRAINT
+        if "op" not in node:
+            return EMPTY
+        coreq = parent_coreq or is_coreq_meta(node.get("meta"))
+        children = [solve(ch, parent, coreq, stack) for ch in node.get("children") or ()]
+        if node["op"] == "AND":
+            return merge(children)
+        want = 1 if node["op"] == "OR" else max(1, int(node.get("min") or 1))
+        # constraint-only options sort after every course option
+        return merge(sorted(children, key=lambda r: (r[3], score(r)))[:want])
+
+    def plan(cid):
+        # the planner walks the root's tree with an empty stack, so a root on a cycle is expanded
+        # once more when the cycle comes back to it
+        return sub_of(cid, set()) if cid not in comp_of else solve(trees.get(cid), cid, False, set())
+
+    return plan
+
+def compute(trees, avgs, campus, mode, comps, comp_of):
+    if mode == "fewest":
+        weight = lambda cid: 1.0
+    else:
+        wcache = {}
+        def weight(cid):
+            base = to_base(cid)
+            if base not in wcache:
+                wcache[base] = weight_from_avg(avgs.get((base, campus)))
+            return wcache[base]
+    plan = make_solver(trees, comp_of, weight, mode)
+    # components arrive dependencies first, so every memo lookup below a course is already filled
+    return {cid: plan(cid) for comp in comps for cid in comp if cid in trees}
+
+# ---- table -----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='plan_cost'")
+    if cur.fetchone() is not None and "courses_gen" not in {r[1] for r in cur.execute("PRAGMA table_info(plan_cost)")}:
+        cur.execute("DROP TABLE plan_cost")   # every row is rewritten below anyway
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS plan_cost(
+            course_id   TEXT NOT NULL,
+            campus      TEXT NOT NULL,     -- 'V' | 'O', as passed to getAvg
+            mode        TEXT NOT NULL,     -- easiest | hardest | fewest
+            cost        REAL NOT NULL,
+            n_courses   INTEGER NOT NULL,
+            set_json    TEXT NOT NULL,     -- sorted course ids of the chosen set
+            edges_json  TEXT NOT NULL,     -- [[src, tgt, coreq], ...] as pickSet() returns them
+            courses_gen INTEGER NOT NULL,  -- table_generation of courses the row was computed from
+            computed_at TEXT NOT NULL,
+            PRIMARY KEY(course_id, campus, mode)
+        )""")
+
+PLAN_COST_INSERT = """
+    INSERT INTO plan_cost(course_id, campus, mode, cost, n_courses, set_json, edges_json, courses_gen, computed_at)
+    VALUES(?,?,?,?,?,?,?,?,?)
+"""
+
+def main():
+    print(f"[db] {DB}")
+    sys.setrecursionlimit(max(10000, sys.getrecursionlimit()))
+    con = db.connect(DB, "bulk")
+    try:
+        cur = con.cursor()
+        ensure_schema(cur)
+        t0 = time.perf_counter()
+        trees = load_trees(cur)
+        avgs = load_avgs(cur)
+        graph = {cid: course_refs(t, []) for cid, t in trees.items()}
+        comps = tarjan_sccs(graph)
+        comp_of = cycle_components(graph, comps)
+        print(f"[plan_cost] {len(trees)} courses, {len(comps)} components, {len(comp_of)} courses on cycles "
+              f"(largest {max(map(len, comp_of.values()), default=0)})")
+
+        now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+        gen = db.generation(con, "courses")
+        def rows():
+            for campus in CAMPUSES:
+                for mode in MODES:
+                    t1 = time.perf_counter()
+                    res = compute(trees, avgs, campus, mode, comps, comp_of)
+                    print(f"[plan_cost] {campus}/{mode}: {len(res)} courses in {time.perf_counter() - t1:.2f}s")
+                    for cid, (s, edges, cost, _) in res.items():
+                        yield (cid, campus, mode, round(cost, 6), len(s), json.dumps(sorted(s)),
+                               json.dumps([[a, b, bool(c)] for a, b, c in edges]), gen, now)
+
+        cur.execute("DELETE FROM plan_cost")
+        n = db.executemany_chunked(con, PLAN_COST_INSERT, rows(), chunk=5000, commit=False)
+        con.commit()
+        print(f"[plan_cost] {n} rows in {time.perf_counter() - t0:.2f}s")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
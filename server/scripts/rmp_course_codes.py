@@ -0,0 +1,126 @@
+# server/scripts/rmp_course_codes.py
+# -*- coding: utf-8 -*-
+# Canonical course codes for rmp_course_stats. course_code holds RMP's free-form class string
+# ("VISA180", "math 100", "CPSC110;121"); this fills indexed subject / course / base columns next to it
+# so the table joins grades_prof_course(subject, course) and courses (through base) without string
+# munging at query time.
+#
+# Parsing uses extractor_v2's COURSE_CODE_RE on the upper-cased string; a bare 3-digit number after a
+# code ("CPSC110;121", "MATH 100 102") is another course of the same subject. A string with no code, or
+# with more than one distinct code, is left unmapped and recorded in rmp_course_code_rejects for review.
+# rmp_import.py maps rows as the crawl writes them; RMP repeats the same class strings across
+# professors, so parse_code() is memoized. This script backfills older rows and records the rejects.
+#
+#   python3 rmp_course_codes.py            map rows not mapped yet        (DB_FILE)
+#   python3 rmp_course_codes.py --all      re-map every row
+import argparse, functools, os, re, sys, time
+
+import db
+
+EXTRACT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "extractors", "extract"))
+sys.path.insert(0, EXTRACT_DIR)
+from extractor_v2 import COURSE_CODE_RE   # stdlib-only module; one pattern for both sides
+
+DB = db.db_file()
+BARE_NUM_RE = re.compile(r"(?<![A-Z0-9])(\d{3}[A-Z]?)\b")
+
+def course_codes(text):
+    # every (subject, number) in text, bare numbers expanded with the subject of the code before them
+    out, subj, pos = [], None, 0
+    for m in COURSE_CODE_RE.finditer(text):
+        if subj:
+            out.extend((subj, n) for n in BARE_NUM_RE.findall(text, pos, m.start()))
+        subj = m.group(1)
+        out.append((subj, m.group(3)))
+        pos = m.end()
+    if subj:
+        out.extend((subj, n) for n in BARE_NUM_RE.findall(text, pos))
+    return list(dict.fromkeys(out))
+
+@functools.lru_cache(maxsize=None)
+def parse_code(raw):
+    # -> (subject, course, base, None) or (None, None, None, reason)
+    codes = course_codes((raw or "").upper())
+    if not codes:
+        return None, None, None, "no_code"
+    if len(codes) > 1:
+        return None, None, None, "multiple"
+    subj, num = codes[0]
+    return subj, num, f"{subj} {num}", None
+
+# ---- schema ----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute("PRAGMA table_info(rmp_course_stats)")
+    cols = {r[1] for r in cur.fetchall()}
+    if not cols:
+        return False
+    for col in ("subject", "course", "base"):
+        if col not in cols:
+            cur.execute(f"ALTER TABLE rmp_course_stats ADD COLUMN {col} TEXT")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rmp_course_subject ON rmp_course_stats(subject, course)")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_rmp_course_base ON rmp_course_stats(base)")
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS rmp_course_code_rejects(
+            course_code TEXT PRIMARY KEY,
+            reason      TEXT NOT NULL,     -- no_code | multiple
+            n_rows      INTEGER NOT NULL,
+            seen_at     TEXT NOT NULL
+        )""")
+    return True
+
+# ---- mapping ---------------------------------------------------------------
+def map_codes(con, everything=False):
+    cur = con.cursor()
+    where = "" if everything else "WHERE subject IS NULL"
+    cur.execute(f"SELECT course_code, COUNT(*) FROM rmp_course_stats {where} GROUP BY course_code")
+    groups = cur.fetchall()
+
+    mapped, rejects = [], []
+    for raw, n in groups:
+        subj, num, base, reason = parse_code(raw)
+        if reason:
+            rejects.append((raw, reason, n))
+        else:
+            mapped.append((subj, num, base, raw))
+
+    db.executemany_chunked(con, "UPDATE rmp_course_stats SET subject=?, course=?, base=? WHERE course_code=?",
+                           mapped, chunk=5000, commit=False)
+    if everything:
+        cur.execute("DELETE FROM rmp_course_code_rejects")
+        bad = [raw for raw, _, _ in rejects]
+        db.executemany_chunked(con, "UPDATE rmp_course_stats SET subject=NULL, course=NULL, base=NULL WHERE course_code=?",
+                               ((r,) for r in bad), chunk=5000, commit=False)
+    else:
+        # a string that parses now (e.g. after a pattern fix) is no longer a reject
+        db.executemany_chunked(con, "DELETE FROM rmp_course_code_rejects WHERE course_code=?",
+                               ((raw,) for _, _, _, raw in mapped), chunk=5000, commit=False)
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    db.executemany_chunked(con, """
+        INSERT INTO rmp_course_code_rejects(course_code, reason, n_rows, seen_at) VALUES(?,?,?,?)
+        ON CONFLICT(course_code) DO UPDATE SET reason=excluded.reason, n_rows=excluded.n_rows, seen_at=excluded.seen_at""",
+                           ((raw, reason, n, now) for raw, reason, n in rejects), chunk=5000, commit=False)
+    con.commit()
+    return len(groups), len(mapped), len(rejects)
+
+def main():
+    ap = argparse.ArgumentParser(description="Map rmp_course_stats.course_code to canonical subject/course/base")
+    ap.add_argument("--all", action="store_true", help="re-map rows that already have a mapping")
+    args = ap.parse_args()
+
+    print(f"[db] {DB}")
+    con = db.connect(DB, "bulk")
+    try:
+        if not ensure_schema(con.cursor()):
+            print("[codes] no rmp_course_stats; nothing to map")
+            return
+        t0 = time.perf_counter()
+        strings, ok, bad = map_codes(con, args.all)
+        print(f"[codes] {strings} distinct strings: {ok} mapped, {bad} rejected in {time.perf_counter() - t0:.2f}s")
+        cur = con.execute("SELECT COUNT(*), COUNT(base) FROM rmp_course_stats")
+        total, with_base = cur.fetchone()
+        print(f"[codes] rmp_course_stats: {with_base}/{total} rows mapped")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
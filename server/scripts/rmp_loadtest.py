@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+# server/scripts/rmp_loadtest.py
+# End-to-end professors/sec for the rmp_import crawl against the local replay stand-in.
+#
+#   python3 rmp_loadtest.py fixtures/rmp.jsonl.gz --concurrency 1,4,10,30 --latency 0.15 --rate-429 0.02
+import argparse, contextlib, io, os, tempfile, time
+
+import db
+import rmp_import
+import rmp_replay
+
+def run_once(url, threads, db_path, limit=0):
+    rmp_import.API_URL = url
+    rmp_import.DB_PATH = db_path
+    rmp_import.POLITE_DELAY = 0.0
+    rmp_import.ensure_db()
+    with contextlib.redirect_stdout(io.StringIO()):
+        t0 = time.monotonic()
+        profs = rmp_import.fetch_professors()
+        tids = rmp_import.read_professor_tids_from_rows(profs)
+        if limit:
+            tids = tids[:limit]
+        queued, written = rmp_import.crawl_course_stats(tids, threads=threads)
+        secs = time.monotonic() - t0
+    db.close_shared()
+    con = db.connect(db_path, "serve")
+    try:
+        db_rows = con.execute("SELECT COUNT(*) FROM rmp_course_stats").fetchone()[0]
+    finally:
+        con.close()
+    return {"profs": len(tids), "secs": secs, "rows": written, "db_rows": db_rows}
+
+def main():
+    ap = argparse.ArgumentParser(description="Load-test rmp_import against recorded fixtures")
+    ap.add_argument("fixtures", help="gzip JSON-lines file written with RMP_RECORD=...")
+    ap.add_argument("--concurrency", default="1,4,10,30", help="comma-separated thread counts")
+    ap.add_argument("--latency", type=float, default=0.1)
+    ap.add_argument("--jitter", type=float, default=0.05)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    ap.add_argument("--rate-429", type=float, default=0.0)
+    ap.add_argument("--batch", type=int, default=None, help="override RMP_RATINGS_BATCH (1 = per-teacher queries)")
+    ap.add_argument("--limit", type=int, default=0, help="only crawl the first N professors")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+
+    if args.batch is not None:
+        rmp_import.RATINGS_BATCH = args.batch
+    levels = [int(x) for x in args.concurrency.split(",") if x.strip()]
+    srv, url = rmp_replay.start_background(
+        args.fixtures, latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, rate_429=args.rate_429, seed=args.seed,
+    )
+    n_exact, n_pages = srv.fixture_counts
+    print(f"[load] stand-in {url}: {n_exact} recorded requests, {n_pages} teacher first pages")
+    print(f"[load] latency={args.latency}s jitter={args.jitter}s errors={args.error_rate} 429s={args.rate_429} batch={rmp_import.RATINGS_BATCH}")
+    print(f"{'threads':>8} {'profs':>7} {'secs':>8} {'profs/s':>9} {'requests':>9} {'misses':>7} {'5xx':>5} {'429':>5} {'rows':>7}")
+    try:
+        with tempfile.TemporaryDirectory() as td:
+            for threads in levels:
+                before = dict(srv.stats)
+                db_path = os.path.join(td, f"load_{threads}.db")
+                r = run_once(url, threads, db_path, args.limit)
+                d = {k: srv.stats[k] - before[k] for k in before}
+                rate = r["profs"] / r["secs"] if r["secs"] > 0 else 0.0
+                print(f"{threads:>8} {r['profs']:>7} {r['secs']:>8.2f} {rate:>9.1f} {d['requests']:>9} {d['misses']:>7} {d['errors']:>5} {d['throttled']:>5} {r['db_rows']:>7}")
+    finally:
+        srv.shutdown()
+        srv.server_close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+# server/scripts/rmp_replay.py
+# Record/replay for the RMP GraphQL endpoint used by rmp_import.py.
+#
+#   record : RMP_RECORD=fixtures/rmp.jsonl.gz python3 rmp_import.py
+#   replay : python3 rmp_replay.py fixtures/rmp.jsonl.gz --port 8787 --latency 0.15 --error-rate 0.01 --rate-429 0.02
+#            RMP_API_URL=http://127.0.0.1:8787/graphql RMP_POLITE_DELAY=0 python3 rmp_import.py
+import argparse, atexit, gzip, hashlib, json, os, random, threading, time, zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# ---- fixture store ---------------------------------------------------------
+def request_key(body):
+    canon = json.dumps({"query": body.get("query"), "variables": body.get("variables")}, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(canon.encode("utf-8")).hexdigest()
+
+def open_recorder(path):
+    # one gzip member per process; gzip.open(..., "rt") reads concatenated members back as one stream
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    lock = threading.Lock()
+    f = gzip.open(path, "at", encoding="utf-8")
+    def record(body, resp):
+        line = json.dumps({"key": request_key(body), "request": body, "response": resp}, ensure_ascii=False)
+        with lock:
+            if f.closed:
+                return
+            f.write(line + "\n")
+            f.flush()
+    def close():
+        # writes the gzip trailer; without it the member reads back as truncated
+        with lock:
+            f.close()
+    atexit.register(close)
+    record.close = close
+    return record
+
+def load_fixtures(path):
+    # a recording killed mid-write leaves a gzip member without its trailer (EOFError) or a
+    # half-written line; keep everything read up to that point
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        try:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line)
+                except ValueError:
+                    continue
+        except (EOFError, gzip.BadGzipFile, zlib.error) as e:
+            print(f"[replay] {path}: stopped at truncated gzip data ({e.__class__.__name__})")
+
+def build_index(fixtures):
+    # exact: request key -> response
+    # first_pages: teacher node id -> first ratings page, so aliased batches of any composition can be answered
+    exact, first_pages = {}, {}
+    for fx in fixtures:
+        req, resp = fx.get("request") or {}, fx.get("response") or {}
+        if not resp:
+            continue
+        exact[fx.get("key") or request_key(req)] = resp
+        q = req.get("query") or ""
+        v = req.get("variables") or {}
+        data = resp.get("data") or {}
+        if "RatingsListQuery" in q and not v.get("cursor"):
+            ratings = (data.get("node") or {}).get("ratings")
+            if ratings is not None and v.get("id"):
+                first_pages[v["id"]] = ratings
+        elif "BatchRatingsQuery" in q:
+            for k, tid in v.items():
+                if not k.startswith("id"):
+                    continue
+                ratings = (data.get("t" + k[2:]) or {}).get("ratings")
+                if ratings is not None:
+                    first_pages[tid] = ratings
+    return exact, first_pages
+
+def replay_response(body, exact, first_pages):
+    resp = exact.get(request_key(body))
+    if resp is not None:
+        return resp
+    q = body.get("query") or ""
+    v = body.get("variables") or {}
+    if "BatchRatingsQuery" in q:
+        data = {}
+        for k, tid in v.items():
+            if k.startswith("id"):
+                page = first_pages.get(tid)
+                data["t" + k[2:]] = {"__typename": "Teacher", "id": tid, "ratings": page} if page is not None else None
+        return {"data": data}
+    if "RatingsListQuery" in q and not v.get("cursor") and v.get("id") in first_pages:
+        return {"data": {"node": {"__typename": "Teacher", "id": v["id"], "ratings": first_pages[v["id"]]}}}
+    return None
+
+# ---- local stand-in --------------------------------------------------------
+def make_server(fixture_path, host="127.0.0.1", port=0, latency=0.0, jitter=0.0, error_rate=0.0, rate_429=0.0, seed=None):
+    exact, first_pages = build_index(load_fixtures(fixture_path))
+    rng = random.Random(seed)
+    rng_lock = threading.Lock()
+    stats = {"requests": 0, "hits": 0, "misses": 0, "errors": 0, "throttled": 0}
+    stats_lock = threading.Lock()
+
+    def bump(k):
+        with stats_lock:
+            stats[k] += 1
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def log_message(self, *args):
+            pass
+
+        def _send(self, code, payload, headers=None):
+            data = json.dumps(payload).encode("utf-8")
+            self.send_response(code)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_POST(self):
+            n = int(self.headers.get("content-length") or 0)
+            raw = self.rfile.read(n) if n else b""
+            bump("requests")
+            with rng_lock:
+                delay = latency + (rng.random() * jitter if jitter else 0.0)
+                roll = rng.random()
+            if delay > 0:
+                time.sleep(delay)
+            if roll < rate_429:
+                bump("throttled")
+                return self._send(429, {"errors": [{"message": "Too Many Requests"}]}, {"retry-after": "1"})
+            if roll < rate_429 + error_rate:
+                bump("errors")
+                return self._send(500, {"errors": [{"message": "injected failure"}]})
+            try:
+                body = json.loads(raw.decode("utf-8", "ignore"))
+            except ValueError:
+                return self._send(400, {"errors": [{"message": "bad json"}]})
+            resp = replay_response(body, exact, first_pages)
+            if resp is None:
+                bump("misses")
+                return self._send(200, {"data": None, "errors": [{"message": "no fixture for request"}]})
+            bump("hits")
+            self._send(200, resp)
+
+    srv = ThreadingHTTPServer((host, port), Handler)
+    srv.daemon_threads = True
+    srv.stats = stats
+    srv.fixture_counts = (len(exact), len(first_pages))
+    return srv
+
+def start_background(fixture_path, **kw):
+    srv = make_server(fixture_path, **kw)
+    t = threading.Thread(target=srv.serve_forever, name="rmp-standin", daemon=True)
+    t.start()
+    host, port = srv.server_address[:2]
+    return srv, f"http://{host}:{port}/graphql"
+
+def main():
+    ap = argparse.ArgumentParser(description="Replay recorded RMP GraphQL traffic on a local port")
+    ap.add_argument("fixtures", help="gzip JSON-lines file written with RMP_RECORD=...")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8787)
+    ap.add_argument("--latency", type=float, default=0.0, help="base seconds added to every response")
+    ap.add_argument("--jitter", type=float, default=0.0, help="extra uniform 0..jitter seconds")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with HTTP 500")
+    ap.add_argument("--rate-429", type=float, default=0.0, help="fraction of requests answered with HTTP 429")
+    ap.add_argument("--seed", type=int, default=None)
+    args = ap.parse_args()
+    srv = make_server(args.fixtures, args.host, args.port, args.latency, args.jitter, args.error_rate, args.rate_429, args.seed)
+    n_exact, n_pages = srv.fixture_counts
+    print(f"[replay] {n_exact} recorded requests, {n_pages} teacher first pages")
+    print(f"[replay] listening on http://{args.host}:{srv.server_address[1]}/graphql")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+        print(f"[replay] {srv.stats}")
+
+if __name__ == "__main__":
+    main()
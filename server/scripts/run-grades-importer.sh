@@ -21,6 +21,19 @@ fi
 
 mkdir -p "$OUT_DIR"
 
+# PAIR_ROOT may be the dataset archive (etl_enrich.py streams it); the Java importer walks a
+# directory, so unpack it to a temp dir that is removed on exit
+if [[ -f "$DATA_DIR" ]]; then
+  ARCHIVE="$DATA_DIR"
+  DATA_DIR="$(mktemp -d "${TMPDIR:-/tmp}/pair-grades.XXXXXX")"
+  trap 'rm -rf "$DATA_DIR"' EXIT
+  case "$ARCHIVE" in
+    *.zip|*.ZIP) python3 -m zipfile -e "$ARCHIVE" "$DATA_DIR" ;;
+    *) tar -xf "$ARCHIVE" -C "$DATA_DIR" ;;
+  esac
+  echo "unpacked $ARCHIVE -> $DATA_DIR"
+fi
+
 JAVA_SRC="$SRV_DIR/src/grades/ImportGrades.java"
 JAVA_PKG_DIR="$SRV_DIR/src"
 JAVA_OUT="$SRV_DIR/build/java"
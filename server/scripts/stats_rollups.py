@@ -0,0 +1,265 @@
+# server/scripts/stats_rollups.py
+# -*- coding: utf-8 -*-
+# Precomputes the professor and course statistics the viz panels show, so /api/viz reads one row by
+# primary key instead of pulling every section average and aggregating per request.
+#
+#   prof_stats_rollup(rmp_tid)            every section row matched to the RMP tid
+#   course_stats_rollup(subject, course)  every section of the course, co-instructor duplicates and
+#                                         OVERALL rows dropped
+#
+# Per key: section count, enrolment-weighted and plain mean of section averages, percentiles
+# (linear interpolation), a yearly series with its least-squares slope, and two fixed-bin histograms
+# stored as little-endian u32 arrays:
+#   avg_hist     AVG_BINS one-point bins over 0..100 (bin i holds averages in [i, i+1), 100 in the last);
+#                any integer-edged histogram over the same values can be re-binned from it exactly
+#   rating_hist  RATING_BINS bins over RMP avg_rating 1..5 in 0.2 steps, as RatingDistribution.tsx
+#
+# Each row keeps a hash of the section rows it was computed from; a refresh recomputes and rewrites
+# only keys whose hash moved and deletes keys that have no sections any more.
+#
+#   python3 stats_rollups.py             (DB_FILE)
+import hashlib, json, math, sys, time
+from array import array
+
+import db
+
+DB = db.db_file()
+SOURCES = ("viz_sections_with_rmp_mat", "viz_sections_with_rmp")
+PERCENTILES = (10, 25, 50, 75, 90)
+AVG_BINS = 101
+RATING_BINS = 20
+
+# ---- helpers ---------------------------------------------------------------
+def u32_blob(counts):
+    a = array("I", counts)
+    if sys.byteorder != "little":
+        a.byteswap()
+    return a.tobytes()
+
+def percentile(sorted_vals, q):
+    # numpy's default (linear) method
+    if not sorted_vals:
+        return None
+    pos = (len(sorted_vals) - 1) * q / 100.0
+    lo = int(math.floor(pos))
+    hi = min(lo + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (pos - lo)
+
+def weighted_mean(pairs):
+    # (avg, enrolled) pairs; sections without an enrolment count do not weigh in
+    num = den = 0.0
+    for a, n in pairs:
+        if a is not None and n:
+            num += a * n
+            den += n
+    return num / den if den else None
+
+def slope(points):
+    # least-squares slope of (x, y); None below two distinct x
+    pts = [(x, y) for x, y in points if x is not None and y is not None]
+    if len(pts) < 2:
+        return None
+    mx = sum(x for x, _ in pts) / len(pts)
+    my = sum(y for _, y in pts) / len(pts)
+    sxx = sum((x - mx) ** 2 for x, _ in pts)
+    if not sxx:
+        return None
+    return sum((x - mx) * (y - my) for x, y in pts) / sxx
+
+def avg_hist(vals):
+    counts = [0] * AVG_BINS
+    for v in vals:
+        counts[min(AVG_BINS - 1, max(0, int(math.floor(v))))] += 1
+    return counts
+
+def rating_hist(ratings):
+    # same arithmetic as RatingDistribution.tsx
+    counts = [0] * RATING_BINS
+    for v in ratings:
+        if v is None or v != v:
+            continue
+        c = max(1.0, min(5.0, v))
+        counts[min(RATING_BINS - 1, int(math.floor((c - 1) / 0.2)))] += 1
+    return counts
+
+# ---- stats -----------------------------------------------------------------
+def summarize(rows):
+    # rows: (subject, course, year, avg, enrolled, avg_rating)
+    vals = sorted(r[3] for r in rows if r[3] is not None)
+    enrolled = [r[4] for r in rows if r[4] is not None]
+    years = {}
+    for r in rows:
+        if r[2] is not None:
+            years.setdefault(r[2], []).append(r)
+    series = []
+    for y in sorted(years):
+        yr = years[y]
+        wm = weighted_mean((r[3], r[4]) for r in yr)
+        series.append([y, None if wm is None else round(wm, 4), len(yr),
+                       sum(r[4] for r in yr if r[4] is not None)])
+    out = {
+        "n_sections": len(rows),
+        "total_enrolled": sum(enrolled) if enrolled else None,
+        "wmean": weighted_mean((r[3], r[4]) for r in rows),
+        "mean": sum(vals) / len(vals) if vals else None,
+        "min_avg": vals[0] if vals else None,
+        "max_avg": vals[-1] if vals else None,
+        "first_year": series[0][0] if series else None,
+        "last_year": series[-1][0] if series else None,
+        "trend": slope((y, m) for y, m, _, _ in series),
+        "years_json": json.dumps(series),
+        "avg_hist": u32_blob(avg_hist(vals)),
+        "rating_hist": u32_blob(rating_hist(r[5] for r in rows)),
+    }
+    for p in PERCENTILES:
+        out[f"p{p}"] = percentile(vals, p)
+    return out
+
+def per_course(rows):
+    # the per-course table of /professor_overview
+    by = {}
+    for r in rows:
+        by.setdefault(f"{r[0]} {r[1]}", []).append(r)
+    out = []
+    for code in sorted(by):
+        rs = by[code]
+        avgs = [r[3] for r in rs if r[3] is not None]
+        enr = [r[4] for r in rs if r[4] is not None]
+        yrs = [r[2] for r in rs if r[2] is not None]
+        out.append({"course_code": code, "n_sections": len(rs),
+                    "avg_of_avg": sum(avgs) / len(avgs) if avgs else None,
+                    "total_enrolled": sum(enr) if enr else None,
+                    "first_year": min(yrs) if yrs else None, "last_year": max(yrs) if yrs else None})
+    return out
+
+# ---- schema ----------------------------------------------------------------
+STAT_COLUMNS = """
+            n_sections     INTEGER NOT NULL,
+            total_enrolled INTEGER,
+            wmean          REAL,               -- enrolment-weighted mean of section averages
+            mean           REAL,
+            p10 REAL, p25 REAL, p50 REAL, p75 REAL, p90 REAL,
+            min_avg REAL, max_avg REAL,
+            first_year INTEGER, last_year INTEGER,
+            trend          REAL,               -- slope of the yearly weighted mean, points per year
+            years_json     TEXT NOT NULL,      -- [[year, wmean, n_sections, enrolled], ...]
+            avg_hist       BLOB NOT NULL,      -- u32[AVG_BINS]
+            rating_hist    BLOB NOT NULL,      -- u32[RATING_BINS]
+            src_hash       TEXT NOT NULL,
+            refreshed_at   TEXT NOT NULL"""
+
+def ensure_schema(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS prof_stats_rollup(
+            rmp_tid TEXT PRIMARY KEY,
+            n_courses    INTEGER NOT NULL,
+            courses_json TEXT NOT NULL,        -- /professor_overview perCourse rows
+            {STAT_COLUMNS}
+        )""")
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS course_stats_rollup(
+            subject TEXT NOT NULL,
+            course  TEXT NOT NULL,
+            n_instructors INTEGER NOT NULL,
+            {STAT_COLUMNS},
+            PRIMARY KEY(subject, course)
+        )""")
+
+STAT_FIELDS = ("n_sections", "total_enrolled", "wmean", "mean", "p10", "p25", "p50", "p75", "p90",
+               "min_avg", "max_avg", "first_year", "last_year", "trend", "years_json",
+               "avg_hist", "rating_hist")
+
+# ---- refresh ---------------------------------------------------------------
+def grouped(cur, sql, nkey):
+    # stream (key, rows) from a query ordered by its first nkey columns
+    cur.execute(sql)
+    key, rows = None, []
+    for r in cur:
+        k = r[:nkey]
+        if k != key:
+            if rows:
+                yield key, rows
+            key, rows = k, []
+        rows.append(r[nkey:])
+    if rows:
+        yield key, rows
+
+def row_hash(rows):
+    h = hashlib.sha1()
+    for r in rows:
+        h.update(repr(r).encode("utf-8"))
+    return h.hexdigest()
+
+def refresh_table(con, table, key_cols, sql, extra_cols, extra):
+    cur = con.cursor()
+    where = " AND ".join(f"{k} = ?" for k in key_cols)
+    cur.execute(f"SELECT {', '.join(key_cols)}, src_hash FROM {table}")
+    old = {tuple(r[:-1]): r[-1] for r in cur.fetchall()}
+
+    cols = (*key_cols, *extra_cols, *STAT_FIELDS, "src_hash", "refreshed_at")
+    upsert = (f"INSERT OR REPLACE INTO {table}({', '.join(cols)}) "
+              f"VALUES({', '.join('?' * len(cols))})")
+    now = time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime())
+    seen, changed = set(), 0
+    for key, rows in grouped(con.cursor(), sql, len(key_cols)):
+        seen.add(key)
+        h = row_hash(rows)
+        if old.get(key) == h:
+            continue
+        stats = summarize([r[:6] for r in rows])
+        cur.execute(upsert, (*key, *extra(rows), *(stats[f] for f in STAT_FIELDS), h, now))
+        changed += 1
+    gone = [k for k in old if k not in seen]
+    for k in gone:
+        cur.execute(f"DELETE FROM {table} WHERE {where}", k)
+    con.commit()
+    print(f"[rollup] {table}: {len(seen)} keys, {changed} rewritten, {len(gone)} removed")
+    return changed, len(gone)
+
+def prof_extra(rows):
+    pc = per_course(rows)
+    return len(pc), json.dumps(pc)
+
+def course_extra(rows):
+    # r[6]: the section's instructors joined with \x1f
+    return (len({n for r in rows for n in (r[6] or "").split("\x1f") if n}),)
+
+def refresh(con):
+    cur = con.cursor()
+    ensure_schema(cur)
+    src = next((s for s in SOURCES if db.table_exists(cur, s)), None)
+    if src is None:
+        print("[rollup] no viz_sections_with_rmp(_mat); run viz_sections_mat.py first")
+        return
+    print(f"[rollup] source {src}")
+
+    # everything matched to the tid, as the professor panels list it
+    refresh_table(con, "prof_stats_rollup", ("rmp_tid",), f"""
+        SELECT rmp_tid, subject, course, year, avg, enrolled, avg_rating, session, section, campus
+        FROM {src}
+        WHERE rmp_tid IS NOT NULL
+        ORDER BY rmp_tid, subject, course, year, session, section, campus, avg, enrolled""",
+        ("n_courses", "courses_json"), prof_extra)
+
+    # one row per section: gpc repeats a section per co-instructor
+    refresh_table(con, "course_stats_rollup", ("subject", "course"), f"""
+        SELECT subject, course, subject, course, year, MAX(avg), MAX(enrolled), MAX(avg_rating),
+               GROUP_CONCAT(TRIM(instructor), char(31))
+        FROM {src}
+        WHERE UPPER(COALESCE(section, '')) <> 'OVERALL'
+        GROUP BY subject, course, campus, year, session, section
+        ORDER BY subject, course, year, session, section, campus""",
+        ("n_instructors",), course_extra)
+
+def main():
+    print(f"[db] {DB}")
+    con = db.connect(DB, "bulk")
+    try:
+        t0 = time.perf_counter()
+        refresh(con)
+        print(f"[rollup] done in {time.perf_counter() - t0:.2f}s")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
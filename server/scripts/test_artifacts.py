@@ -0,0 +1,97 @@
+import os, tempfile, unittest
+from unittest import mock
+
+import artifacts
+
+class StoreCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        p = mock.patch.object(artifacts, "STORE_DIR", os.path.join(self.tmp.name, "store"))
+        p.start()
+        self.addCleanup(p.stop)
+        self.out = os.path.join(self.tmp.name, "out.csv")
+        # a ticking clock keeps LRU order exact
+        clock = iter(range(1000, 2000))
+        t = mock.patch.object(artifacts.time, "time", lambda: float(next(clock)))
+        t.start()
+        self.addCleanup(t.stop)
+
+    def put(self, key, data):
+        # random bytes don't compress, so stored sizes are predictable
+        with open(self.out, "wb") as f:
+            f.write(data)
+        return artifacts.put("extract", key, [self.out])
+
+    def read(self):
+        with open(self.out, "rb") as f:
+            return f.read()
+
+class TestStore(StoreCase):
+    def test_put_lookup_restore(self):
+        e = self.put("k1", b"a,b\n1,2\n")
+        f = e["files"][os.path.abspath(self.out)]
+        self.assertEqual(f["sha1"], artifacts.file_sha1(self.out))
+        self.assertEqual(artifacts.lookup("k1"), e)
+        self.assertIsNone(artifacts.lookup("nope"))
+        os.remove(self.out)
+        self.assertTrue(artifacts.restore("k1"))
+        self.assertEqual(self.read(), b"a,b\n1,2\n")
+        other = os.path.join(self.tmp.name, "elsewhere.csv")
+        self.assertTrue(artifacts.restore("k1", {os.path.abspath(self.out): other}))
+        with open(other, "rb") as g:
+            self.assertEqual(g.read(), b"a,b\n1,2\n")
+        self.assertFalse(artifacts.restore("nope"))
+
+    def test_identical_outputs_share_a_blob(self):
+        self.put("k1", b"same")
+        self.put("k2", b"same")
+        blobs = [fn for _, _, fs in os.walk(os.path.join(artifacts.STORE_DIR, "blobs")) for fn in fs]
+        self.assertEqual(len(blobs), 1)
+
+    def test_rollback(self):
+        for i in range(3):
+            self.put(f"k{i}", f"gen {i}".encode())
+        self.assertEqual(artifacts.rollback("extract"), "k1")
+        self.assertEqual(self.read(), b"gen 1")
+        self.assertEqual(artifacts.rollback("extract", steps=2), "k0")
+        self.assertEqual(self.read(), b"gen 0")
+        self.assertIsNone(artifacts.rollback("extract", steps=3))
+        self.assertIsNone(artifacts.rollback("unknown"))
+
+class TestEvict(StoreCase):
+    def setUp(self):
+        super().setUp()
+        p = mock.patch.object(artifacts, "CACHE_MB", 100_000 / (1024 * 1024))
+        p.start()
+        self.addCleanup(p.stop)
+
+    def test_lru_eviction_under_small_cap(self):
+        for i in range(4):
+            self.put(f"k{i}", os.urandom(40_000))
+        m = artifacts.load_manifest()
+        # 4 x ~40KB against a 100KB cap: the two oldest sets and their blobs go
+        self.assertEqual(sorted(m["entries"]), ["k2", "k3"])
+        self.assertIsNone(artifacts.lookup("k0"))
+        blobs = [fn for _, _, fs in os.walk(os.path.join(artifacts.STORE_DIR, "blobs")) for fn in fs]
+        self.assertEqual(len(blobs), 2)
+        # restoring an older set makes it the most recent, so the next put evicts k3 instead
+        self.assertTrue(artifacts.restore("k2"))
+        self.put("k4", os.urandom(40_000))
+        self.assertEqual(sorted(artifacts.load_manifest()["entries"]), ["k2", "k4"])
+
+    def test_newest_set_survives_even_over_cap(self):
+        self.put("big", os.urandom(150_000))
+        self.assertIsNotNone(artifacts.lookup("big"))
+
+    def test_rollback_to_evicted_set_is_reported(self):
+        for i in range(4):
+            self.put(f"k{i}", os.urandom(40_000))
+        self.assertEqual(artifacts.load_manifest()["history"]["extract"], ["k0", "k1", "k2", "k3"])
+        self.assertEqual(artifacts.rollback("extract"), "k2")
+        # two generations back is k1, which was evicted: say so instead of restoring k0 or nothing
+        with self.assertRaises(artifacts.Evicted):
+            artifacts.rollback("extract", steps=2)
+
+if __name__ == "__main__":
+    unittest.main()
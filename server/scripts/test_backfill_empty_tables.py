@@ -0,0 +1,55 @@
+import sqlite3, unittest
+from unittest import mock
+
+import backfill_empty_tables as bf
+
+class TestPairSections(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE grades_prof_course(campus TEXT, subject TEXT, course TEXT, section TEXT, year INTEGER,
+                                            session TEXT, title TEXT, detail TEXT, instructor TEXT,
+                                            enrolled INTEGER, avg REAL);
+            INSERT INTO grades_prof_course VALUES
+                ('UBCV', 'CPSC', '110', '101', 2023, 'W', 'Intro', '', 'Ann Lee', 100, 70.0),
+                ('UBCV', 'CPSC', '110', '101', 2023, 'W', 'Intro', '', 'Bob Ray', 100, 70.0),
+                ('UBCV', 'CPSC', '110', '102', NULL, 'W', 'Intro', '', 'Ann Lee', 50, 75.0),
+                ('UBCV', 'CPSC', '110', '103', 2022, NULL, 'Intro', '', 'Cy Doe', 40, 68.0),
+                ('UBCO', 'MATH', '100', '001', 2023, 'S', 'Calc', '', 'Di Fox', 30, 72.0),
+                ('UBCV', 'CPSC', '',    '101', 2023, 'W', 'Bad', '', 'Ann Lee', 10, 50.0);
+        """)
+        cur = self.con.cursor()
+        with mock.patch("builtins.print"):
+            bf.ensure_pair_sections_schema(cur)
+
+    def backfill(self):
+        with mock.patch("builtins.print"):
+            return bf.backfill_pair_sections(self.con.cursor())
+
+    def rows(self):
+        return self.con.execute("""SELECT campus, subject, course, section, year, session, enrolled, avg, profs_raw
+                                   FROM pair_sections ORDER BY campus, subject, course, section""").fetchall()
+
+    def test_second_run_writes_nothing(self):
+        self.assertEqual(self.backfill(), 4)
+        first = self.rows()
+        self.assertEqual(first, [
+            ("UBCO", "MATH", "100", "001", 2023, "S", 30, 72.0, "Di Fox"),
+            ("UBCV", "CPSC", "110", "101", 2023, "W", 100, 70.0, "Ann Lee,Bob Ray"),
+            ("UBCV", "CPSC", "110", "102", None, "W", 50, 75.0, "Ann Lee"),
+            ("UBCV", "CPSC", "110", "103", 2022, None, 40, 68.0, "Cy Doe"),
+        ])
+        self.assertEqual(self.backfill(), 0)
+        # NULL year / session rows are matched, not inserted a second time
+        self.assertEqual(self.rows(), first)
+
+    def test_changed_rows_are_updated_in_place(self):
+        self.backfill()
+        self.con.execute("UPDATE grades_prof_course SET avg = 80.0 WHERE section IN ('101', '102')")
+        self.assertEqual(self.backfill(), 2)
+        self.assertEqual([r[7] for r in self.rows()], [72.0, 80.0, 80.0, 68.0])
+        self.assertEqual(self.con.execute("SELECT COUNT(*) FROM pair_sections").fetchone()[0], 4)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import sqlite3, unittest
+from unittest import mock
+
+import course_avg_cache as cac
+
+def fetch_avg_for_base(sections):
+    # fetchAvgForBase() in planner.ts over one term's ubcgrades sections: OVERALL's average if there
+    # is one, else the plain mean of the section averages
+    overall = next((s for s in sections if (s["section"] or "").upper() == "OVERALL"), None)
+    if overall and overall["average"]:
+        return overall["average"]
+    vals = [s["average"] for s in sections if isinstance(s["average"], (int, float))]
+    return sum(vals) / len(vals) if vals else None
+
+class TestCache(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.execute("""CREATE TABLE grades_prof_course(campus TEXT, subject TEXT, course TEXT, section TEXT,
+                                                            year INTEGER, session TEXT, instructor TEXT,
+                                                            enrolled INTEGER, avg REAL)""")
+
+    def add(self, rows):
+        self.con.executemany("INSERT INTO grades_prof_course VALUES (?,?,?,?,?,?,?,?,?)", rows)
+
+    def cache(self, recent_years=3):
+        cur = self.con.cursor()
+        cac.ensure_schema(cur)
+        with mock.patch("builtins.print"):
+            cac.load_terms(cur)
+            cac.refresh_cache(cur, recent_years)
+        return {(b, c): a for b, c, a in self.con.execute("SELECT base, campus, avg FROM course_avg_cache")}
+
+    def test_single_term_matches_fetch_avg_for_base(self):
+        terms = {
+            # OVERALL present: its average, whatever the sections say
+            ("CPSC", "110"): [("101", 200, 70.0), ("102", 20, 90.0), ("OVERALL", 220, 71.8)],
+            # no OVERALL: plain mean of the sections, not weighted by enrolment
+            ("MATH", "100"): [("101", 300, 60.0), ("102", 10, 80.0), ("103", None, 70.0)],
+            ("PHYS", "101"): [("101", 40, 66.0)],
+        }
+        for (subj, num), secs in terms.items():
+            self.add([("UBCV", subj, num, sec, 2023, "W", "X", enr, avg) for sec, enr, avg in secs])
+        # a co-instructor repeats section 101 of MATH 100; it is still one section
+        self.add([("UBCV", "MATH", "100", "101", 2023, "W", "Y", 300, 60.0)])
+        got = self.cache()
+        for (subj, num), secs in terms.items():
+            want = fetch_avg_for_base([{"section": sec, "average": avg} for sec, _, avg in secs])
+            self.assertAlmostEqual(got[(f"{subj} {num}", "V")], want, msg=(subj, num))
+
+    def test_recent_terms_and_campus(self):
+        self.add([("UBCV", "CPSC", "110", "OVERALL", 2018, "W", "", 100, 50.0),   # outside the window
+                  ("UBCV", "CPSC", "110", "OVERALL", 2022, "W", "", 100, 70.0),
+                  ("UBCV", "CPSC", "110", "OVERALL", 2023, "W", "", 300, 80.0),
+                  ("UBCO", "CPSC", "110", "101", 2023, "W", "Z", 30, 65.0),
+                  ("XXXX", "CPSC", "110", "101", 2023, "W", "Z", 30, 10.0)])
+        got = self.cache(recent_years=3)
+        # terms are weighted by their enrolment when every term has one
+        self.assertAlmostEqual(got[("CPSC 110", "V")], (70 * 100 + 80 * 300) / 400)
+        self.assertAlmostEqual(got[("CPSC 110", "O")], 65.0)
+        self.assertEqual(len(got), 2)
+
+if __name__ == "__main__":
+    unittest.main()
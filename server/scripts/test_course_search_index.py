@@ -0,0 +1,44 @@
+import sqlite3, unittest
+
+import course_search_index as csi
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE courses(id TEXT PRIMARY KEY, title TEXT, prereq_text TEXT);
+            INSERT INTO courses VALUES
+                ('CPSC_V 110', 'Computation, Programs, and Programming', NULL),
+                ('CPSC_O 110', 'Intro to Programming', NULL),
+                ('MATH_V 110', 'Differential Calculus', 'High-school calculus'),
+                ('CPSC 210', 'Software Construction', 'One of CPSC 110, CPSC 107.');
+        """)
+
+    def test_second_refresh_rewrites_nothing(self):
+        self.assertEqual(csi.refresh(self.con), (4, 0, 0, 4))
+        self.assertEqual(csi.refresh(self.con), (0, 0, 0, 4))
+
+    def test_only_edited_course_is_rewritten(self):
+        csi.refresh(self.con)
+        self.con.execute("UPDATE courses SET title = 'Software Design' WHERE id = 'CPSC 210'")
+        self.assertEqual(csi.refresh(self.con), (0, 1, 0, 4))
+        self.assertEqual(csi.search(self.con, "DESIGN"), ["CPSC 210"])
+        self.assertEqual(csi.search(self.con, "CONSTRUCTION"), [])
+        self.con.execute("DELETE FROM courses WHERE id = 'CPSC_O 110'")
+        self.con.execute("INSERT INTO courses VALUES ('PHYS 101', 'Energy', NULL)")
+        self.assertEqual(csi.refresh(self.con), (1, 0, 1, 4))
+        self.assertEqual(self.con.execute("SELECT COUNT(*) FROM course_search").fetchone()[0], 4)
+
+    def test_served_query_puts_code_hits_first(self):
+        csi.refresh(self.con)
+        # "110" is in three codes; "CPSC 110" is matched with or without the campus suffix
+        self.assertEqual(csi.search(self.con, "110"), ["CPSC 110", "MATH 110"])
+        self.assertEqual(csi.search(self.con, "CPSC110"), ["CPSC 110"])
+        # a title-only hit sorts after code hits
+        self.con.execute("UPDATE courses SET title = 'Prep for CPSC 2 courses' WHERE id = 'MATH_V 110'")
+        csi.refresh(self.con)
+        self.assertEqual(csi.search(self.con, "CPSC 2"), ["CPSC 210", "MATH 110"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+import math, random, sqlite3, unittest
+
+import grade_stats as gs
+
+def reference(con):
+    # plain SQL + Python for every field grade_stats computes with numpy
+    key = "subject, course, COALESCE(NULLIF(TRIM(instructor), ''), '(unknown)')"
+    out = {}
+    for k0, k1, k2, n, enrolled, n_avg, mean, sw, swa in con.execute(f"""
+            SELECT {key}, COUNT(*), COALESCE(SUM(enrolled), 0), COUNT(avg), AVG(avg),
+                   SUM(CASE WHEN avg IS NOT NULL THEN enrolled END),
+                   SUM(CASE WHEN avg IS NOT NULL THEN enrolled * avg END)
+            FROM grades_prof_course GROUP BY {key}"""):
+        g = (k0, k1, k2)
+        rows = con.execute(f"SELECT avg, enrolled FROM grades_prof_course WHERE ({key}) = (?,?,?) AND avg IS NOT NULL",
+                           g).fetchall()
+        vals = sorted(a for a, _ in rows)
+        wmean = swa / sw if sw else None
+        r = {"n_sections": n, "n_enrolled": enrolled, "n_with_avg": n_avg, "mean": mean, "wmean": wmean,
+             "wvar": sum((e or 0) * (a - wmean) ** 2 for a, e in rows) / sw if sw else None,
+             "min_avg": vals[0] if vals else None, "max_avg": vals[-1] if vals else None}
+        for q in gs.PERCENTILES:
+            if not vals:
+                r[f"p{q}"] = None
+                continue
+            pos = (len(vals) - 1) * q / 100.0
+            lo = math.floor(pos)
+            hi = min(lo + 1, len(vals) - 1)
+            r[f"p{q}"] = vals[lo] + (vals[hi] - vals[lo]) * (pos - lo)
+        out[g] = r
+    return out
+
+@unittest.skipUnless(gs.np is not None, "numpy not installed")
+class TestGroupStats(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.execute("""CREATE TABLE grades_prof_course(subject TEXT, course TEXT, instructor TEXT, year INTEGER,
+                                                            session TEXT, enrolled INTEGER, avg REAL)""")
+        rng = random.Random(5)
+        rows = []
+        for i in range(300):
+            avg = None if rng.random() < 0.1 else round(rng.uniform(50, 95), 2)
+            enrolled = None if rng.random() < 0.1 else rng.randint(0, 200)
+            instr = rng.choice(["Ann Lee", " Ann Lee ", "Bob Ray", "", None, "Cy Doe"])
+            rows.append((rng.choice(["CPSC", "MATH"]), rng.choice(["100", "110", "200"]), instr,
+                         rng.choice([2021, 2022, None]), rng.choice(["W", "S", None]), enrolled, avg))
+        rows += [("PHYS", "101", "No Avg", 2022, "W", 30, None), ("PHYS", "101", "No Avg", 2023, "W", 40, None),
+                 ("PHYS", "102", "No Enrol", 2022, "W", None, 70.0), ("PHYS", "102", "No Enrol", 2022, "S", None, 80.0),
+                 ("PHYS", "103", "Single", 2022, "W", 25, 66.5),
+                 ("PHYS", "104", "Tie", 2022, "W", 10, 75.0), ("PHYS", "104", "Tie", 2022, "S", 10, 75.0)]
+        self.con.executemany("INSERT INTO grades_prof_course VALUES (?,?,?,?,?,?,?)", rows)
+
+    def computed(self):
+        groups, sessions, cols, n = gs.load(self.con)
+        at, stats = gs.group_stats(cols, len(groups))
+        terms = gs.term_stats(cols, sessions)
+        out = {}
+        for row in gs.rows_out(groups, sessions, at, stats, terms, "now", chunk=7):
+            out[row[:3]] = dict(zip(gs.STAT_FIELDS, row[3:3 + len(gs.STAT_FIELDS)]))
+        return out
+
+    def test_matches_reference(self):
+        got, want = self.computed(), reference(self.con)
+        self.assertEqual(sorted(got), sorted(want))
+        for g, w in want.items():
+            for f, v in w.items():
+                if v is None:
+                    self.assertIsNone(got[g][f], (g, f))
+                else:
+                    self.assertAlmostEqual(got[g][f], v, places=7, msg=(g, f))
+
+    def test_edge_groups(self):
+        got = self.computed()
+        no_avg = got[("PHYS", "101", "No Avg")]
+        self.assertEqual((no_avg["n_sections"], no_avg["n_enrolled"], no_avg["n_with_avg"]), (2, 70, 0))
+        self.assertTrue(all(no_avg[f] is None for f in ("mean", "wmean", "wvar", "p50", "min_avg")))
+        no_enrol = got[("PHYS", "102", "No Enrol")]
+        self.assertEqual((no_enrol["mean"], no_enrol["wmean"], no_enrol["p50"]), (75.0, None, 75.0))
+        single = got[("PHYS", "103", "Single")]
+        self.assertEqual((single["wmean"], single["wvar"], single["p10"], single["p90"]), (66.5, 0.0, 66.5, 66.5))
+        self.assertEqual(got[("PHYS", "104", "Tie")]["wvar"], 0.0)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import os, sqlite3, tempfile, unittest
+
+import graph_snapshot as gs
+
+class TestRoundTrip(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.path = os.path.join(self.tmp.name, "graph.snapshot")
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE courses(id TEXT PRIMARY KEY);
+            CREATE TABLE edges(id INTEGER PRIMARY KEY, source_id TEXT, target_id TEXT, kind TEXT, group_id TEXT);
+            INSERT INTO courses VALUES ('CPSC 110'), ('CPSC 210'), ('CPSC 221'), ('MATH 100'), ('FRAN 2é0');
+            -- table order within a target is interleaved on purpose; MATH 12 is only an edge endpoint
+            INSERT INTO edges(source_id, target_id, kind, group_id) VALUES
+                ('CPSC 210', 'CPSC 221', 'REQ', 'g1'),
+                ('CPSC 110', 'CPSC 210', 'REQ', NULL),
+                ('MATH 100', 'CPSC 221', 'REQ', 'g1'),
+                ('MATH 12', 'MATH 100', 'REQ', NULL),
+                ('CPSC 110', 'CPSC 221', 'CO_REQ', NULL),
+                ('FRAN 2é0', 'CPSC 110', 'EXCL', 'g2');
+        """)
+
+    def write(self):
+        counts, sections = gs.build(*gs.load_graph(self.con))
+        gs.write_atomic(self.path, gs.encode(counts, sections, 123))
+        return gs.open_snapshot(self.path)
+
+    def test_edges_into_matches_sql(self):
+        snap = self.write()
+        self.assertEqual(snap["generation"], 123)
+        for node in snap["index"]:
+            want = self.con.execute("SELECT source_id, target_id, kind, group_id FROM edges "
+                                    "WHERE target_id = ? ORDER BY id", (node,)).fetchall()
+            self.assertEqual(list(gs.edges_into(snap, node)), want, node)
+        self.assertEqual(gs.check(self.con, snap), (6, 0))
+        flags = {n: snap["flags"][i] for n, i in snap["index"].items()}
+        self.assertEqual(flags["MATH 12"], 0)
+        self.assertEqual(flags["FRAN 2é0"], 1)
+
+    def test_check_reports_a_stale_snapshot(self):
+        snap = self.write()
+        self.con.execute("UPDATE edges SET group_id = 'g9' WHERE source_id = 'MATH 100'")
+        self.assertEqual(gs.check(self.con, snap), (6, 1))
+        self.con.execute("INSERT INTO edges(source_id, target_id, kind) VALUES ('CPSC 110', 'MATH 100', 'REQ')")
+        self.assertEqual(gs.check(self.con, snap), (6, 3))
+
+    def test_corruption_is_detected(self):
+        self.write()
+        with open(self.path, "r+b") as f:
+            f.seek(-1, os.SEEK_END)
+            last = f.read(1)
+            f.seek(-1, os.SEEK_END)
+            f.write(bytes([last[0] ^ 1]))
+        with self.assertRaisesRegex(ValueError, "checksum"):
+            gs.open_snapshot(self.path)
+
+if __name__ == "__main__":
+    unittest.main()
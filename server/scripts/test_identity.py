@@ -0,0 +1,187 @@
+import os, random, sqlite3, string, tempfile, unittest
+from unittest import mock
+
+import identity
+
+RMP = [("1", "John Smith", 5), ("2", "Jonathon Smyth", 3), ("3", "Mario Garcia", 1),
+       ("4", "Marie Garcia", 1), ("5", "Alice Wong", 2)]
+
+class TestVerdicts(unittest.TestCase):
+    def setUp(self):
+        self.st = identity.new_state(RMP)
+
+    def resolve(self, name, allow_initial=True):
+        return identity.resolve_one(name, self.st, 0.8, 200, allow_initial)
+
+    def test_exact(self):
+        self.assertEqual(self.resolve("john  SMITH."), ("1", 1.0, "exact", 1))
+
+    def test_initial(self):
+        lg, conf, method, n = self.resolve("J Smith")
+        self.assertEqual((lg, method, n), ("1", "initial", 1))
+        self.assertTrue(0.85 <= conf <= 0.95)
+
+    def test_fuzzy(self):
+        lg, conf, method, _ = self.resolve("Alice Wongg")
+        self.assertEqual((lg, method), ("5", "fuzzy"))
+        self.assertAlmostEqual(conf, 2 * 10 / 21)
+        self.assertEqual(self.resolve("Nobody Here"), (None, 0.0, "none", 0))
+
+    def test_ambiguity_penalty(self):
+        # Mario and Marie Garcia score the same; the penalty applies and tie_key picks the lower id
+        lg, conf, method, n = self.resolve("Maria Garcia")
+        self.assertEqual((lg, method, n), ("3", "fuzzy", 2))
+        self.assertAlmostEqual(conf, 2 * 11 / 24 - identity.AMBIGUITY_PENALTY)
+        # above threshold on its own, below once penalised
+        self.assertEqual(identity.resolve_one("Maria Garcia", self.st, 0.9, 200)[2], "none")
+
+    def test_tombstoned_row_is_not_matched(self):
+        identity.drop_rmp_row(self.st, self.st["pos"]["1"])
+        self.assertNotEqual(self.resolve("John Smith")[0], "1")
+
+@unittest.skipUnless(identity.np is not None, "numpy not installed")
+class TestBlockParity(unittest.TestCase):
+    # resolve_block (numpy, bit-parallel over many pairs) must give resolve_one's verdicts
+    def test_random_names(self):
+        rng = random.Random(11)
+        def word(lo, hi):
+            return "".join(rng.choice("aeiourstnlmk") for _ in range(rng.randint(lo, hi))).capitalize()
+        rows = [(str(i), f"{word(2, 8)} {word(3, 10)}", rng.randint(0, 3)) for i in range(300)]
+        # duplicated names under different ids (ties) and names near / over NP_MAX_LEN
+        rows += [(str(300 + i), rows[i][1], rows[i][2]) for i in range(0, 40, 2)]
+        long_first = "".join(rng.choice(string.ascii_lowercase) for _ in range(identity.NP_MAX_LEN - 8)).capitalize()
+        rows += [("900", f"{long_first} Longname", 1), ("901", f"{long_first}x Longname", 1)]
+        st = identity.new_state(rows)
+        identity.drop_rmp_row(st, st["pos"]["7"])
+        names = []
+        for _, nm, _ in rows[:150]:
+            chars = list(nm)
+            for _ in range(rng.randint(0, 3)):
+                chars[rng.randrange(len(chars))] = rng.choice("aeiourstnlmk")
+            names.append("".join(chars))
+        names += [f"{long_first} Longnam", f"{long_first}xy Longname", f"{long_first}xyz Longnamee", "Zz Qq"]
+        for threshold, cap in ((0.8, 200), (0.85, 5), (0.6, 0)):
+            for allow_initial in (True, False):
+                block = identity.resolve_block(names, st, threshold, cap, allow_initial)
+                scalar = [(n,) + identity.resolve_one(n, st, threshold, cap, allow_initial) for n in names]
+                for b, s in zip(block, scalar):
+                    self.assertEqual(b[:2] + b[3:], s[:2] + s[3:], (threshold, cap, b, s))
+                    self.assertAlmostEqual(b[2], s[2], places=9)
+
+def _inprocess(calls):
+    # resolve_parallel without the process pool, recording which names each pass scored
+    def run(names, st, threshold, cap, label, allow_initial=True):
+        calls.setdefault(label, []).extend(names)
+        return identity.resolve_block(names, st, threshold, cap, allow_initial)
+    return run
+
+class DbCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        env = mock.patch.dict(os.environ, {"IDENTITY_INDEX_FILE": os.path.join(self.tmp.name, "idx.pickle"),
+                                           "IDENTITY_REBUILD": ""})
+        env.start()
+        self.addCleanup(env.stop)
+        self.addCleanup(self.tmp.cleanup)
+        self.con = sqlite3.connect(os.path.join(self.tmp.name, "t.db"))
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE rmp_professors(legacy_id TEXT PRIMARY KEY, first_name TEXT, last_name TEXT, num_ratings INTEGER);
+            CREATE TABLE grades_prof_course(instructor TEXT, instructor_id TEXT);
+        """)
+
+    def add_rmp(self, rows):
+        self.con.executemany("INSERT INTO rmp_professors VALUES(?,?,?,?)",
+                             [(lg, nm.split()[0], nm.split()[1], nr) for lg, nm, nr in rows])
+        self.con.commit()
+
+    def identities(self):
+        return {n: (lg, m) for n, lg, m in self.con.execute("SELECT name, rmp_legacy_id, method FROM instructor_identity")}
+
+class TestIncremental(DbCase):
+    def run_resolve(self):
+        calls = {}
+        with mock.patch.object(identity, "resolve_parallel", _inprocess(calls)):
+            stats = identity.resolve_identities(self.con, threshold=0.8)
+        return stats, calls
+
+    def test_only_touched_names_are_rescored(self):
+        self.add_rmp(RMP)
+        names = ["John Smith", "Alice Wongg", "Peter Parkr", "Maria Garcia"]
+        self.con.executemany("INSERT INTO grades_prof_course(instructor) VALUES(?)", [(n,) for n in names])
+        self.con.commit()
+
+        stats, calls = self.run_resolve()
+        self.assertEqual(stats, {"names": 4, "rmp_new": 5, "rmp_gone": 0})
+        self.assertEqual(sorted(calls["new names"]), sorted(names))
+        self.assertEqual(self.identities()["Peter Parkr"], (None, "none"))
+
+        # a new RMP row: exact matches are left alone, everything else is only scored against it
+        self.add_rmp([("6", "Peter Parker", 4)])
+        stats, calls = self.run_resolve()
+        self.assertEqual(stats, {"names": 0, "rmp_new": 1, "rmp_gone": 0})
+        self.assertEqual(calls.get("affected names"), [])
+        self.assertEqual(sorted(calls["vs new rmp"]), ["Alice Wongg", "Maria Garcia", "Peter Parkr"])
+        self.assertEqual(self.identities()["Peter Parkr"], ("6", "fuzzy"))
+        self.assertEqual(self.identities()["Alice Wongg"], ("5", "fuzzy"))
+
+        # a removed row: only the names mapped to it go through the full pipeline again
+        self.con.execute("DELETE FROM rmp_professors WHERE legacy_id='5'")
+        self.con.commit()
+        stats, calls = self.run_resolve()
+        self.assertEqual(stats, {"names": 0, "rmp_new": 0, "rmp_gone": 1})
+        self.assertEqual(calls["affected names"], ["Alice Wongg"])
+        self.assertNotIn("vs new rmp", calls)
+        self.assertEqual(self.identities()["Alice Wongg"], (None, "none"))
+        self.assertEqual(self.identities()["John Smith"], ("1", "exact"))
+
+        stats, calls = self.run_resolve()
+        self.assertEqual(stats, {"names": 0, "rmp_new": 0, "rmp_gone": 0})
+        self.assertEqual(calls, {})
+
+class TestApply(DbCase):
+    def setUp(self):
+        super().setUp()
+        cur = self.con.cursor()
+        identity.ensure_identity_schema(cur)
+        self.con.executescript("""
+            CREATE TABLE rmp_instructor_map(instructor TEXT PRIMARY KEY, legacy_id TEXT);
+            CREATE TABLE instructors(id INTEGER PRIMARY KEY, name TEXT NOT NULL, norm TEXT NOT NULL UNIQUE);
+            CREATE TABLE instructor_rmp_match(instructor_id INTEGER NOT NULL, rmp_legacy_id TEXT NOT NULL,
+                                              confidence REAL NOT NULL DEFAULT 1.0,
+                                              PRIMARY KEY(instructor_id, rmp_legacy_id));
+            INSERT INTO instructor_identity VALUES
+                ('Ann Lee', 'ann lee', 'x', 0.9, 'fuzzy', 1, 't'),
+                ('Bob Ray', 'bob ray', NULL, 0.0, 'none', 0, 't');
+            INSERT INTO instructors VALUES (1, 'Ann Lee', 'ann lee'), (2, 'Bob Ray', 'bob ray');
+            -- stale links from an earlier run, plus a hand-entered one for an unmatched name
+            INSERT INTO rmp_instructor_map VALUES ('Ann Lee', 'old'), ('Bob Ray', 'hand');
+            INSERT INTO instructor_rmp_match VALUES (1, 'old', 0.8), (2, 'hand', 1.0);
+            INSERT INTO grades_prof_course VALUES ('Ann Lee ', 'old'), ('Bob Ray', 'hand'), ('Cy Doe', NULL);
+        """)
+
+    def state(self):
+        q = lambda sql: sorted(self.con.execute(sql).fetchall(), key=repr)
+        return (q("SELECT * FROM rmp_instructor_map"), q("SELECT * FROM instructor_rmp_match"),
+                q("SELECT * FROM grades_prof_course"))
+
+    def test_fill_only_refreshes_matched_names(self):
+        self.assertEqual(identity.apply_identities(self.con), 1)
+        m, match, gpc = self.state()
+        self.assertEqual(m, [("Ann Lee", "x"), ("Bob Ray", "hand")])
+        self.assertEqual(match, [(1, "x", 0.9), (2, "hand", 1.0)])
+        self.assertEqual(gpc, [("Ann Lee ", "x"), ("Bob Ray", "hand"), ("Cy Doe", None)])
+        # idempotent
+        identity.apply_identities(self.con)
+        self.assertEqual(self.state(), (m, match, gpc))
+
+    def test_rebuild_copies_identity_exactly(self):
+        with mock.patch.dict(os.environ, {"IDENTITY_REBUILD": "1"}):
+            identity.apply_identities(self.con)
+        m, match, gpc = self.state()
+        self.assertEqual(m, [("Ann Lee", "x")])
+        self.assertEqual(match, [(1, "x", 0.9)])
+        self.assertEqual(gpc, [("Ann Lee ", "x"), ("Bob Ray", None), ("Cy Doe", None)])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,150 @@
+import os, sqlite3, sys, tempfile, time, unittest
+from unittest import mock
+
+import artifacts
+import pipeline as pl
+
+PY = sys.executable
+
+def write_table(table, sleep=0.0, log=None):
+    # a stage that (re)creates `table` from DB_FILE, optionally logging when it held the DB
+    return [PY, "-c", f"""
+import os, sqlite3, time
+t0 = time.time()
+time.sleep({sleep})
+c = sqlite3.connect(os.environ["DB_FILE"])
+c.execute("CREATE TABLE IF NOT EXISTS {table}(x)")
+c.execute("INSERT INTO {table} VALUES (1)")
+c.commit()
+if {log!r}:
+    open({log!r}, "a").write(f"{table} {{t0}} {{time.time()}}\\n")
+"""]
+
+def write_file(path, sleep=0.0, log=None):
+    return [PY, "-c", f"""
+import time
+t0 = time.time()
+time.sleep({sleep})
+open({path!r}, "w").write("out")
+if {log!r}:
+    open({log!r}, "a").write(f"file {{t0}} {{time.time()}}\\n")
+"""]
+
+class PipelineCase(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(self.tmp.cleanup)
+        self.db = self.path("p.db")
+        patches = [mock.patch.object(pl, "DB_PATH", self.db), mock.patch.object(pl, "LOG_DIR", self.path("logs")),
+                   mock.patch.object(artifacts, "STORE_DIR", self.path("artifacts"))]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+        self.code = self.path("stage_code.py")
+        with open(self.code, "w") as f:
+            f.write("# v1\n")
+
+    def path(self, name):
+        return os.path.join(self.tmp.name, name)
+
+    def run_quiet(self, stages, **kw):
+        with mock.patch("builtins.print"):
+            return pl.run_pipeline(stages, **kw)
+
+    def statuses(self, res):
+        return {n: r["status"] for n, r in res.items()}
+
+class TestPlanStage(PipelineCase):
+    def setUp(self):
+        super().setUp()
+        self.inp = self.path("in.txt")
+        with open(self.inp, "w") as f:
+            f.write("a")
+        self.st = pl.stage("load", write_table("t"), self.tmp.name, inputs=[("file", self.inp)],
+                           outputs=[("table", "t")], code=[self.code], ttl_hours=1)
+        self.con = sqlite3.connect(self.db)
+        self.addCleanup(self.con.close)
+
+    def test_reasons(self):
+        plan = lambda state, force=False: pl.plan_stage(self.con, self.st, state, {}, force)[:2]
+        key = pl.input_key(self.con, self.st, {})
+        fresh = {"load": {"input_key": key, "run_id": "r1", "finished_at": time.time()}}
+        self.assertEqual(plan({}), (True, "never ran"))
+        self.assertEqual(plan(fresh), (True, "outputs missing"))
+        self.con.execute("CREATE TABLE t(x)")
+        self.assertEqual(plan(fresh), (False, "up to date"))
+        self.assertEqual(plan(fresh, force=True), (True, "forced"))
+        old = {"load": dict(fresh["load"], finished_at=time.time() - 7200)}
+        self.assertEqual(plan(old), (True, "older than 1h"))
+        with open(self.inp, "w") as f:
+            f.write("b")
+        self.assertEqual(plan(fresh), (True, "inputs or code changed"))
+
+    def test_key_tracks_code_and_upstream_runs(self):
+        key = pl.input_key(self.con, self.st, {})
+        with open(self.code, "a") as f:
+            f.write("# v2\n")
+        self.assertNotEqual(pl.input_key(self.con, self.st, {}), key)
+        st = pl.stage("down", ["true"], self.tmp.name, inputs=[("table", "t")])
+        self.con.execute("CREATE TABLE t(x)")
+        # same COUNT/MAX(rowid), different producing run
+        self.assertNotEqual(pl.input_key(self.con, st, {("table", "t"): "r1"}),
+                            pl.input_key(self.con, st, {("table", "t"): "r2"}))
+
+    def test_python_stages_list_shared_modules(self):
+        for st in pl.STAGES:
+            if st["cmd"][0] == pl.PY and st["cwd"] == pl.HERE:
+                self.assertIn(os.path.join(pl.HERE, "db.py"), st["code"], st["name"])
+        by_name = {st["name"]: st for st in pl.STAGES}
+        for name in ("rmp_load", "pair_ingest", "backfill"):
+            self.assertIn(os.path.join(pl.HERE, "identity.py"), by_name[name]["code"], name)
+
+class TestRunPipeline(PipelineCase):
+    def test_second_run_skips_until_something_changes(self):
+        inp = self.path("in.txt")
+        with open(inp, "w") as f:
+            f.write("a")
+        stages = [pl.stage("load", write_table("t"), self.tmp.name, inputs=[("file", inp)],
+                           outputs=[("table", "t")], code=[self.code]),
+                  pl.stage("down", write_table("u"), self.tmp.name, inputs=[("table", "t")],
+                           outputs=[("table", "u")], code=[self.code])]
+        self.assertEqual(self.statuses(self.run_quiet(stages)), {"load": "ok", "down": "ok"})
+        self.assertEqual(self.statuses(self.run_quiet(stages)), {"load": "skipped", "down": "skipped"})
+        # a rerun upstream reruns downstream even though t's shape is the same
+        self.assertEqual(self.statuses(self.run_quiet(stages, force={"load"})), {"load": "ok", "down": "ok"})
+        with open(inp, "w") as f:
+            f.write("b")
+        self.assertEqual(self.statuses(self.run_quiet(stages)), {"load": "ok", "down": "ok"})
+
+    def test_failure_blocks_downstream(self):
+        stages = [pl.stage("bad", [PY, "-c", "raise SystemExit(3)"], self.tmp.name, outputs=[("table", "t")]),
+                  pl.stage("down", write_table("u"), self.tmp.name, inputs=[("table", "t")], outputs=[("table", "u")])]
+        self.assertEqual(self.statuses(self.run_quiet(stages)), {"bad": "failed", "down": "blocked"})
+
+    def test_one_db_writer_at_a_time(self):
+        log = self.path("times.log")
+        stages = [pl.stage("w1", write_table("a", 0.4, log), self.tmp.name, outputs=[("table", "a")]),
+                  pl.stage("w2", write_table("b", 0.4, log), self.tmp.name, outputs=[("table", "b")]),
+                  pl.stage("f", write_file(self.path("f.out"), 0.4, log), self.tmp.name,
+                           outputs=[("file", self.path("f.out"))])]
+        res = self.run_quiet(stages, jobs=3)
+        self.assertEqual(set(self.statuses(res).values()), {"ok"})
+        spans = {}
+        with open(log) as f:
+            for line in f:
+                name, t0, t1 = line.split()
+                spans[name] = (float(t0), float(t1))
+        (a0, a1), (b0, b1), (f0, f1) = spans["a"], spans["b"], spans["file"]
+        self.assertTrue(a1 <= b0 or b1 <= a0, spans)
+        # the file-only stage is not held back by the writers
+        self.assertLess(f0, max(a1, b1) - 0.3)
+
+    def test_cycle_is_reported(self):
+        x = self.path("x.txt")
+        stages = [pl.stage("a", write_table("t"), self.tmp.name, inputs=[("file", x)], outputs=[("table", "t")]),
+                  pl.stage("b", write_file(x), self.tmp.name, inputs=[("table", "t")], outputs=[("file", x)])]
+        with self.assertRaisesRegex(RuntimeError, "cycle among: a, b"):
+            self.run_quiet(stages)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,65 @@
+import unittest
+import plan_costs as pc
+
+def course(cid):
+    return {"type": "course", "id": cid}
+
+def plan_all(trees, mode="easiest", avgs=None):
+    graph = {cid: pc.course_refs(t, []) for cid, t in trees.items()}
+    comps = pc.tarjan_sccs(graph)
+    return pc.compute(trees, avgs or {}, "V", mode, comps, pc.cycle_components(graph, comps))
+
+class TestPlanCosts(unittest.TestCase):
+    def test_or_prefers_course_over_constraint(self):
+        trees = {
+            "CPSC 110": None,
+            "CPSC 210": {"op": "OR", "children": [course("CPSC 110"), {"constraint": "CREDITS_AT_LEAST", "credits_min": 30}]},
+            "CPSC 221": {"op": "OR", "children": [{"constraint": "YEAR_STANDING", "year_min": 2}, course("CPSC 210")]},
+        }
+        for mode in pc.MODES:
+            res = plan_all(trees, mode)
+            self.assertEqual(res["CPSC 210"][0], {"CPSC 110"}, mode)
+            self.assertEqual(res["CPSC 221"][0], {"CPSC 110", "CPSC 210"}, mode)
+
+    def test_min_falls_back_to_constraint(self):
+        year = {"constraint": "YEAR_STANDING", "year_min": 3}
+        trees = {
+            "MATH 100": None,
+            "MATH 300": {"op": "MIN", "min": 2, "children": [year, course("MATH 100")]},
+            "MATH 400": {"op": "OR", "children": [{"op": "AND", "children": [year]}]},
+        }
+        res = plan_all(trees)
+        self.assertEqual(res["MATH 300"][0], {"MATH 100"})
+        self.assertEqual(res["MATH 400"][:3], (frozenset(), (), 0.0))
+
+    def test_or_keeps_cheaper_course(self):
+        trees = {
+            "A 100": None,
+            "B 100": None,
+            "C 200": {"op": "OR", "children": [course("A 100"), course("B 100")]},
+        }
+        res = plan_all(trees, avgs={("A 100", "V"): 60.0, ("B 100", "V"): 80.0})
+        self.assertEqual(res["C 200"][0], {"B 100"})
+        self.assertAlmostEqual(res["C 200"][2], 20.0)
+
+    def test_load_trees_expands_group_refs(self):
+        import sqlite3
+        con = sqlite3.connect(":memory:")
+        con.execute("CREATE TABLE courses(id TEXT PRIMARY KEY, tree_json TEXT)")
+        con.execute("CREATE TABLE requirement_groups(id TEXT PRIMARY KEY, op TEXT, min INTEGER, kind TEXT, tree_json TEXT)")
+        inner = {"op": "OR", "min": 1, "children": [course("MATH 100"), course("MATH 180")]}
+        outer = {"op": "MIN", "min": 2, "children": [{"ref": "g1"}, course("STAT 200"), {"ref": "gone"}]}
+        con.executemany("INSERT INTO requirement_groups VALUES(?,?,?,?,?)",
+                        [("g1", "OR", 1, None, pc.json.dumps(inner)), ("g2", "MIN", 2, None, pc.json.dumps(outer))])
+        con.executemany("INSERT INTO courses VALUES(?,?)",
+                        [("A 300", pc.json.dumps({"op": "AND", "children": [course("A 100"), {"ref": "g2"}]})),
+                         ("B 300", pc.json.dumps({"ref": "g1"})), ("A 100", None)])
+        trees = pc.load_trees(con.cursor())
+        self.assertEqual(trees["B 300"], dict(inner, gid="g1"))
+        # nested refs expand too; a dangling ref drops out
+        self.assertEqual(trees["A 300"]["children"][1],
+                         {"op": "MIN", "min": 2, "gid": "g2", "children": [dict(inner, gid="g1"), course("STAT 200")]})
+        self.assertIsNone(trees["A 100"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,23 @@
+import unittest
+import rmp_course_codes as rc
+
+class TestParseCode(unittest.TestCase):
+    def test_single_code(self):
+        self.assertEqual(rc.parse_code("VISA180"), ("VISA", "180", "VISA 180", None))
+        self.assertEqual(rc.parse_code("math 100"), ("MATH", "100", "MATH 100", None))
+        self.assertEqual(rc.parse_code("CPSC 110 CPSC110"), ("CPSC", "110", "CPSC 110", None))
+
+    def test_bare_numbers_are_extra_codes(self):
+        for raw in ("CPSC110;121", "CPSC110/121", "CPSC 110, 121", "MATH 100 102"):
+            self.assertEqual(rc.parse_code(raw), (None, None, None, "multiple"), raw)
+        self.assertEqual(rc.course_codes("CPSC110;121"), [("CPSC", "110"), ("CPSC", "121")])
+        self.assertEqual(rc.course_codes("MATH 100 102 STAT 200"), [("MATH", "100"), ("MATH", "102"), ("STAT", "200")])
+
+    def test_repeated_number_and_non_codes(self):
+        self.assertEqual(rc.parse_code("MATH 100 100")[3], None)
+        self.assertEqual(rc.parse_code("MATH 100 2019")[3], None)   # a year, not a course
+        self.assertEqual(rc.parse_code("121"), (None, None, None, "no_code"))
+        self.assertEqual(rc.parse_code(""), (None, None, None, "no_code"))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,92 @@
+import math, random, sqlite3, unittest
+from array import array
+from unittest import mock
+
+import stats_rollups as sr
+
+def rebin_unit_hist(unit, lo_v, hi_v, bins_req):
+    # rebinUnitHist() in viz_api.ts
+    lo, hi = max(0, math.floor(lo_v)), min(100, math.ceil(hi_v))
+    step = max(1, math.ceil((hi - lo) / bins_req))
+    edges = list(range(lo, hi, step)) + [hi]
+    counts = [0] * (len(edges) - 1)
+    for b, n in enumerate(unit):
+        if n:
+            counts[min(len(counts) - 1, max(0, (b - lo) // step))] += n
+    return counts
+
+def direct_hist(vals, bins_req):
+    # the per-request fallback in viz_api.ts /professor_overview: bin the raw averages
+    lo, hi = max(0, math.floor(min(vals))), min(100, math.ceil(max(vals)))
+    step = max(1, math.ceil((hi - lo) / bins_req))
+    counts = [0] * len(range(lo, hi, step))
+    for v in vals:
+        counts[min(len(counts) - 1, max(0, math.floor((v - lo) / step)))] += 1
+    return counts
+
+class TestHelpers(unittest.TestCase):
+    def test_percentile_is_linear_interpolation(self):
+        vals = [1.0, 2.0, 3.0, 4.0]
+        self.assertEqual([sr.percentile(vals, q) for q in (0, 25, 50, 75, 100)], [1.0, 1.75, 2.5, 3.25, 4.0])
+        self.assertEqual(sr.percentile([7.0], 90), 7.0)
+        self.assertIsNone(sr.percentile([], 50))
+
+    def test_slope(self):
+        self.assertAlmostEqual(sr.slope([(2020, 70), (2021, 72), (2022, 74)]), 2.0)
+        self.assertAlmostEqual(sr.slope([(2020, 70), (2021, 75), (2021, 71), (2022, 70)]), 0.0)
+        self.assertIsNone(sr.slope([(2020, 70)]))
+        self.assertIsNone(sr.slope([(2020, 70), (2020, 80)]))
+        self.assertIsNone(sr.slope([(2020, 70), (None, 80), (2021, None)]))
+
+    def test_avg_hist_rebins_exactly(self):
+        rng = random.Random(3)
+        for _ in range(200):
+            vals = [round(rng.uniform(40, 100), rng.choice((0, 1, 2))) for _ in range(rng.randint(1, 60))]
+            vals += rng.sample([50.0, 60.0, 99.99, 100.0], 2)   # bin edges and the top value
+            unit = list(array("I", sr.u32_blob(sr.avg_hist(vals))))
+            self.assertEqual(sum(unit), len(vals))
+            for bins_req in (1, 7, 10, 20, 60, 101):
+                self.assertEqual(rebin_unit_hist(unit, min(vals), max(vals), bins_req),
+                                 direct_hist(vals, bins_req), (vals, bins_req))
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE viz_sections_with_rmp_mat(campus TEXT, subject TEXT, course TEXT, section TEXT, year INTEGER,
+                                                   session TEXT, instructor TEXT, enrolled INTEGER, avg REAL,
+                                                   rmp_tid TEXT, avg_rating REAL);
+            INSERT INTO viz_sections_with_rmp_mat VALUES
+                ('UBCV', 'CPSC', '110', '101', 2022, 'W', 'Ann Lee', 100, 70.0, '1', 4.0),
+                ('UBCV', 'CPSC', '110', '101', 2022, 'W', 'Bob Ray', 100, 70.0, '2', 3.0),
+                ('UBCV', 'CPSC', '110', '102', 2023, 'W', 'Ann Lee', 50, 76.0, '1', 4.0),
+                ('UBCV', 'CPSC', '110', 'OVERALL', 2023, 'W', '', 150, 72.0, NULL, NULL);
+        """)
+
+    def refresh(self):
+        with mock.patch("builtins.print") as out:
+            sr.refresh(self.con)
+        return [str(c.args[0]) for c in out.call_args_list if "rewritten" in str(c.args[0])]
+
+    def test_course_rollup_counts_a_shared_section_once(self):
+        self.refresh()
+        n, n_instr, mean, wmean = self.con.execute(
+            "SELECT n_sections, n_instructors, mean, wmean FROM course_stats_rollup").fetchone()
+        self.assertEqual((n, n_instr, mean), (2, 2, 73.0))
+        self.assertAlmostEqual(wmean, (70 * 100 + 76 * 50) / 150)
+        # the professor rollup keeps every matched row
+        self.assertEqual(self.con.execute("SELECT rmp_tid, n_sections FROM prof_stats_rollup ORDER BY 1").fetchall(),
+                         [("1", 2), ("2", 1)])
+
+    def test_only_changed_keys_are_rewritten(self):
+        self.refresh()
+        self.assertEqual(self.refresh(), ["[rollup] prof_stats_rollup: 2 keys, 0 rewritten, 0 removed",
+                                          "[rollup] course_stats_rollup: 1 keys, 0 rewritten, 0 removed"])
+        self.con.execute("UPDATE viz_sections_with_rmp_mat SET avg = 80.0 WHERE section = '102'")
+        self.assertEqual(self.refresh(), ["[rollup] prof_stats_rollup: 2 keys, 1 rewritten, 0 removed",
+                                          "[rollup] course_stats_rollup: 1 keys, 1 rewritten, 0 removed"])
+        self.assertEqual(self.con.execute("SELECT max_avg FROM course_stats_rollup").fetchone()[0], 80.0)
+
+if __name__ == "__main__":
+    unittest.main()
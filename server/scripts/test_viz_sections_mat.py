@@ -0,0 +1,77 @@
+import sqlite3, unittest
+from unittest import mock
+
+import db
+import viz_sections_mat as vm
+
+SECTIONS = [("UBCV", "CPSC", "110", "101", 2023, "W", "Intro", "Ann Lee", 100, 70.0),
+            ("UBCV", "CPSC", "110", "102", 2023, "W", "Intro", "Bob Ray", 80, 75.0),
+            ("UBCV", "MATH", "100", "101", 2023, "W", "Calc", "Ann Lee ", 50, 65.0)]
+
+class TestRefresh(unittest.TestCase):
+    def setUp(self):
+        self.con = sqlite3.connect(":memory:")
+        self.addCleanup(self.con.close)
+        self.con.executescript("""
+            CREATE TABLE grades_prof_course(campus TEXT, subject TEXT, course TEXT, section TEXT, year INTEGER,
+                                            session TEXT, title TEXT, instructor TEXT, enrolled INTEGER, avg REAL);
+            CREATE TABLE rmp_professors(legacy_id TEXT, avg_rating REAL, avg_difficulty REAL, num_ratings INTEGER,
+                                        would_take_again_pct REAL);
+            CREATE TABLE instructor_identity(name TEXT PRIMARY KEY, rmp_legacy_id TEXT);
+            INSERT INTO rmp_professors VALUES ('1', 4.0, 3.0, 10, 80.0), ('2', 3.0, 2.0, 5, 60.0);
+            INSERT INTO instructor_identity VALUES ('Ann Lee', '1'), ('Bob Ray', NULL);
+        """)
+        self.load(SECTIONS)
+
+    def load(self, rows):
+        # what etl_enrich.py's PAIR load does: replace every row and bump the generation
+        self.con.execute("DELETE FROM grades_prof_course")
+        self.con.executemany("INSERT INTO grades_prof_course VALUES (?,?,?,?,?,?,?,?,?,?)", rows)
+        db.bump_generation(self.con, "grades_prof_course")
+
+    def refresh(self):
+        with mock.patch("builtins.print") as out:
+            vm.refresh(self.con)
+        return " | ".join(str(c.args[0]) for c in out.call_args_list)
+
+    def mat(self):
+        return self.con.execute(f"""SELECT subject, course, section, instructor_key, rmp_tid, avg, avg_rating
+                                    FROM {vm.MAT} ORDER BY subject, course, section""").fetchall()
+
+    def test_incremental_paths(self):
+        self.assertIn("rebuilt 3 rows", self.refresh())
+        self.assertEqual(self.mat(), [("CPSC", "110", "101", "Ann Lee", "1", 70.0, 4.0),
+                                      ("CPSC", "110", "102", "Bob Ray", None, 75.0, None),
+                                      ("MATH", "100", "101", "Ann Lee", "1", 65.0, 4.0)])
+        self.assertIn("up to date", self.refresh())
+
+        # Bob is matched: only his rows are re-joined
+        self.con.execute("UPDATE instructor_identity SET rmp_legacy_id='2' WHERE name='Bob Ray'")
+        self.assertIn("1 instructors re-matched; 1 rows rewritten", self.refresh())
+        self.assertEqual(self.mat()[1][4:], ("2", 75.0, 3.0))
+
+        # a rating moves: rows for that tid are updated in place
+        self.con.execute("UPDATE rmp_professors SET avg_rating=4.5 WHERE legacy_id='1'")
+        self.assertIn("rmp stats: 2 rows updated", self.refresh())
+        self.assertEqual([r[6] for r in self.mat()], [4.5, 3.0, 4.5])
+
+    def test_same_size_reload_rebuilds(self):
+        self.refresh()
+        before = self.con.execute("SELECT COUNT(*), MAX(rowid) FROM grades_prof_course").fetchone()
+        self.load([r[:9] + (r[9] + 5,) for r in SECTIONS])
+        # COUNT and MAX(rowid) come back the same; only the generation moved
+        self.assertEqual(self.con.execute("SELECT COUNT(*), MAX(rowid) FROM grades_prof_course").fetchone(), before)
+        self.assertIn("rebuilt 3 rows", self.refresh())
+        self.assertEqual([r[5] for r in self.mat()], [75.0, 80.0, 70.0])
+
+    def test_state_carried_over_from_legacy_table(self):
+        self.refresh()
+        fp = db.get_state(self.con, "viz_mat", "source_fingerprint")
+        self.con.execute("DELETE FROM etl_state")
+        self.con.execute("CREATE TABLE viz_mat_state(key TEXT PRIMARY KEY, value TEXT)")
+        self.con.execute("INSERT INTO viz_mat_state VALUES ('source_fingerprint', ?)", (fp,))
+        self.assertIn("up to date", self.refresh())
+        self.assertFalse(db.table_exists(self.con, "viz_mat_state"))
+
+if __name__ == "__main__":
+    unittest.main()
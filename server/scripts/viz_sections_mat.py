@@ -0,0 +1,166 @@
+# server/scripts/viz_sections_mat.py
+# -*- coding: utf-8 -*-
+# Materializes the viz_sections_with_rmp view (src/viz_views.sql) into viz_sections_with_rmp_mat so
+# the professor and course panels in viz_api.ts are index lookups instead of a join per request.
+#
+# Rows come from viz_sections when the database has it, else from grades_prof_course (same columns).
+# Every row carries its join keys precomputed: instructor_key (TRIM(instructor), what
+# instructor_identity is keyed by) and instructor_norm (viz_api.ts normName(), what
+# prof_course_grade_bins is keyed by).
+#
+# Refresh is incremental:
+#   section source changed (PAIR generation + COUNT/MAX(rowid))  -> full rebuild
+#   instructor_identity rows changed since last refresh          -> re-join only those instructors
+#   rmp_professors stats changed                                 -> update only those rmp_tid rows
+#
+#   python3 viz_sections_mat.py             (DB_FILE)
+import re, time
+
+import db
+
+DB = db.db_file()
+MAT = "viz_sections_with_rmp_mat"
+
+# ---- helpers ---------------------------------------------------------------
+def columns(cur, table):
+    cur.execute(f"PRAGMA table_info({table})")
+    return {r[1] for r in cur.fetchall()}
+
+_NON_ALPHA = re.compile(r"[^a-z\s]")
+_SPACES = re.compile(r"\s+")
+
+def norm_name(s):
+    # same steps as normName() in viz_api.ts
+    s = _SPACES.sub(" ", (s or "").lower()).strip()
+    return _SPACES.sub(" ", _NON_ALPHA.sub("", s))
+
+# ---- schema ----------------------------------------------------------------
+def ensure_schema(cur):
+    cur.execute(f"""
+        CREATE TABLE IF NOT EXISTS {MAT}(
+            campus TEXT, subject TEXT, course TEXT, section TEXT, year INTEGER, session TEXT,
+            title TEXT, instructor TEXT, enrolled INTEGER, avg REAL,
+            instructor_key  TEXT,
+            instructor_norm TEXT,
+            rmp_tid TEXT,
+            avg_rating REAL, avg_difficulty REAL, num_ratings INTEGER, would_take_again_pct REAL
+        )""")
+    # /sections?tid, /sections_by_prof, /professor_overview (rows, per-course rollup, avg histogram)
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_vswr_tid ON {MAT}(rmp_tid, subject, course, year, avg, enrolled)")
+    # /sections?subject&course
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_vswr_course ON {MAT}(subject, course, year DESC, session DESC, section)")
+    cur.execute(f"CREATE INDEX IF NOT EXISTS idx_vswr_key ON {MAT}(instructor_key)")
+    db.ensure_state(cur, "viz_mat", legacy_table="viz_mat_state")
+    # what the rows were joined against last time, to find what moved
+    cur.execute("CREATE TABLE IF NOT EXISTS viz_mat_identity(name TEXT PRIMARY KEY, rmp_tid TEXT)")
+    cur.execute("""CREATE TABLE IF NOT EXISTS viz_mat_rmp(
+                       legacy_id TEXT PRIMARY KEY, avg_rating REAL, avg_difficulty REAL,
+                       num_ratings INTEGER, would_take_again_pct REAL)""")
+
+def rmp_select(cur):
+    # rmp stats keyed by legacy_id; the would-take-again column has two spellings in the wild
+    cols = columns(cur, "rmp_professors")
+    if not cols:
+        return "SELECT NULL AS legacy_id, NULL AS avg_rating, NULL AS avg_difficulty, NULL AS num_ratings, NULL AS would_take_again_pct WHERE 0"
+    wta = ("would_take_again_pct" if "would_take_again_pct" in cols
+           else "would_take_again_percent" if "would_take_again_percent" in cols else "NULL")
+    return (f"SELECT CAST(legacy_id AS TEXT) AS legacy_id, avg_rating, avg_difficulty, num_ratings, "
+            f"{wta} AS would_take_again_pct FROM rmp_professors WHERE legacy_id IS NOT NULL")
+
+def identity_select(cur):
+    if not db.table_exists(cur, "instructor_identity"):
+        return "SELECT NULL AS name, NULL AS rmp_tid WHERE 0"
+    return "SELECT name, CAST(rmp_legacy_id AS TEXT) AS rmp_tid FROM instructor_identity WHERE rmp_legacy_id IS NOT NULL"
+
+# ---- refresh ---------------------------------------------------------------
+def insert_rows(con, source, where="", params=()):
+    # join sections to identity + rmp snapshots (temp.cur_identity / temp.cur_rmp) and append
+    con.create_function("viz_norm", 1, norm_name, deterministic=True)
+    cur = con.execute(f"""
+        INSERT INTO {MAT}(campus, subject, course, section, year, session, title, instructor, enrolled, avg,
+                          instructor_key, instructor_norm, rmp_tid,
+                          avg_rating, avg_difficulty, num_ratings, would_take_again_pct)
+        SELECT s.campus, s.subject, s.course, s.section, s.year, s.session, s.title, s.instructor, s.enrolled, s.avg,
+               TRIM(s.instructor), viz_norm(s.instructor), m.rmp_tid,
+               rp.avg_rating, rp.avg_difficulty, rp.num_ratings, rp.would_take_again_pct
+        FROM {source} s
+        LEFT JOIN temp.cur_identity m ON m.name = TRIM(s.instructor)
+        LEFT JOIN temp.cur_rmp rp ON rp.legacy_id = m.rmp_tid
+        {where}""", params)
+    return cur.rowcount
+
+def refresh(con):
+    cur = con.cursor()
+    ensure_schema(cur)
+    source = "viz_sections" if db.table_exists(cur, "viz_sections") else "grades_prof_course"
+    if not db.table_exists(cur, source):
+        print(f"[viz_mat] no {source}; nothing to materialize")
+        return
+
+    # current identity + rmp, keyed so the joins and diffs below are index lookups
+    cur.execute("DROP TABLE IF EXISTS temp.cur_identity")
+    cur.execute("CREATE TEMP TABLE cur_identity(name TEXT PRIMARY KEY, rmp_tid TEXT)")
+    cur.execute(f"INSERT OR IGNORE INTO temp.cur_identity {identity_select(cur)}")
+    cur.execute("DROP TABLE IF EXISTS temp.cur_rmp")
+    cur.execute("""CREATE TEMP TABLE cur_rmp(legacy_id TEXT PRIMARY KEY, avg_rating REAL, avg_difficulty REAL,
+                                            num_ratings INTEGER, would_take_again_pct REAL)""")
+    cur.execute(f"INSERT OR IGNORE INTO temp.cur_rmp {rmp_select(cur)}")
+
+    # section rows all come from the PAIR load, so its generation covers a same-size reload of either source
+    src_fp = f"{source}:{db.table_fingerprint(cur, source, gen_of='grades_prof_course')}"
+    if src_fp != db.get_state(cur, "viz_mat", "source_fingerprint"):
+        cur.execute(f"DELETE FROM {MAT}")
+        n = insert_rows(con, source)
+        print(f"[viz_mat] {source} changed; rebuilt {n} rows")
+    else:
+        # instructors whose match appeared, vanished or moved
+        cur.execute("DROP TABLE IF EXISTS temp.moved_names")
+        cur.execute("""
+            CREATE TEMP TABLE moved_names AS
+            SELECT name FROM (SELECT name, rmp_tid FROM temp.cur_identity EXCEPT SELECT name, rmp_tid FROM viz_mat_identity)
+            UNION
+            SELECT name FROM (SELECT name, rmp_tid FROM viz_mat_identity EXCEPT SELECT name, rmp_tid FROM temp.cur_identity)""")
+        cur.execute("SELECT COUNT(*) FROM temp.moved_names")
+        moved = cur.fetchone()[0]
+        if moved:
+            cur.execute(f"DELETE FROM {MAT} WHERE instructor_key IN (SELECT name FROM temp.moved_names)")
+            n = insert_rows(con, source, "WHERE TRIM(s.instructor) IN (SELECT name FROM temp.moved_names)")
+            print(f"[viz_mat] {moved} instructors re-matched; {n} rows rewritten")
+
+        # rmp stats that changed for a tid we already carry
+        cur.execute("DROP TABLE IF EXISTS temp.moved_tids")
+        cur.execute("""
+            CREATE TEMP TABLE moved_tids AS
+            SELECT legacy_id FROM (SELECT * FROM temp.cur_rmp EXCEPT SELECT * FROM viz_mat_rmp)
+            UNION
+            SELECT legacy_id FROM (SELECT * FROM viz_mat_rmp EXCEPT SELECT * FROM temp.cur_rmp)""")
+        cur.execute(f"""
+            UPDATE {MAT} SET avg_rating = rp.avg_rating, avg_difficulty = rp.avg_difficulty,
+                             num_ratings = rp.num_ratings, would_take_again_pct = rp.would_take_again_pct
+            FROM (SELECT t.legacy_id, r.avg_rating, r.avg_difficulty, r.num_ratings, r.would_take_again_pct
+                  FROM temp.moved_tids t LEFT JOIN temp.cur_rmp r ON r.legacy_id = t.legacy_id) rp
+            WHERE {MAT}.rmp_tid = rp.legacy_id""")
+        print(f"[viz_mat] rmp stats: {cur.rowcount} rows updated")
+        if not moved and not cur.rowcount:
+            print("[viz_mat] up to date")
+
+    cur.execute("DELETE FROM viz_mat_identity")
+    cur.execute("INSERT INTO viz_mat_identity SELECT name, rmp_tid FROM temp.cur_identity")
+    cur.execute("DELETE FROM viz_mat_rmp")
+    cur.execute("INSERT INTO viz_mat_rmp SELECT * FROM temp.cur_rmp")
+    db.set_state(cur, "viz_mat", "source_fingerprint", src_fp)
+    con.commit()
+    cur.execute(f"ANALYZE {MAT}")
+
+def main():
+    print(f"[db] {DB}")
+    con = db.connect(DB, "bulk")
+    try:
+        t0 = time.perf_counter()
+        refresh(con)
+        print(f"[viz_mat] done in {time.perf_counter() - t0:.2f}s")
+    finally:
+        con.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+// server/src/graph_snapshot.ts
+// Reader for the course graph snapshot written by scripts/graph_snapshot.py (layout documented there).
+// Node has no mmap in core, so the file is read once into memory and used through typed-array views;
+// loading is a single read plus string decoding, with no SQL.
+import fs from "fs";
+
+export type EdgeRow = { source_id: string; target_id: string; kind: string; group_id: string | null };
+
+export type GraphSnapshot = {
+    generation: number;
+    ids: string[];
+    courseIds: string[];
+    edgesInto(target: string): EdgeRow[];
+    edgesFrom(source: string): EdgeRow[];
+};
+
+const MAGIC = "PRQG";
+const FORMAT = 1;
+const HEADER_SIZE = 132;
+const NO_GROUP = 0xffffffff;
+const SECTIONS = [
+    "str_offs", "str_data", "flags",
+    "in_offs", "in_src", "in_kind", "in_group",
+    "out_offs", "out_dst", "out_kind", "out_group",
+] as const;
+
+const LITTLE_ENDIAN = new Uint8Array(new Uint32Array([1]).buffer)[0] === 1;
+
+export function loadGraphSnapshot(file: string): GraphSnapshot | null {
+    let buf: Buffer;
+    try {
+        buf = fs.readFileSync(file);
+    } catch {
+        return null;
+    }
+    if (!LITTLE_ENDIAN || buf.length < HEADER_SIZE || buf.toString("latin1", 0, 4) !== MAGIC) return null;
+
+    // own ArrayBuffer so the u32 views are aligned whatever Buffer pooling did
+    const ab = new ArrayBuffer(buf.length);
+    new Uint8Array(ab).set(buf);
+    const dv = new DataView(ab);
+    if (dv.getUint32(4, true) !== FORMAT || dv.getUint32(8, true) !== HEADER_SIZE) return null;
+
+    const generation = Number(dv.getBigUint64(12, true));
+    const nNodes = dv.getUint32(20, true);
+    const nEdges = dv.getUint32(24, true);
+    const nStrings = dv.getUint32(28, true);
+    const nKinds = dv.getUint32(32, true);
+    const off: Record<string, number> = {};
+    SECTIONS.forEach((name, i) => (off[name] = Number(dv.getBigUint64(36 + 8 * i, true))));
+
+    const u32 = (name: string, n: number) => new Uint32Array(ab, off[name], n);
+    const u8 = (name: string, n: number) => new Uint8Array(ab, off[name], n);
+
+    const strOffs = u32("str_offs", nStrings + 1);
+    const data = u8("str_data", strOffs[nStrings]);
+    const dec = new TextDecoder();
+    const strings: string[] = new Array(nStrings);
+    for (let i = 0; i < nStrings; i++) strings[i] = dec.decode(data.subarray(strOffs[i], strOffs[i + 1]));
+
+    const ids = strings.slice(0, nNodes);
+    const kinds = strings.slice(nNodes, nNodes + nKinds);
+    const index = new Map<string, number>();
+    ids.forEach((id, i) => index.set(id, i));
+    const flags = u8("flags", nNodes);
+    const courseIds = ids.filter((_, i) => flags[i] & 1);
+
+    const inOffs = u32("in_offs", nNodes + 1), inSrc = u32("in_src", nEdges);
+    const inKind = u8("in_kind", nEdges), inGroup = u32("in_group", nEdges);
+    const outOffs = u32("out_offs", nNodes + 1), outDst = u32("out_dst", nEdges);
+    const outKind = u8("out_kind", nEdges), outGroup = u32("out_group", nEdges);
+
+    return {
+        generation,
+        ids,
+        courseIds,
+        edgesInto(target) {
+            const i = index.get(target);
+            if (i === undefined) return [];
+            const out: EdgeRow[] = [];
+            for (let j = inOffs[i]; j < inOffs[i + 1]; j++) {
+                const g = inGroup[j];
+                out.push({ source_id: ids[inSrc[j]], target_id: target, kind: kinds[inKind[j]], group_id: g === NO_GROUP ? null : strings[g] });
+            }
+            return out;
+        },
+        edgesFrom(source) {
+            const i = index.get(source);
+            if (i === undefined) return [];
+            const out: EdgeRow[] = [];
+            for (let j = outOffs[i]; j < outOffs[i + 1]; j++) {
+                const g = outGroup[j];
+                out.push({ source_id: source, target_id: ids[outDst[j]], kind: kinds[outKind[j]], group_id: g === NO_GROUP ? null : strings[g] });
+            }
+            return out;
+        },
+    };
+}
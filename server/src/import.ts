@@ -2,6 +2,7 @@ import fs from "fs";
 import path from "path";
 import Database from "better-sqlite3";
 import { parse } from "csv-parse/sync";
+import { packRefs, PRUNE_GROUPS_SQL, type PackedGroup } from "./req_groups.js";
 
 type Row = {
     course_id: string;
@@ -13,12 +14,14 @@ type Row = {
 
 type Tree =
     | { type: "course"; id: string }
-    | { op: "AND" | "OR" | "MIN"; min?: number; meta?: { kind?: "CO_REQ" | "COREQ" | string }; children: Tree[] }
-    | { constraint: "YEAR_STANDING" | "GPA_MIN" | "PERCENT_MIN" | "CREDITS_AT_LEAST"; year_min?: number; value?: number; credits_min?: number; subject?: string | null; level_min?: number | null; courses?: string[] };
+    | { op: "AND" | "OR" | "MIN"; min?: number; gid?: string; meta?: { kind?: "CO_REQ" | "COREQ" | string }; children: Tree[] }
+    | { constraint: "YEAR_STANDING" | "GPA_MIN" | "PERCENT_MIN" | "CREDITS_AT_LEAST"; year_min?: number; value?: number; credits_min?: number; subject?: string | null; level_min?: number | null; courses?: string[]; course_text?: string };
 
 type EdgeKind = "REQ" | "CO_REQ" | "CREDIT" | "EXCLUSION";
 
 const DB_FILE = path.resolve(process.env.DB_FILE || "prereqs.db");
+// same default as server.ts; the snapshot mirrors the edges rewritten below
+const GRAPH_SNAPSHOT = path.resolve(process.env.GRAPH_SNAPSHOT || "graph.snapshot");
 const CSV_FILE = path.resolve(process.env.CSV_FILE || path.join(process.env.HOME || "", "Downloads/extracted_prereqs.csv"));
 
 const db = new Database(DB_FILE);
@@ -26,6 +29,10 @@ db.pragma("foreign_keys = ON");
 db.pragma("journal_mode = wal");
 
 const schemaPath = path.resolve("src/schema.sql");
+// requirement_groups used to hold only op/min/kind; it is fully derived from the import, so an old
+// copy is dropped and rebuilt with group bodies below
+const groupCols = db.prepare("PRAGMA table_info(requirement_groups)").all() as Array<{ name: string }>;
+if (groupCols.length && !groupCols.some((c) => c.name === "tree_json")) db.exec("DROP TABLE requirement_groups");
 db.exec(fs.readFileSync(schemaPath, "utf-8"));
 
 const rows: Row[] = parse(fs.readFileSync(CSV_FILE, "utf-8"), { columns: true, skip_empty_lines: true });
@@ -38,12 +45,21 @@ for (const r of rows) {
 
 const insCourse = db.prepare(`INSERT OR REPLACE INTO courses(id,title,credits,prereq_text,tree_json) VALUES(@id,NULL,@credits,@text,@tree)`);
 const insEdge = db.prepare(`INSERT OR IGNORE INTO edges(source_id,target_id,kind,group_id) VALUES(?,?,?,?)`);
+const insGroup = db.prepare(`INSERT OR REPLACE INTO requirement_groups(id,op,min,kind,tree_json) VALUES(?,?,?,?,?)`);
+const pruneGroups = db.prepare(PRUNE_GROUPS_SQL);
+const delReqEdges = db.prepare(`DELETE FROM edges WHERE target_id = ? AND kind IN ('REQ','CO_REQ')`);
+const delConstraints = db.prepare(`DELETE FROM constraints WHERE course_id = ?`);
 const insConstraint = db.prepare(`INSERT INTO constraints(course_id,type,year_min,value,credits_min,subject,level_min,courses_json) VALUES(@course_id,@type,@year_min,@value,@credits_min,@subject,@level_min,@courses_json)`);
+const bumpGeneration = db.prepare(`INSERT INTO table_generation(name,generation,updated_at) VALUES(?,1,?)
+                                   ON CONFLICT(name) DO UPDATE SET generation = generation + 1, updated_at = excluded.updated_at`);
 
 function tryJSON<T = any>(s: unknown): T | null { if (s == null) return null; try { return JSON.parse(String(s)) as T; } catch { return null; } }
 
 let groupCounter = 0;
 const newGroupId = () => `g${groupCounter++}`;
+// canonical trees carry a structural "gid" per group (extractor_v2 canonicalize()); shared
+// subtrees then share one group_id, and packRefs() stores each body once (see req_groups.ts)
+const sharedGroups = new Map<string, PackedGroup>();
 
 function emitEdge(seen: Set<string>, source: string, target: string, kind: EdgeKind, groupId?: string | null) {
     if (!validIds.has(source) || !validIds.has(target)) return;
@@ -64,21 +80,27 @@ function toEdges(n: Tree, target: string, mode: EdgeKind, seen: Set<string>, par
     if ("constraint" in n) return;
     if ("op" in n) {
         const isGroup = n.op === "OR" || n.op === "MIN" || (n.op === "AND" && n.min && n.min > 0);
-        const groupId = isGroup ? newGroupId() : parentGroup ?? null;
+        const groupId = isGroup ? n.gid || newGroupId() : parentGroup ?? null;
         for (const c of n.children || []) toEdges(c, target, nextMode, seen, groupId);
     }
 }
 
 db.transaction(() => {
-    const seen = new Set<string>();
     for (const r of rows) {
         const id = (r.course_id || "").trim();
         if (!id) continue;
+        // per row: a repeated course_id deletes the earlier row's edges and must be able to re-add them
+        const seen = new Set<string>();
 
         const tree = tryJSON<Tree>(r.requirements_tree_json);
         const logicGroups = tryJSON<any[]>(r.logic_groups_json) || [];
 
-        insCourse.run({ id, credits: r.credit_value ?? null, text: r.prereq_text_raw ?? null, tree: tree ? JSON.stringify(tree) : null });
+        insCourse.run({ id, credits: r.credit_value ?? null, text: r.prereq_text_raw ?? null,
+                        tree: tree ? JSON.stringify(packRefs(tree, sharedGroups)) : null });
+        // courses are replaced on re-import; their constraints and requirement edges have no key to
+        // replace on (edges are unique per group_id, and a changed tree changes its group ids)
+        delConstraints.run(id);
+        delReqEdges.run(id);
 
         if (tree) {
             (function collect(n: Tree) {
@@ -91,7 +113,7 @@ db.transaction(() => {
                         credits_min: n.credits_min ?? null,
                         subject: n.subject ?? null,
                         level_min: n.level_min ?? null,
-                        courses_json: n.courses ? JSON.stringify(n.courses) : null,
+                        courses_json: n.courses ? JSON.stringify(n.courses) : n.course_text ? JSON.stringify([n.course_text]) : null,
                     });
                 } else if ("op" in n) {
                     n.children.forEach(collect);
@@ -112,7 +134,21 @@ db.transaction(() => {
             }
         }
     }
+    for (const [gid, g] of sharedGroups) insGroup.run(gid, g.op, g.min, g.kind, JSON.stringify(g.body));
+    // groups no course tree refers to any more
+    const pruned = pruneGroups.run().changes;
+    if (pruned) console.log(`[import] pruned ${pruned} unreferenced requirement_groups`);
+    // every tree may have changed: plan_cost rows computed from the previous import stop matching
+    bumpGeneration.run("courses", Date.now() / 1000);
 })();
 
-const counts = db.prepare(`SELECT (SELECT COUNT(*) FROM courses) AS courses,(SELECT COUNT(*) FROM edges) AS edges,(SELECT COUNT(*) FROM constraints) AS constraints`).get();
+// a restart or /api/reindex would otherwise load edges from before this import; the pipeline's
+// graph_snapshot stage sees its output missing and writes a fresh one
+try {
+    fs.rmSync(GRAPH_SNAPSHOT, { force: true });
+} catch (e: any) {
+    console.warn(`[import] could not remove stale ${GRAPH_SNAPSHOT}: ${e?.message || e}`);
+}
+
+const counts = db.prepare(`SELECT (SELECT COUNT(*) FROM courses) AS courses,(SELECT COUNT(*) FROM edges) AS edges,(SELECT COUNT(*) FROM constraints) AS constraints,(SELECT COUNT(*) FROM requirement_groups) AS groups`).get();
 console.log("OK", counts);
@@ -1,4 +1,5 @@
 import Database from "better-sqlite3";
+import { expandRefs } from "./req_groups.js";
 
 type Campus = "V" | "O" | "AUTO" | "" | null | undefined;
 
@@ -7,6 +8,7 @@ type Tree =
     | {
     op: "AND" | "OR" | "MIN";
     min?: number;
+    gid?: string; // set on shared groups (expandRefs)
     meta?: { kind?: string };
     children: Tree[];
 }
@@ -22,6 +24,7 @@ type Tree =
     subject?: string | null;
     level_min?: number | null;
     courses?: string[];
+    course_text?: string; // a non-catalogue course, e.g. "MATH 12"
 };
 
 type Edge = { src: string; tgt: string; coreq: boolean };
@@ -68,6 +71,59 @@ export function resolveActualId(
     return e.ids["V"] || e.ids["O"] || Object.values(e.ids)[0] || null;
 }
 
+// course_avg_cache is filled offline by scripts/course_avg_cache.py; one indexed lookup per base.
+// PLANNER_LIVE_AVG=1 falls back to ubcgrades.com for bases the cache does not cover.
+const LIVE_AVG = process.env.PLANNER_LIVE_AVG === "1";
+const avgStmts = new WeakMap<Database.Database, Database.Statement | null>();
+
+function localAvgForBase(db: Database.Database, base: string, campus: Campus): number | null | undefined {
+    let stmt = avgStmts.get(db);
+    if (stmt === undefined) {
+        try {
+            stmt = db.prepare("SELECT avg FROM course_avg_cache WHERE base = ? AND campus = ?");
+        } catch {
+            stmt = null; // table not built yet (picked up on restart)
+        }
+        avgStmts.set(db, stmt);
+    }
+    if (!stmt) return undefined;
+    const c = campus && campus !== "AUTO" ? campus : "V";
+    const row = stmt.get(base, c) as { avg: number | null } | undefined;
+    if (!row) return undefined;
+    return row.avg != null && isFinite(row.avg) ? row.avg : null;
+}
+
+// plan_cost is filled offline by scripts/plan_costs.py: pickSet() results with nothing completed.
+// Rows from before the last import (courses_gen behind table_generation) are ignored.
+const planStmts = new WeakMap<Database.Database, Database.Statement | null>();
+
+function precomputedPick(db: Database.Database, actual: string, campus: Campus, mode: Mode): SelectRes | null {
+    if (LIVE_AVG || mode === "all") return null; // table weights come from course_avg_cache only
+    let stmt = planStmts.get(db);
+    if (stmt === undefined) {
+        try {
+            stmt = db.prepare(`SELECT cost, set_json, edges_json FROM plan_cost
+                               WHERE course_id = ? AND campus = ? AND mode = ?
+                                 AND courses_gen = COALESCE((SELECT generation FROM table_generation WHERE name = 'courses'), 0)`);
+        } catch {
+            stmt = null; // table not built yet (picked up on restart)
+        }
+        planStmts.set(db, stmt);
+    }
+    if (!stmt) return null;
+    const c = campus && campus !== "AUTO" ? campus : "V";
+    const row = stmt.get(actual, c, mode) as { cost: number; set_json: string; edges_json: string } | undefined;
+    if (!row) return null;
+    const set = safeJSON<string[]>(row.set_json);
+    const edges = safeJSON<Array<[string, string, boolean]>>(row.edges_json);
+    if (!set || !edges) return null;
+    return {
+        set: new Set(set),
+        edges: edges.map(([src, tgt, coreq]) => ({ src, tgt, coreq: !!coreq })),
+        cost: row.cost,
+    };
+}
+
 async function fetchAvgForBase(
     base: string,
     campus: Campus
@@ -107,14 +163,20 @@ type Cache = {
     treeByActual: Map<string, Tree | null>;
     avgByBase: Map<string, number | null>;
     costMemo: Map<string, { easiest: number; hardest: number; fewest: number }>;
+    // shared group -> its pick, solved once per mode / co-req context; edges into the group's owner
+    // are stored against GROUP_OWNER and re-pointed at whichever course asks
+    groupMemo: Map<string, SelectRes>;
 };
 
+const GROUP_OWNER = "\u0000owner";
+
 function getTree(db: Database.Database, id: string, cache: Cache): Tree | null {
     if (cache.treeByActual.has(id)) return cache.treeByActual.get(id) || null;
     const row = db.prepare("SELECT tree_json FROM courses WHERE id = ?").get(id) as
         | { tree_json: string | null }
         | undefined;
-    const t = row?.tree_json ? safeJSON<Tree>(row.tree_json) : null;
+    const raw = row?.tree_json ? safeJSON<Tree>(row.tree_json) : null;
+    const t = raw ? (expandRefs(db, raw) as Tree | null) : null;
     cache.treeByActual.set(id, t);
     return t;
 }
@@ -127,9 +189,10 @@ function safeJSON<T>(s: string): T | null {
     }
 }
 
-async function getAvg(base: string, campus: Campus, cache: Cache) {
+async function getAvg(db: Database.Database, base: string, campus: Campus, cache: Cache) {
     if (cache.avgByBase.has(base)) return cache.avgByBase.get(base) ?? null;
-    const v = await fetchAvgForBase(base, campus);
+    const local = localAvgForBase(db, base, campus);
+    const v = local !== undefined ? local : LIVE_AVG ? await fetchAvgForBase(base, campus) : null;
     cache.avgByBase.set(base, v);
     return v;
 }
@@ -145,6 +208,8 @@ type SelectRes = {
     set: Set<string>;
     edges: Edge[];
     cost: number;
+    // satisfied by standing / GPA / credit constraints alone: free, but no courses to plan
+    constraintOnly?: boolean;
 };
 
 function isCoreqMeta(n?: { kind?: string }) {
@@ -165,6 +230,7 @@ export async function planCourse(
         treeByActual: new Map(),
         avgByBase: new Map(),
         costMemo: new Map(),
+        groupMemo: new Map(),
     };
 
     const completed = new Set(completedBases.map((x) => x.toUpperCase().trim()));
@@ -172,7 +238,9 @@ export async function planCourse(
     const rootActual = resolveActualId(baseIndex, base, campus);
     if (!rootActual) throw new Error("course not found");
 
-    const picked = await pickSet(db, baseIndex, rootActual, campus, completed, cache, mode);
+    const picked =
+        (completed.size === 0 && precomputedPick(db, rootActual, campus, mode)) ||
+        (await pickSet(db, baseIndex, rootActual, campus, completed, cache, mode));
     const mainPlan = schedule(picked.set, picked.edges, rootActual);
 
     if (mode !== "all") {
@@ -203,6 +271,8 @@ async function pickSet(
     mode: Mode
 ): Promise<SelectRes> {
     const seenStack = new Set<string>();
+    // bumped whenever the stack cuts a cycle short: such a result depends on the path taken to it
+    let cycleCuts = 0;
     async function solveNode(
         node: Tree | null,
         parent: string,
@@ -218,7 +288,10 @@ async function pickSet(
             const edges: Edge[] = [];
             if (node.id !== parent) edges.push({ src: node.id, tgt: parent, coreq: parentCoreq });
 
-            if (seenStack.has(node.id)) return { set, edges, cost: await weightOf(node.id) };
+            if (seenStack.has(node.id)) {
+                cycleCuts++;
+                return { set, edges, cost: await weightOf(node.id) };
+            }
             seenStack.add(node.id);
             const subTree = getTree(db, node.id, cache);
             const subRes = await solveNode(subTree, node.id, false);
@@ -230,47 +303,75 @@ async function pickSet(
             return { set, edges, cost };
         }
 
-        if ("constraint" in node) return { set: new Set(), edges: [], cost: 0 };
-
-        if ("op" in node) {
-            const coreqHere = parentCoreq || isCoreqMeta(node.meta);
-            if (node.op === "AND") {
-                const agg: SelectRes = { set: new Set(), edges: [], cost: 0 };
-                for (const ch of node.children || []) {
-                    const r = await solveNode(ch, parent, coreqHere);
-                    r.set.forEach((c) => agg.set.add(c));
-                    agg.edges.push(...r.edges);
-                    agg.cost += r.cost;
-                }
-                return agg;
+        if ("constraint" in node) return { set: new Set(), edges: [], cost: 0, constraintOnly: true };
+
+        if ("op" in node && node.gid) {
+            const key = `${mode}|${parentCoreq ? 1 : 0}|${node.gid}`;
+            let r = cache.groupMemo.get(key);
+            // a course of the group on the stack now would be cut short here, unlike when it was cached
+            if (r && Array.from(r.set).some((c) => seenStack.has(c))) r = undefined;
+            if (!r) {
+                const cuts = cycleCuts;
+                r = await solveOp(node, GROUP_OWNER, parentCoreq);
+                if (cycleCuts === cuts) cache.groupMemo.set(key, r);
             }
-            const want = node.op === "OR" ? 1 : Math.max(1, node.min || 1);
-            const opts: SelectRes[] = [];
-            for (const ch of node.children || []) {
-                opts.push(await solveNode(ch, parent, coreqHere));
-            }
-            const scored = await Promise.all(
-                opts.map(async (r) => ({
-                    r,
-                    s:
-                        mode === "fewest"
-                            ? r.set.size
-                            : mode === "hardest"
-                                ? r.cost * -1
-                                : r.cost,
-                }))
-            );
-            scored.sort((a, b) => a.s - b.s);
-            const pick = scored.slice(0, want).map((x) => x.r);
+            return {
+                set: new Set(r.set),
+                edges: r.edges
+                    .filter((e) => !(e.tgt === GROUP_OWNER && e.src === parent))
+                    .map((e) => (e.tgt === GROUP_OWNER ? { ...e, tgt: parent } : e)),
+                cost: r.cost,
+                constraintOnly: r.constraintOnly,
+            };
+        }
+
+        if ("op" in node) return solveOp(node, parent, parentCoreq);
+        return { set: new Set(), edges: [], cost: 0 };
+    }
+
+    async function solveOp(node: Extract<Tree, { op: string }>, parent: string, parentCoreq: boolean): Promise<SelectRes> {
+        const coreqHere = parentCoreq || isCoreqMeta(node.meta);
+        if (node.op === "AND") {
             const agg: SelectRes = { set: new Set(), edges: [], cost: 0 };
-            for (const pr of pick) {
-                pr.set.forEach((c) => agg.set.add(c));
-                agg.edges.push(...pr.edges);
-                agg.cost += pr.cost;
+            let allConstraintOnly = true;
+            for (const ch of node.children || []) {
+                const r = await solveNode(ch, parent, coreqHere);
+                if (!r.constraintOnly) allConstraintOnly = false;
+                r.set.forEach((c) => agg.set.add(c));
+                agg.edges.push(...r.edges);
+                agg.cost += r.cost;
             }
+            agg.constraintOnly = (node.children || []).length > 0 && allConstraintOnly;
             return agg;
         }
-        return { set: new Set(), edges: [], cost: 0 };
+        const want = node.op === "OR" ? 1 : Math.max(1, node.min || 1);
+        const opts: SelectRes[] = [];
+        for (const ch of node.children || []) {
+            opts.push(await solveNode(ch, parent, coreqHere));
+        }
+        const scored = await Promise.all(
+            opts.map(async (r) => ({
+                r,
+                s:
+                    mode === "fewest"
+                        ? r.set.size
+                        : mode === "hardest"
+                            ? r.cost * -1
+                            : r.cost,
+            }))
+        );
+        // a constraint-only option costs 0, so it would always win; take it only once the
+        // course options have run out
+        scored.sort((a, b) => Number(!!a.r.constraintOnly) - Number(!!b.r.constraintOnly) || a.s - b.s);
+        const pick = scored.slice(0, want).map((x) => x.r);
+        const agg: SelectRes = { set: new Set(), edges: [], cost: 0 };
+        for (const pr of pick) {
+            pr.set.forEach((c) => agg.set.add(c));
+            agg.edges.push(...pr.edges);
+            agg.cost += pr.cost;
+        }
+        agg.constraintOnly = pick.length > 0 && pick.every((pr) => !!pr.constraintOnly);
+        return agg;
     }
 
     async function weightOf(actual: string) {
@@ -282,7 +383,7 @@ async function pickSet(
             if (mode === "hardest") return m.hardest;
             return m.easiest;
         }
-        const avg = await getAvg(base, campus, cache);
+        const avg = await getAvg(db, base, campus, cache);
         const w = weightFromAvg(avg);
         const memo = { easiest: w, hardest: w, fewest: 1 };
         cache.costMemo.set(key, memo);
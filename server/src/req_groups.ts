@@ -0,0 +1,74 @@
+// server/src/req_groups.ts
+// Shared requirement groups. extractor_v2 gives every one-of / min-of group a structural "gid"
+// (a hash of its canonical form); import.ts and /api/reparse store each distinct group body once in
+// requirement_groups and write {"ref": gid} in its place, in courses.tree_json and in the bodies of
+// enclosing groups. Readers call expandRefs() to get the inline tree back; the result carries the
+// gid on each expanded group so the planner can memoize per group.
+import Database from "better-sqlite3";
+
+export type GroupBody = { op: string; min?: number; meta?: { kind?: string }; children: any[] };
+export type PackedGroup = { op: string; min: number | null; kind: string | null; body: GroupBody };
+
+// gid -> body. A gid is a hash of the body's structure, so an entry can never go stale.
+const bodies = new Map<string, GroupBody | null>();
+const bodyStmts = new WeakMap<Database.Database, Database.Statement | null>();
+
+function bodyOf(db: Database.Database, gid: string): GroupBody | null {
+    if (bodies.has(gid)) return bodies.get(gid)!;
+    let stmt = bodyStmts.get(db);
+    if (stmt === undefined) {
+        try {
+            stmt = db.prepare("SELECT tree_json FROM requirement_groups WHERE id = ?").pluck();
+        } catch {
+            stmt = null; // database from before shared groups: trees are inline
+        }
+        bodyStmts.set(db, stmt);
+    }
+    const raw = stmt ? (stmt.get(gid) as string | undefined) : undefined;
+    let body: GroupBody | null = null;
+    try {
+        body = raw ? (JSON.parse(raw) as GroupBody) : null;
+    } catch {
+        body = null;
+    }
+    if (body) bodies.set(gid, body);
+    return body;
+}
+
+export function expandRefs(db: Database.Database, node: any): any {
+    if (!node || typeof node !== "object") return node;
+    if (typeof node.ref === "string") {
+        const body = bodyOf(db, node.ref);
+        // a dangling ref reads as "no requirement" rather than failing the whole tree
+        return body ? { ...expandRefs(db, body), gid: node.ref } : null;
+    }
+    if (!Array.isArray(node.children)) return node;
+    const children = node.children.map((c: any) => expandRefs(db, c)).filter((c: any) => c != null);
+    return { ...node, children };
+}
+
+// inverse of expandRefs(): every node with a gid becomes {"ref": gid}, and its body (children packed
+// the same way) lands in `out` once per gid
+export function packRefs(node: any, out: Map<string, PackedGroup>): any {
+    if (!node || typeof node !== "object" || !Array.isArray(node.children)) return node;
+    const { gid, ...rest } = node;
+    const packed = { ...rest, children: node.children.map((c: any) => packRefs(c, out)) };
+    if (typeof gid !== "string" || !gid) return packed;
+    if (!out.has(gid)) out.set(gid, { op: packed.op, min: packed.min ?? null, kind: packed.meta?.kind ?? null, body: packed });
+    return { ref: gid };
+}
+
+// groups no course tree reaches, directly or through another group (json_tree: SQLite JSON1)
+export const PRUNE_GROUPS_SQL = `
+    WITH RECURSIVE live(id) AS (
+        SELECT j.value FROM courses c, json_tree(c.tree_json) j
+        WHERE c.tree_json IS NOT NULL AND j.key = 'ref'
+        UNION
+        SELECT j.value FROM live JOIN requirement_groups g ON g.id = live.id, json_tree(g.tree_json) j
+        WHERE j.key = 'ref')
+    DELETE FROM requirement_groups WHERE id NOT IN (SELECT id FROM live)`;
+
+export function hasGroupBodies(db: Database.Database) {
+    const cols = db.prepare("PRAGMA table_info(requirement_groups)").all() as Array<{ name: string }>;
+    return cols.some((c) => c.name === "tree_json");
+}
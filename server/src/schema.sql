@@ -21,6 +21,23 @@ CREATE TABLE IF NOT EXISTS constraints (
                                            FOREIGN KEY(course_id) REFERENCES courses(id)
     );
 
+CREATE INDEX IF NOT EXISTS idx_constraints_course ON constraints(course_id);
+-- "which courses need third-year standing / a 2.5 GPA / 54 credits"
+CREATE INDEX IF NOT EXISTS idx_constraints_type ON constraints(type, year_min, value, credits_min);
+
+-- one-of / min-of clusters, one row per distinct structure: id is the extractor's "gid" hash, so
+-- the same "one of MATH 100, MATH 180" in many courses is one row and one edges.group_id. tree_json
+-- is the group's body; courses.tree_json (and enclosing group bodies) hold {"ref": id} in its place,
+-- expanded on read by req_groups.ts / plan_costs.py. Rows no tree refers to any more are pruned at
+-- the end of each import / reparse.
+CREATE TABLE IF NOT EXISTS requirement_groups (
+                                     id TEXT PRIMARY KEY,
+                                     op TEXT NOT NULL,                 -- OR | MIN | AND (with min)
+                                     min INTEGER,
+                                     kind TEXT,                        -- meta.kind, e.g. CO_REQ
+                                     tree_json TEXT NOT NULL
+);
+
 -- prerequisite/co-requisite edges: prereq -> target
 CREATE TABLE IF NOT EXISTS edges (
                                      id INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -34,6 +51,16 @@ CREATE TABLE IF NOT EXISTS edges (
 
 CREATE INDEX IF NOT EXISTS idx_edges_target ON edges(target_id);
 CREATE INDEX IF NOT EXISTS idx_edges_source ON edges(source_id);
+-- group pruning follows tree refs now, not edges.group_id
+DROP INDEX IF EXISTS idx_edges_group;
 -- optional: avoid duplicate edges if you re-import
 CREATE UNIQUE INDEX IF NOT EXISTS idx_edges_unique
     ON edges(source_id, target_id, kind, IFNULL(group_id, ''));
+
+-- per-table reload counter (scripts/db.py bump_generation): import.ts bumps "courses" on every run,
+-- and rows precomputed from courses (plan_cost.courses_gen) are only trusted while it matches
+CREATE TABLE IF NOT EXISTS table_generation (
+                                     name TEXT PRIMARY KEY,
+                                     generation INTEGER NOT NULL,
+                                     updated_at REAL
+);
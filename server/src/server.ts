@@ -2,17 +2,25 @@
 import express from "express";
 import cors from "cors";
 import Database from "better-sqlite3";
+import fs from "fs";
+import { createHash } from "crypto";
 import path from "path";
 
 // Routers
 import createVizRouter from "./viz_api.js";
 import createSchedRouter from "./sched_api.js"; // <-- NEW
+import { loadGraphSnapshot, type EdgeRow } from "./graph_snapshot.js";
+import { expandRefs, hasGroupBodies, packRefs, PRUNE_GROUPS_SQL, type PackedGroup } from "./req_groups.js";
 
 
 const DB_FILE = process.env.DB_FILE || path.resolve("prereqs.db");
 const db = new Database(DB_FILE, { readonly: false });
 db.pragma("foreign_keys = ON");
 
+// scripts/graph_snapshot.py writes this at the end of an ETL run; without it everything reads SQLite
+const GRAPH_SNAPSHOT = process.env.GRAPH_SNAPSHOT || path.resolve("graph.snapshot");
+let GRAPH = loadGraphSnapshot(GRAPH_SNAPSHOT);
+
 const app = express();
 app.use(cors());
 app.use(express.json({ limit: "1mb" }));
@@ -31,12 +39,14 @@ type BaseIndex = Map<string, { ids: Record<string, string> }>;
 
 function buildBaseIndex(): BaseIndex {
     const out: BaseIndex = new Map();
-    const rows = db.prepare("SELECT id FROM courses").all() as Array<{ id: string }>;
-    for (const r of rows) {
-        const { base, campus } = splitId(r.id);
+    const ids = GRAPH
+        ? GRAPH.courseIds
+        : (db.prepare("SELECT id FROM courses").all() as Array<{ id: string }>).map((r) => r.id);
+    for (const id of ids) {
+        const { base, campus } = splitId(id);
         const entry = out.get(base) || { ids: {} as Record<string, string> };
         const key = campus ?? "V";
-        entry.ids[key] = r.id;
+        entry.ids[key] = id;
         out.set(base, entry);
     }
     return out;
@@ -45,10 +55,134 @@ function buildBaseIndex(): BaseIndex {
 let BASE_INDEX = buildBaseIndex();
 
 app.post("/api/reindex", (_req, res) => {
+    GRAPH = loadGraphSnapshot(GRAPH_SNAPSHOT);
     BASE_INDEX = buildBaseIndex();
-    res.json({ ok: true, bases: BASE_INDEX.size });
+    res.json({ ok: true, bases: BASE_INDEX.size, snapshot: GRAPH?.generation ?? null });
 });
 
+// Single-course edits: reparse the new prereq text through the extractor daemon
+// (extractors/extract/extractor_v2.py --serve) and upsert the course, its REQ/CO_REQ edges and
+// constraints the way import.ts does, instead of rerunning extract + import for the whole catalogue.
+// The route writes to the DB without auth, so it is off unless ALLOW_REPARSE=1 and only answers
+// loopback clients even then.
+const EXTRACTOR_URL = process.env.EXTRACTOR_URL || "http://127.0.0.1:8765";
+const ALLOW_REPARSE = process.env.ALLOW_REPARSE === "1";
+const LOOPBACK = new Set(["127.0.0.1", "::1", "::ffff:127.0.0.1"]);
+
+type ReparseTree = {
+    type?: string; id?: string; op?: string; min?: number; gid?: string; constraint?: string;
+    meta?: { kind?: string }; children?: ReparseTree[]; [k: string]: any;
+};
+
+app.post("/api/reparse/:id", async (req, res) => {
+    if (!ALLOW_REPARSE) return res.status(404).json({ error: "reparse disabled (set ALLOW_REPARSE=1)" });
+    if (!LOOPBACK.has(req.socket.remoteAddress || "")) return res.status(403).json({ error: "reparse is loopback-only" });
+    const id = String(req.params.id || "").toUpperCase().trim();
+    const text = req.body?.text;
+    if (!ID_RE.test(id) || typeof text !== "string") return res.status(400).json({ error: "course id and text required" });
+
+    let row: any, ms: number | null = null;
+    try {
+        const r = await fetch(`${EXTRACTOR_URL}/extract`, {
+            method: "POST",
+            headers: { "Content-Type": "application/json" },
+            body: JSON.stringify({ texts: [{ course_id: id, text, credits: req.body?.credits ?? null }] }),
+        });
+        const out = (await r.json()) as any;
+        row = out.rows?.[0];
+        ms = out.ms ?? null;
+    } catch (e: any) {
+        return res.status(502).json({ error: `extractor unavailable at ${EXTRACTOR_URL}: ${e?.message || e}` });
+    }
+    if (!row) return res.status(422).json({ error: "extractor returned no row" });
+
+    const tree: ReparseTree | null = row.requirements_tree_json ? JSON.parse(row.requirements_tree_json) : null;
+    const known = db.prepare("SELECT 1 FROM courses WHERE id = ?");
+    const insEdge = db.prepare("INSERT OR IGNORE INTO edges(source_id,target_id,kind,group_id) VALUES(?,?,?,?)");
+    const insConstraint = db.prepare(`INSERT INTO constraints(course_id,type,year_min,value,credits_min,subject,level_min,courses_json)
+                                      VALUES(?,?,?,?,?,?,?,?)`);
+    // requirement_groups with group bodies comes with the schema of a newer import; older databases
+    // keep the tree inline
+    const hasGroups = hasGroupBodies(db);
+    const hasPlanCost = !!db.prepare("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'plan_cost'").get();
+    const hasSearch = !!db.prepare("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'course_search_state'").get();
+    let groups = 0, edges = 0;
+    const packed = new Map<string, PackedGroup>();
+    const stored = tree && hasGroups ? packRefs(tree, packed) : tree;
+
+    // same walk as toEdges() in import.ts; a group without a structural gid gets an id prefixed
+    // with the course so it cannot collide with the g<n> ids of a full import
+    const walk = (n: ReparseTree, mode: string, group: string | null) => {
+        const k = (n.meta?.kind || "").toUpperCase();
+        const next = k === "CO_REQ" || k === "COREQ" ? "CO_REQ" : mode;
+        if (n.type === "course") {
+            if (n.id && n.id !== id && known.get(n.id)) edges += insEdge.run(n.id, id, next, group).changes;
+            return;
+        }
+        if (n.constraint) {
+            insConstraint.run(id, n.constraint, n.year_min ?? null, n.value ?? null, n.credits_min ?? null,
+                n.subject ?? null, n.level_min ?? null, n.courses ? JSON.stringify(n.courses) : n.course_text ? JSON.stringify([n.course_text]) : null);
+            return;
+        }
+        if (n.op) {
+            const isGroup = n.op === "OR" || n.op === "MIN" || (n.op === "AND" && (n.min ?? 0) > 0);
+            const g = isGroup ? n.gid || `${id}#g${groups++}` : group;
+            for (const c of n.children || []) walk(c, next, g);
+        }
+    };
+
+    const isNew = !known.get(id);
+    db.transaction(() => {
+        db.prepare(`INSERT INTO courses(id,title,credits,prereq_text,tree_json) VALUES(?,NULL,?,?,?)
+                    ON CONFLICT(id) DO UPDATE SET credits = COALESCE(excluded.credits, credits),
+                                                  prereq_text = excluded.prereq_text, tree_json = excluded.tree_json`)
+            .run(id, row.credit_value || null, row.prereq_text_raw ?? null, stored ? JSON.stringify(stored) : null);
+        db.prepare("DELETE FROM edges WHERE target_id = ? AND kind IN ('REQ','CO_REQ')").run(id);
+        db.prepare("DELETE FROM constraints WHERE course_id = ?").run(id);
+        if (tree) walk(tree, "REQ", null);
+        if (hasGroups) {
+            // bodies are keyed by their structural hash, so an existing row is already right
+            const insGroup = db.prepare("INSERT OR IGNORE INTO requirement_groups(id,op,min,kind,tree_json) VALUES(?,?,?,?,?)");
+            for (const [gid, g] of packed) insGroup.run(gid, g.op, g.min, g.kind, JSON.stringify(g.body));
+            db.prepare(PRUNE_GROUPS_SQL).run();
+        }
+        if (hasSearch) refreshSearchRow(id);
+        // precomputed pick sets of this course and of every course that (transitively) requires it
+        if (hasPlanCost) {
+            db.prepare(`WITH RECURSIVE dep(id) AS (
+                            SELECT ?
+                            UNION
+                            SELECT e.target_id FROM edges e JOIN dep ON e.source_id = dep.id
+                            WHERE e.kind IN ('REQ','CO_REQ'))
+                        DELETE FROM plan_cost WHERE course_id IN (SELECT id FROM dep)`).run(id);
+        }
+    })();
+
+    // the snapshot no longer matches the edges table: drop it so neither /api/reindex nor a restart
+    // loads it again (the pipeline's graph_snapshot stage sees its output missing and rebuilds it);
+    // read SQLite until then
+    GRAPH = null;
+    try {
+        fs.rmSync(GRAPH_SNAPSHOT, { force: true });
+    } catch (e: any) {
+        console.warn(`[reparse] could not remove stale ${GRAPH_SNAPSHOT}: ${e?.message || e}`);
+    }
+    if (isNew) BASE_INDEX = buildBaseIndex();
+    res.json({ ok: true, id, edges, tree, extractor_ms: ms });
+});
+
+function edgesInto(target: string): EdgeRow[] {
+    if (GRAPH) return GRAPH.edgesInto(target);
+    return db.prepare("SELECT source_id,target_id,kind,group_id FROM edges WHERE target_id = ?").all(target) as EdgeRow[];
+}
+
+function creditEdgesFrom(source: string): EdgeRow[] {
+    if (GRAPH) return GRAPH.edgesFrom(source).filter((e) => e.kind === "EXCLUSION" || e.kind === "CREDIT");
+    return db
+        .prepare("SELECT source_id,target_id,kind FROM edges WHERE source_id = ? AND kind IN ('EXCLUSION','CREDIT')")
+        .all(source) as EdgeRow[];
+}
+
 function resolveActualId(base: string, campus?: string | null): string | null {
     const e = BASE_INDEX.get(base.toUpperCase());
     if (!e) return null;
@@ -78,8 +212,63 @@ function getAveragesForIds(ids: string[]) {
     return { byId, byBase };
 }
 
+// course_search is the FTS5 trigram index kept by scripts/course_search_index.py (codes + title)
+let searchStmt: Database.Statement | null | undefined;
+
+function searchBasesFts(q: string): string[] | null {
+    if (q.length < 3) return null; // trigrams need three characters
+    if (searchStmt === undefined) {
+        try {
+            searchStmt = db.prepare(
+                `SELECT DISTINCT base FROM course_search WHERE course_search MATCH ?
+                 ORDER BY instr(codes, ?) = 0, base LIMIT 50`
+            );
+        } catch {
+            searchStmt = null; // index not built yet (picked up on restart)
+        }
+    }
+    if (!searchStmt) return null;
+    try {
+        const rows = searchStmt.all(`{codes title} : "${q.replace(/"/g, '""')}"`, q) as Array<{ base: string }>;
+        return rows.map((r) => r.base);
+    } catch {
+        return null;
+    }
+}
+
+// code_variants() in course_search_index.py: the base plus every spelling a query may use
+function codeVariants(id: string): [string, string] {
+    const cid = id.trim().toUpperCase();
+    const m = cid.match(ID_RE);
+    if (!m) return [cid, cid];
+    const forms = [cid, cid.replace(/ /g, "")];
+    if (m[2]) forms.push(`${m[1]} ${m[3]}`, `${m[1]}${m[3]}`);
+    return [`${m[1]} ${m[3]}`, Array.from(new Set(forms)).join(" ")];
+}
+
+// one course's course_search row, written the way course_search_index.py refresh() writes it (same
+// content hash), so an edit is searchable at once and the next refresh finds the row up to date
+function refreshSearchRow(id: string) {
+    const c = db.prepare("SELECT title, prereq_text FROM courses WHERE id = ?").get(id) as
+        { title: string | null; prereq_text: string | null } | undefined;
+    if (!c) return;
+    const row = [id, ...codeVariants(id), c.title ?? "", c.prereq_text ?? ""];
+    const hash = createHash("sha1").update(row.join("\x1f"), "utf8").digest("hex");
+    const old = db.prepare("SELECT fts_rowid, hash FROM course_search_state WHERE course_id = ?").get(id) as
+        { fts_rowid: number; hash: string } | undefined;
+    if (old?.hash === hash) return;
+    if (old) db.prepare("DELETE FROM course_search WHERE rowid = ?").run(old.fts_rowid);
+    const rowid = db.prepare("INSERT INTO course_search(course_id, base, codes, title, prereq_text) VALUES(?,?,?,?,?)")
+        .run(...row).lastInsertRowid;
+    db.prepare(`INSERT INTO course_search_state(course_id, fts_rowid, hash) VALUES(?,?,?)
+                ON CONFLICT(course_id) DO UPDATE SET fts_rowid = excluded.fts_rowid, hash = excluded.hash`)
+        .run(id, rowid, hash);
+}
+
 app.get("/api/search_base", (req, res) => {
     const q = String(req.query.q || "").trim().toUpperCase();
+    const hits = searchBasesFts(q);
+    if (hits) return res.json(hits);
     const bases = Array.from(BASE_INDEX.keys()).sort();
     const filtered = q ? bases.filter((b) => b.includes(q)) : bases.slice(0, 200);
     res.json(filtered.slice(0, 50));
@@ -94,8 +283,16 @@ app.get("/api/course_base/:base", (req, res) => {
     const campus = (req.query.campus as string | undefined) ?? undefined;
     const id = resolveActualId(base, campus);
     if (!id) return res.status(404).json({ error: "not found" });
-    const course = db.prepare("SELECT * FROM courses WHERE id = ?").get(id);
+    const course = db.prepare("SELECT * FROM courses WHERE id = ?").get(id) as { tree_json?: string | null } | undefined;
     const constraints = db.prepare("SELECT * FROM constraints WHERE course_id = ?").all(id);
+    // the UI walks the inline tree; shared groups are stored as {"ref": gid}
+    if (course?.tree_json) {
+        try {
+            course.tree_json = JSON.stringify(expandRefs(db, JSON.parse(course.tree_json)));
+        } catch {
+            // unparsable text goes out as stored; the UI already guards its JSON.parse
+        }
+    }
     res.json({ ...(course ?? {}), constraints, base_id: base, actual_id: id });
 });
 
@@ -112,9 +309,7 @@ app.get("/api/graph_base/:base", (req, res) => {
     const visited = new Set<string>();
 
     function addOutboundCreditEdges(from: string) {
-        const outEdges = db
-            .prepare("SELECT source_id,target_id,kind FROM edges WHERE source_id = ? AND kind IN ('EXCLUSION','CREDIT')")
-            .all(from) as any[];
+        const outEdges = creditEdgesFrom(from);
         for (const e of outEdges) {
             nodes.add(e.source_id);
             nodes.add(e.target_id);
@@ -125,9 +320,7 @@ app.get("/api/graph_base/:base", (req, res) => {
     addOutboundCreditEdges(rootId);
 
     function addEdgesFor(target: string) {
-        const rowEdges = db
-            .prepare("SELECT source_id,target_id,kind,group_id FROM edges WHERE target_id = ?")
-            .all(target) as any[];
+        const rowEdges = edgesInto(target);
         for (const e of rowEdges) {
             if (!includeCoreq && e.kind === "CO_REQ") continue;
             nodes.add(e.source_id);
@@ -169,9 +362,7 @@ app.get("/api/graph/:id", (req, res) => {
     const links: Array<{ source: string; target: string; kind: string; group_id?: string | null }> = [];
 
     function addOutboundCreditEdges(from: string) {
-        const outEdges = db
-            .prepare("SELECT source_id,target_id,kind FROM edges WHERE source_id = ? AND kind IN ('EXCLUSION','CREDIT')")
-            .all(from) as any[];
+        const outEdges = creditEdgesFrom(from);
         for (const e of outEdges) {
             nodes.add(e.source_id);
             nodes.add(e.target_id);
@@ -184,9 +375,7 @@ app.get("/api/graph/:id", (req, res) => {
     const visited = new Set<string>();
 
     function addEdgesFor(target: string) {
-        const rowEdges = db
-            .prepare("SELECT source_id,target_id,kind,group_id FROM edges WHERE target_id = ?")
-            .all(target) as any[];
+        const rowEdges = edgesInto(target);
         for (const e of rowEdges) {
             if (!includeCoreq && e.kind === "CO_REQ") continue;
             nodes.add(e.source_id);
@@ -285,7 +474,7 @@ app.post("/api/plan_base/:base", (req, res) => {
     if (!id) return res.status(404).json({ error: "not found" });
 
     const row = db.prepare("SELECT tree_json FROM courses WHERE id = ?").get(id) as any;
-    const tree: Tree | null = row?.tree_json ? JSON.parse(row.tree_json) : null;
+    const tree: Tree | null = row?.tree_json ? expandRefs(db, JSON.parse(row.tree_json)) : null;
     const g = extractGroups(tree);
 
     const term1 = new Set<string>();
@@ -28,6 +28,63 @@ export default function createVizRouter(db: Database.Database) {
                 ? "would_take_again_percent"
                 : null;
 
+    // Sections joined to RMP: the indexed table built by scripts/viz_sections_mat.py when present,
+    // else the view it materializes
+    const SWR = tableHasColumn("viz_sections_with_rmp_mat", "rmp_tid")
+        ? "viz_sections_with_rmp_mat"
+        : "viz_sections_with_rmp";
+
+    // Per-professor / per-course rollups from scripts/stats_rollups.py: one primary-key row each,
+    // histograms stored as little-endian u32 arrays
+    const profRollupStmt = tableHasColumn("prof_stats_rollup", "rmp_tid")
+        ? db.prepare(`SELECT * FROM prof_stats_rollup WHERE rmp_tid = ?`)
+        : null;
+    const courseRollupStmt = tableHasColumn("course_stats_rollup", "subject")
+        ? db.prepare(`SELECT * FROM course_stats_rollup WHERE subject = ? AND course = ?`)
+        : null;
+
+    function u32Array(blob: Buffer | null | undefined): number[] {
+        const out: number[] = [];
+        if (!blob) return out;
+        for (let i = 0; i + 4 <= blob.length; i += 4) out.push(blob.readUInt32LE(i));
+        return out;
+    }
+
+    function decodeRollup(row: any) {
+        if (!row) return null;
+        const { avg_hist, rating_hist, years_json, courses_json, src_hash, ...rest } = row;
+        const years = (JSON.parse(years_json || "[]") as Array<[number, number | null, number, number]>)
+            .map(([year, wmean, n_sections, enrolled]) => ({ year, wmean, n_sections, enrolled }));
+        return {
+            ...rest,
+            years,
+            ...(courses_json !== undefined ? { perCourse: JSON.parse(courses_json) } : {}),
+            avg_hist: u32Array(avg_hist),
+            rating_hist: u32Array(rating_hist),
+        };
+    }
+
+    // Same bins as the section-average fallback in /professor_overview, from the rollup's 1-point bins
+    // (lo and step are whole numbers, so every value lands where it would from the raw averages)
+    function rebinUnitHist(unit: number[], min: number | null, max: number | null, binsReq: number) {
+        if (min == null || max == null) return [];
+        const lo = Math.max(0, Math.floor(min));
+        const hi = Math.min(100, Math.ceil(max));
+        const step = Math.max(1, Math.ceil((hi - lo) / binsReq));
+        const edges: number[] = [];
+        for (let x = lo; x < hi; x += step) edges.push(x);
+        edges.push(hi);
+        const counts = Array(edges.length - 1).fill(0);
+        unit.forEach((n, b) => {
+            if (!n) return;
+            let idx = Math.floor((b - lo) / step);
+            if (idx < 0) idx = 0;
+            if (idx >= counts.length) idx = counts.length - 1;
+            counts[idx] += n;
+        });
+        return counts.map((c, i) => ({ x0: edges[i], x1: edges[i + 1], c }));
+    }
+
     /* =========================================================
        /api/viz/professors  (search)
        ========================================================= */
@@ -103,7 +160,7 @@ export default function createVizRouter(db: Database.Database) {
                 .prepare(
                     `SELECT campus, subject, course, section, year, session, title, instructor,
                          enrolled, avg, rmp_tid, avg_rating, avg_difficulty, would_take_again_pct, num_ratings
-                     FROM viz_sections_with_rmp
+                     FROM ${SWR}
                      WHERE rmp_tid = ?
                      ORDER BY year DESC, session DESC, subject ASC, course ASC, section ASC`
                 )
@@ -119,7 +176,7 @@ export default function createVizRouter(db: Database.Database) {
             .prepare(
                 `SELECT campus, subject, course, section, year, session, title, instructor,
                      enrolled, avg, rmp_tid, avg_rating, avg_difficulty, would_take_again_pct, num_ratings
-                 FROM viz_sections_with_rmp
+                 FROM ${SWR}
                  WHERE subject = ? AND course = ?
                  ORDER BY year DESC, session DESC, section ASC`
             )
@@ -172,7 +229,7 @@ export default function createVizRouter(db: Database.Database) {
             .prepare(
                 `SELECT campus, year, session, subject, course, section, instructor, enrolled, avg,
                      rmp_tid, avg_rating, avg_difficulty, would_take_again_pct, num_ratings
-                 FROM viz_sections_with_rmp
+                 FROM ${SWR}
                  WHERE rmp_tid = ?
                  ORDER BY year DESC, session DESC, subject ASC, course ASC, section ASC`
             )
@@ -181,6 +238,23 @@ export default function createVizRouter(db: Database.Database) {
         res.json(rows);
     });
 
+    /* =========================================================
+       /api/viz/prof_rollup, /api/viz/course_rollup
+       - precomputed stats (scripts/stats_rollups.py), null when not built
+       ========================================================= */
+    r.get("/prof_rollup", (req: Request, res: Response) => {
+        const tid = String(req.query.tid || "").trim();
+        if (!tid) return res.status(400).json({ error: "tid required" });
+        res.json(decodeRollup(profRollupStmt?.get(tid)));
+    });
+
+    r.get("/course_rollup", (req: Request, res: Response) => {
+        const subject = String(req.query.subject || "").toUpperCase().trim();
+        const course = String(req.query.course || "").toUpperCase().trim();
+        if (!subject || !course) return res.status(400).json({ error: "subject & course required" });
+        res.json(decodeRollup(courseRollupStmt?.get(subject, course)));
+    });
+
     /* =========================================================
        /api/viz/professor_overview  (NEW)
        - details (RMP)
@@ -214,7 +288,7 @@ export default function createVizRouter(db: Database.Database) {
                 `
         SELECT campus, year, session, subject, course, section, title, instructor,
                enrolled, avg, rmp_tid, avg_rating, avg_difficulty, would_take_again_pct, num_ratings
-        FROM viz_sections_with_rmp
+        FROM ${SWR}
         WHERE rmp_tid = ?
         ORDER BY year DESC, session DESC, subject ASC, course ASC, section ASC
       `
@@ -237,28 +311,33 @@ export default function createVizRouter(db: Database.Database) {
             num_ratings: number | null;
         }>;
 
-        // per-course rollup
-        const perCourse = db
-            .prepare(
-                `
+        // per-course rollup (precomputed when stats_rollups.py has run)
+        const rollup = profRollupStmt?.get(tid) as
+            | { courses_json: string; avg_hist: Buffer; min_avg: number | null; max_avg: number | null }
+            | undefined;
+        const perCourse = rollup
+            ? JSON.parse(rollup.courses_json)
+            : db
+                .prepare(
+                    `
         SELECT subject || ' ' || course AS course_code,
                COUNT(*) AS n_sections,
                AVG(avg) AS avg_of_avg,
                SUM(enrolled) AS total_enrolled,
                MIN(year) AS first_year,
                MAX(year) AS last_year
-        FROM viz_sections_with_rmp
+        FROM ${SWR}
         WHERE rmp_tid = ?
         GROUP BY subject, course
         ORDER BY course_code ASC
       `
-            )
-            .all(tid);
+                )
+                .all(tid);
 
         // CSV bins: align by normalized instructor name AND restrict to the same section keys as the tid
         let bins: Array<{ bin_label: string; count: number }> = [];
         const anyName = db
-            .prepare(`SELECT DISTINCT instructor FROM viz_sections_with_rmp WHERE rmp_tid = ? LIMIT 1`)
+            .prepare(`SELECT DISTINCT instructor FROM ${SWR} WHERE rmp_tid = ? LIMIT 1`)
             .get(tid) as { instructor?: string } | undefined;
 
         if (anyName?.instructor && tableHasColumn("prof_course_grade_bins", "bin_label")) {
@@ -271,7 +350,7 @@ export default function createVizRouter(db: Database.Database) {
           WHERE instructor_norm = ?
             AND (campus,subject,course,section,year,session) IN (
               SELECT campus,subject,course,section,year,session
-              FROM viz_sections_with_rmp WHERE rmp_tid = ?
+              FROM ${SWR} WHERE rmp_tid = ?
             )
           GROUP BY bin_label
         `
@@ -281,9 +360,11 @@ export default function createVizRouter(db: Database.Database) {
 
         // Fallback histogram from section averages, if no bins present
         let hist: Array<{ x0: number; x1: number; c: number }> = [];
-        if (!bins?.length) {
+        if (!bins?.length && rollup) {
+            hist = rebinUnitHist(u32Array(rollup.avg_hist), rollup.min_avg, rollup.max_avg, binsReq);
+        } else if (!bins?.length) {
             const avgsRows = db
-                .prepare(`SELECT avg FROM viz_sections_with_rmp WHERE rmp_tid = ? AND avg IS NOT NULL`)
+                .prepare(`SELECT avg FROM ${SWR} WHERE rmp_tid = ? AND avg IS NOT NULL`)
                 .all(tid) as Array<{ avg: number }>;
             if (avgsRows.length) {
                 const vals = avgsRows.map((v) => Number(v.avg)).filter((v) => Number.isFinite(v));
@@ -105,6 +105,34 @@ export async function fetchSectionsByProf(tid: string) {
 // Legacy alias used in some files
 export { fetchSectionsByProf as fetchSectionsByProfessor };
 
+/** Precomputed stats (server: scripts/stats_rollups.py); null until the rollup job has run */
+export type VizRollup = {
+    n_sections: number;
+    total_enrolled: number | null;
+    wmean: number | null;
+    mean: number | null;
+    p10: number | null;
+    p25: number | null;
+    p50: number | null;
+    p75: number | null;
+    p90: number | null;
+    min_avg: number | null;
+    max_avg: number | null;
+    first_year: number | null;
+    last_year: number | null;
+    trend: number | null;
+    years: Array<{ year: number; wmean: number | null; n_sections: number; enrolled: number }>;
+    avg_hist: number[];     // 101 one-point bins over 0..100
+    rating_hist: number[];  // 20 bins over 1..5, as RatingDistribution
+    refreshed_at: string;
+};
+
+export function fetchProfRollup(tid: string) {
+    return getJSON<(VizRollup & { rmp_tid: string; n_courses: number; perCourse: PXProfPerCourse[] }) | null>(
+        `/api/viz/prof_rollup?tid=${encodeURIComponent(tid)}`
+    );
+}
+
 /** ===================== Course/Sections (PRV) ===================== **/
 
 export function fetchVizSections(subject: string, course: string) {
@@ -113,6 +141,12 @@ export function fetchVizSections(subject: string, course: string) {
     );
 }
 
+export function fetchCourseRollup(subject: string, course: string) {
+    return getJSON<(VizRollup & { subject: string; course: string; n_instructors: number }) | null>(
+        `/api/viz/course_rollup?subject=${encodeURIComponent(subject)}&course=${encodeURIComponent(course)}`
+    );
+}
+
 export function fetchCourseStats(courseCode: string) {
     const normalized = courseCode.replace(/\s+/g, "").toUpperCase();
     return getJSON<VizCourseStat[]>(
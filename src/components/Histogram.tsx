@@ -6,6 +6,8 @@ type Props = {
     binWidth?: number;               // bucket size, default 1 (% point)
     showAvg?: boolean;
     avgPosition?: "top-right" | "bottom-right";
+    counts?: number[];               // precomputed one-point bins over 0..100 (course_stats_rollup.avg_hist); replaces values
+    mean?: number | null;            // with counts: the exact mean (the bins only know whole points)
 };
 
 function lerp(a: number, b: number, t: number) { return a + (b - a) * t; }
@@ -22,18 +24,29 @@ export default function Histogram({
                                       binWidth = 1,
                                       showAvg = true,
                                       avgPosition = "bottom-right",
+                                      counts,
+                                      mean,
                                   }: Props) {
-    const clean = values.filter(v => Number.isFinite(v));
-    const lo = clean.length ? Math.floor(Math.min(...clean)) : 0;
-    const hi = clean.length ? Math.ceil(Math.max(...clean)) : 100;
+    const pre = counts?.length === 101 ? counts : null;
+    const clean = pre ? [] : values.filter(v => Number.isFinite(v));
+    const filled = pre ? pre.flatMap((c, i) => (c > 0 ? [i] : [])) : [];
+    const lo = pre ? (filled.length ? filled[0] : 0) : clean.length ? Math.floor(Math.min(...clean)) : 0;
+    const hi = pre ? (filled.length ? filled[filled.length - 1] : 100) : clean.length ? Math.ceil(Math.max(...clean)) : 100;
     const bins: { x: number; count: number }[] = [];
     for (let x = lo; x <= hi; x += binWidth) bins.push({ x, count: 0 });
+    if (pre) {
+        pre.forEach((c, i) => {
+            if (c > 0) bins[Math.min(bins.length - 1, Math.floor((i - lo) / binWidth))].count += c;
+        });
+    }
     for (const v of clean) {
         const idx = Math.min(bins.length - 1, Math.max(0, Math.floor((v - lo) / binWidth)));
         bins[idx].count++;
     }
     const max = Math.max(1, ...bins.map(b => b.count));
-    const avg = clean.length ? clean.reduce((a, b) => a + b, 0) / clean.length : NaN;
+    const avg = pre
+        ? mean ?? NaN
+        : clean.length ? clean.reduce((a, b) => a + b, 0) / clean.length : NaN;
 
     // color scale: map bin center (lo..hi) → 0..1
     const tOf = (x: number) => (x - lo) / Math.max(1e-6, hi - lo);
@@ -1,5 +1,5 @@
 import { useEffect, useMemo, useState } from "react";
-import { fetchProfessor, fetchSectionsByProf as fetchSectionsByProfessor } from "../api/viz";
+import { fetchProfessor, fetchProfRollup, fetchSectionsByProf as fetchSectionsByProfessor, type PXProfPerCourse } from "../api/viz";
 import RatingDistribution from "./RatingDistribution";
 
 type Props = {
@@ -11,6 +11,8 @@ type Props = {
 export default function ProfessorPanel({ tid, anchor, onClose }: Props) {
     const [prof, setProf] = useState<VizProfessor | null>(null);
     const [rows, setRows] = useState<VizSection[]>([]);
+    const [perCourse, setPerCourse] = useState<PXProfPerCourse[] | null>(null);
+    const [ratingCounts, setRatingCounts] = useState<number[] | undefined>(undefined);
     const [loading, setLoading] = useState(true);
     const [err, setErr] = useState<string | null>(null);
 
@@ -19,11 +21,14 @@ export default function ProfessorPanel({ tid, anchor, onClose }: Props) {
         (async () => {
             setLoading(true); setErr(null);
             try {
-                const [p, s] = await Promise.all([
+                // the rollup already carries per-course totals and the rating bins; sections are only
+                // fetched when stats_rollups.py has not run
+                const [p, roll] = await Promise.all([
                     fetchProfessor(tid),
-                    fetchSectionsByProfessor(tid),
+                    fetchProfRollup(tid).catch(() => null),
                 ]);
-                if (!stop) { setProf(p); setRows(s); }
+                const s = roll ? [] : await fetchSectionsByProfessor(tid);
+                if (!stop) { setProf(p); setRows(s); setPerCourse(roll ? roll.perCourse : null); setRatingCounts(roll?.rating_hist); }
             } catch (e: any) {
                 if (!stop) setErr(e?.message || String(e));
             } finally {
@@ -75,6 +80,30 @@ export default function ProfessorPanel({ tid, anchor, onClose }: Props) {
                     <div style={{ borderTop: "1px solid #1e242e", paddingTop: 10 }}>
                         <div style={{ fontWeight: 600, marginBottom: 8 }}>Courses Taught (matched via tid)</div>
                         <div style={{ maxHeight: 220, overflow: "auto" }}>
+                            {perCourse ? (
+                            <table style={{ width: "100%", borderCollapse: "collapse", fontSize: 12 }}>
+                                <thead>
+                                <tr style={{ color: "#9aa7b1", textAlign: "left" }}>
+                                    <th style={{ padding: 6 }}>Course</th>
+                                    <th style={{ padding: 6 }}>Years</th>
+                                    <th style={{ padding: 6, textAlign: "right" }}>Sects</th>
+                                    <th style={{ padding: 6, textAlign: "right" }}>Enr</th>
+                                    <th style={{ padding: 6, textAlign: "right" }}>Grade Avg</th>
+                                </tr>
+                                </thead>
+                                <tbody>
+                                {perCourse.map((c) => (
+                                    <tr key={c.course_code} style={{ borderTop: "1px solid #1e242e" }}>
+                                        <td style={{ padding: 6 }}>{c.course_code}</td>
+                                        <td style={{ padding: 6 }}>{c.first_year === c.last_year ? c.first_year ?? "—" : `${c.first_year}–${c.last_year}`}</td>
+                                        <td style={{ padding: 6, textAlign: "right" }}>{c.n_sections}</td>
+                                        <td style={{ padding: 6, textAlign: "right" }}>{c.total_enrolled ?? "—"}</td>
+                                        <td style={{ padding: 6, textAlign: "right" }}>{fmt(c.avg_of_avg)}</td>
+                                    </tr>
+                                ))}
+                                </tbody>
+                            </table>
+                            ) : (
                             <table style={{ width: "100%", borderCollapse: "collapse", fontSize: 12 }}>
                                 <thead>
                                 <tr style={{ color: "#9aa7b1", textAlign: "left" }}>
@@ -105,12 +134,13 @@ export default function ProfessorPanel({ tid, anchor, onClose }: Props) {
                                 ))}
                                 </tbody>
                             </table>
+                            )}
                         </div>
                     </div>
 
                     <div style={{ borderTop: "1px solid #1e242e", paddingTop: 10 }}>
                         <div style={{ fontWeight: 600, marginBottom: 6 }}>Rating Distribution (this prof’s sections)</div>
-                        <RatingDistribution values={ratingsForHist} />
+                        <RatingDistribution values={ratingsForHist} counts={ratingCounts} />
                     </div>
                 </div>
             </div>
@@ -1,4 +1,4 @@
-export default function RatingDistribution({ values }: { values: number[] }) {
+function binRatings(values: number[]) {
     const bins = new Array(20).fill(0); // 1..5 in 0.2 steps
     for (const v of values) {
         if (v == null || Number.isNaN(v)) continue;
@@ -6,6 +6,12 @@ export default function RatingDistribution({ values }: { values: number[] }) {
         const idx = Math.min(19, Math.floor((clamped - 1) / 0.2));
         bins[idx]++;
     }
+    return bins;
+}
+
+// counts: precomputed bins (prof_stats_rollup.rating_hist); otherwise binned here from values
+export default function RatingDistribution({ values = [], counts }: { values?: number[]; counts?: number[] }) {
+    const bins = counts?.length === 20 ? counts : binRatings(values);
     const max = Math.max(1, ...bins);
     return (
         <div style={{ display: "grid", gridTemplateColumns: "repeat(20,1fr)", gap: 2, alignItems: "end", height: 90 }}>
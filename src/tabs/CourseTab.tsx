@@ -1,7 +1,7 @@
 import React from "react";
 import { Card, H, Button, tinyFmt } from "../components/ui";
 import Histogram from "../components/Histogram";
-import { fetchCourseStats, fetchVizSections } from "../api/viz";
+import { fetchCourseRollup, fetchCourseStats, fetchVizSections } from "../api/viz";
 import { toBase } from "../types";
 import type { VizCourseStat, VizSection } from "../types";
 
@@ -10,6 +10,7 @@ export default function CourseTab({ courseCode }: { courseCode: string }) {
     const [subject, course] = normalized.split(" ");
     const [rows, setRows] = React.useState<VizSection[]>([]);
     const [stats, setStats] = React.useState<VizCourseStat[]>([]);
+    const [rollup, setRollup] = React.useState<Awaited<ReturnType<typeof fetchCourseRollup>>>(null);
     const [loading, setLoading] = React.useState(true);
     const [err, setErr] = React.useState<string | null>(null);
 
@@ -18,8 +19,12 @@ export default function CourseTab({ courseCode }: { courseCode: string }) {
         (async () => {
             setLoading(true); setErr(null);
             try {
-                const [a, b] = await Promise.all([fetchVizSections(subject, course), fetchCourseStats(normalized)]);
-                if (!stop) { setRows(a); setStats(b); }
+                const [a, b, roll] = await Promise.all([
+                    fetchVizSections(subject, course),
+                    fetchCourseStats(normalized),
+                    fetchCourseRollup(subject, course).catch(() => null),
+                ]);
+                if (!stop) { setRows(a); setStats(b); setRollup(roll); }
             } catch (e:any) {
                 setErr(e?.message || String(e));
             } finally { if (!stop) setLoading(false); }
@@ -27,7 +32,14 @@ export default function CourseTab({ courseCode }: { courseCode: string }) {
         return () => { stop = true; };
     }, [subject, course]);
 
-    const ratings = rows.filter(r => r.section !== "OVERALL").map(r => r.avg ?? NaN).filter(v => !isNaN(v));
+    // one value per section, as course_stats_rollup counts them: PAIR repeats a section per co-instructor
+    const bySection = new Map<string, number>();
+    for (const r of rows) {
+        if ((r.section ?? "").toUpperCase() === "OVERALL" || r.avg == null || isNaN(r.avg)) continue;
+        const k = [r.campus, r.year, r.session, r.section].join("|");
+        bySection.set(k, Math.max(bySection.get(k) ?? -Infinity, r.avg));
+    }
+    const ratings = Array.from(bySection.values());
 
     function exportCSV() {
         const head = ["Year","Sess","Section","Instructor","Enrolled","GradeAvg","RMP_Avg","Diff","WTA%","#Ratings","RMP_Link"];
@@ -125,8 +137,11 @@ export default function CourseTab({ courseCode }: { courseCode: string }) {
                 </Card>
 
                 <Card>
-                    <H>Overall Grade Distribution</H>
-                    <Histogram values={ratings} />
+                    <H right={rollup ? <span style={{ color: "#9aa7b1", fontSize: 12 }}>
+                        {rollup.n_sections} sections • median {tinyFmt(rollup.p50, 1)} • trend {tinyFmt(rollup.trend, 2)}/yr
+                    </span> : undefined}>Overall Grade Distribution</H>
+                    {/* course_stats_rollup bins when stats_rollups.py has run; the fallback dedupes sections the same way */}
+                    <Histogram values={ratings} counts={rollup?.avg_hist} mean={rollup?.mean} />
                     <div style={{ display: "flex", justifyContent: "space-between", color: "#9aa7b1", fontSize: 12, marginTop: 6 }}>
                         <span>0</span><span>25</span><span>50</span><span>75</span><span>100</span>
                     </div>